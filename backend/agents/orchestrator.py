@@ -84,7 +84,8 @@ from typing import Dict, Any
 from .retriever_agent import RetrieverAgent
 from .analyzer_agent import AnalyzerAgent
 from .critic_agent import CriticAgent
-from ..vector_store import MemoryStore
+from ..vector_store import get_memory_store
+from ..embeddings import embed_query
 from ..llm_client import HistoryType
 
 
@@ -101,16 +102,21 @@ class Orchestrator:
         self.retriever = RetrieverAgent(k=5)
         self.analyzer = AnalyzerAgent()
         self.critic = CriticAgent()
-        self.memory_store = MemoryStore()
+        self.memory_store = get_memory_store()
 
     def answer_question(self, question: str, history: HistoryType | None = None) -> Dict[str, Any]:
         history = history or []
 
+        # Embed the question once, for both document and memory search
+        query_embedding = embed_query(question) if question.strip() else None
+
         # 1️⃣ Retrieve from documents
-        retrieval_output = self.retriever.run({"question": question})
+        retrieval_output = self.retriever.run(
+            {"question": question, "query_embedding": query_embedding}
+        )
 
         # 2️⃣ Retrieve from memory
-        mem_results = self.memory_store.search(question, k=5)
+        mem_results = self.memory_store.search(question, k=5, query_embedding=query_embedding)
         has_memory = len(mem_results) > 0
 
         # 3️⃣ Analyzer gets both doc + memory + history
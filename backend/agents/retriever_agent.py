@@ -65,16 +65,18 @@
 #         }
 #-----------------------------------------------------------------
 #last version
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+from config import HYBRID_CANDIDATES
 from .base_agent import BaseAgent
-from ..vector_store import VectorStore
+from ..vector_store import get_document_store
+from ..lexical_index import reciprocal_rank_fusion, tokenize
 
 
 class RetrieverAgent(BaseAgent):
     name = "retriever"
 
     def __init__(self, k: int = 5):
-        self.store = VectorStore()
+        self.store = get_document_store()
         self.k = k
 
     # ------------------------------------------------------------
@@ -111,8 +113,28 @@ class RetrieverAgent(BaseAgent):
 
         return q.strip(" ?.,:")
 
+    # ------------------------------------------------------------
+    # Utility: fuse dense and BM25 rankings
+    # ------------------------------------------------------------
+    def _fuse(
+        self,
+        dense: List[Dict[str, Any]],
+        lexical_hits: List[Tuple[str, float, int]],
+        k: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Reciprocal rank fusion of the dense results and the BM25 hits;
+        chunks found only by BM25 are fetched from the store.
+        """
+        ids = reciprocal_rank_fusion([[r["id"] for r in dense], [h[0] for h in lexical_hits]])[:k]
+        by_id = {r["id"]: r for r in dense}
+        missing = [i for i in ids if i not in by_id]
+        by_id.update({r["id"]: r for r in self.store.get_documents(missing)})
+        return [by_id[i] for i in ids if i in by_id]
+
     # ------------------------------------------------------------
     # Utility: boost chunks that explicitly mention the entity
+    # (only used without a lexical index, see LEXICAL_INDEX)
     # ------------------------------------------------------------
     def _boost_entity_matches(
         self,
@@ -142,9 +164,27 @@ class RetrieverAgent(BaseAgent):
     def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         question = input_data["question"]
         k = input_data.get("k", self.k)
+        lexical = getattr(self.store, "lexical", None)
+
+        # 1️⃣ Extract entity / main subject
+        entity = self._extract_entity(question)
 
-        # 1️⃣ Vector similarity search
-        results = self.store.search(question, k=k)
+        if lexical is not None:
+            candidates = max(k, HYBRID_CANDIDATES)
+
+            # 2️⃣ Dense candidates + BM25 candidates (exact names / keywords
+            # that dense search ranks low), fused by reciprocal rank
+            dense = self.store.search(
+                question, k=candidates, query_embedding=input_data.get("query_embedding")
+            )
+            lexical_hits = lexical.search(entity or question, candidates) if question.strip() else []
+            results = self._fuse(dense, lexical_hits, k)
+        else:
+            # 2️⃣ Vector similarity search, chunks mentioning the entity first
+            results = self.store.search(
+                question, k=k, query_embedding=input_data.get("query_embedding")
+            )
+            results = self._boost_entity_matches(results, entity)
 
         if not results:
             return {
@@ -154,17 +194,19 @@ class RetrieverAgent(BaseAgent):
                 "context_matches_query": False,
             }
 
-        # 2️⃣ Extract entity / main subject
-        entity = self._extract_entity(question)
-
-        # 3️⃣ Boost results that explicitly mention entity
-        results = self._boost_entity_matches(results, entity)
-
-        # 4️⃣ Decide if context is actually relevant
+        # 3️⃣ Decide if context is actually relevant
         # Rule:
         # - If entity exists and appears in any chunk → relevant
         # - If entity is empty (general question) → assume relevant
-        if entity:
+        if entity and lexical is not None:
+            # "Appears": the chunk holds every term of the entity (BM25 hits)
+            terms = set(tokenize(entity))
+            result_ids = {r["id"] for r in results}
+            context_matches_query = not terms or any(
+                chunk_id in result_ids and matched == len(terms)
+                for chunk_id, _, matched in lexical_hits
+            )
+        elif entity:
             context_matches_query = any(
                 entity in r.get("text", "").lower() for r in results
             )
@@ -0,0 +1,465 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+from typing import List, Iterable, Iterator, Tuple, Optional, Callable
+
+from config import (
+    EMBED_MODEL,
+    CHUNKER,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+)
+
+# (text, start, end). Offsets are characters of the extracted text, or
+# bytes of the file for memory-mapped sources (whose text is None).
+Chunk = Tuple[Optional[str], int, int]
+
+WORD_RE = re.compile(r"\S+")
+
+# Sentence boundary: whitespace after ., ! or ? (optionally closed by a
+# quote / bracket), or any line break.
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+|\n\s*")
+
+# A "sentence" without any boundary is cut at whitespace past this size
+MAX_SENTENCE_CHARS = 10_000
+
+
+# ------------------------------------------------------------
+# Word chunker (CHUNK_SIZE words, CHUNK_OVERLAP words overlap)
+# ------------------------------------------------------------
+def iter_word_chunks(pieces: Iterable[str]) -> Iterator[Chunk]:
+    """
+    Streaming word chunker.
+    Produces the same chunk texts as splitting "".join(pieces) into
+    windows of CHUNK_SIZE words, while only holding one chunk worth of
+    words. Words split across two pieces are carried over.
+    """
+    overlap = min(CHUNK_OVERLAP, CHUNK_SIZE - 1)
+    words: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    emitted = 0  # leading words of the window already part of a chunk
+    carry = ""
+    pos = 0  # offset of the end of the text seen so far
+
+    def emit(count: int) -> Chunk:
+        return " ".join(words[:count]), spans[0][0], spans[count - 1][1]
+
+    for piece in pieces:
+        if not piece:
+            continue
+        base = pos - len(carry)
+        text = carry + piece
+        pos += len(piece)
+
+        matches = list(WORD_RE.finditer(text))
+        # Last word may continue in the next piece
+        carry = ""
+        if matches and matches[-1].end() == len(text):
+            carry = matches.pop().group()
+
+        for m in matches:
+            words.append(m.group())
+            spans.append((base + m.start(), base + m.end()))
+
+        while len(words) >= CHUNK_SIZE:
+            yield emit(CHUNK_SIZE)
+            del words[: CHUNK_SIZE - overlap]
+            del spans[: CHUNK_SIZE - overlap]
+            emitted = overlap
+
+    if carry:
+        words.append(carry)
+        spans.append((pos - len(carry), pos))
+        if len(words) >= CHUNK_SIZE:
+            yield emit(CHUNK_SIZE)
+            del words[: CHUNK_SIZE - overlap]
+            del spans[: CHUNK_SIZE - overlap]
+            emitted = overlap
+
+    if len(words) > emitted:
+        yield emit(len(words))
+
+
+# ------------------------------------------------------------
+# Token chunker (sentence-packed up to the embedder's max length)
+# ------------------------------------------------------------
+def _max_seq_length(tokenizer) -> int:
+    """
+    Length EMBED_MODEL truncates its input at: max_seq_length of its
+    sentence-transformers config (256 for all-MiniLM-L6-v2), else the
+    transformer's own position limit.
+    """
+    name = "sentence_bert_config.json"
+    try:
+        if Path(EMBED_MODEL).is_dir():
+            path = Path(EMBED_MODEL) / name
+        else:
+            from huggingface_hub import hf_hub_download
+
+            path = hf_hub_download(EMBED_MODEL, name)
+        with open(path, encoding="utf-8") as f:
+            length = int(json.load(f)["max_seq_length"])
+    except Exception:
+        from transformers import AutoConfig
+
+        length = AutoConfig.from_pretrained(EMBED_MODEL).max_position_embeddings
+    return min(length, tokenizer.model_max_length)
+
+
+@lru_cache(maxsize=1)
+def token_budget() -> Tuple[object, int]:
+    """
+    Returns (tokenizer, max content tokens per chunk) of the embedding
+    model. Anything past its max sequence length is truncated by the
+    model, so a chunk never holds more than that (minus [CLS]/[SEP]).
+    Only the tokenizer and config files are loaded, once per process:
+    parse workers never load the model itself.
+    """
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL)
+    budget = _max_seq_length(tokenizer) - 2
+    if CHUNK_MAX_TOKENS > 0:
+        budget = min(budget, CHUNK_MAX_TOKENS)
+    return tokenizer, budget
+
+
+def _split_sentences(text: str, final: bool) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Splits `text` into sentence spans (whitespace trimmed).
+    Returns (spans, consumed): text[consumed:] is an unfinished sentence
+    to be completed by the next piece (unless final=True).
+    """
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    for m in SENTENCE_BOUNDARY_RE.finditer(text):
+        if m.end() == len(text) and not final:
+            # Boundary at the very end may still grow (e.g. "\n" + "\n")
+            break
+        spans.append((start, m.start()))
+        start = m.end()
+
+    tail = len(text) - start
+    if final or tail > MAX_SENTENCE_CHARS:
+        cut = len(text) if final else (text.rfind(" ", start) + 1 or len(text))
+        if cut <= start:
+            cut = len(text)
+        spans.append((start, cut))
+        start = cut
+
+    trimmed = []
+    for a, b in spans:
+        segment = text[a:b]
+        stripped = segment.strip()
+        if stripped:
+            a += len(segment) - len(segment.lstrip())
+            trimmed.append((a, a + len(stripped)))
+    return trimmed, start
+
+
+# (start, end, n_tokens, text) — text is None for memory-mapped sources
+Sentence = Tuple[int, int, int, Optional[str]]
+
+
+def _pack_sentences(
+    sentences: Iterable[Sentence],
+    max_tokens: int,
+    overlap_tokens: int,
+    split_long: Callable[[Sentence], Iterator[Chunk]],
+) -> Iterator[Chunk]:
+    """
+    Packs sentences into chunks of at most `max_tokens` tokens.
+    Consecutive chunks share up to `overlap_tokens` tokens of whole
+    sentences; sentences longer than a chunk go through `split_long`.
+    Chunk text is joined from the sentences, or None if they carry none.
+    """
+    window: List[Sentence] = []
+    window_tokens = 0
+    fresh = False  # window holds sentences not yet emitted
+
+    def emit() -> Chunk:
+        text = None
+        if window[0][3] is not None:
+            text = " ".join(" ".join(s[3] for s in window).split())
+        return text, window[0][0], window[-1][1]
+
+    for sentence in sentences:
+        n = sentence[2]
+        if n > max_tokens:
+            if fresh:
+                yield emit()
+            window, window_tokens, fresh = [], 0, False
+            yield from split_long(sentence)
+            continue
+
+        if window_tokens + n > max_tokens:
+            if fresh:
+                yield emit()
+            # Keep the trailing sentences that fit in the overlap
+            kept: List[Sentence] = []
+            kept_tokens = 0
+            for previous in reversed(window):
+                if kept_tokens + previous[2] > overlap_tokens:
+                    break
+                kept.insert(0, previous)
+                kept_tokens += previous[2]
+            window, window_tokens = kept, kept_tokens
+            while window and window_tokens + n > max_tokens:
+                window_tokens -= window.pop(0)[2]
+
+        window.append(sentence)
+        window_tokens += n
+        fresh = True
+
+    if fresh:
+        yield emit()
+
+
+def _token_windows(offsets: List[Tuple[int, int]], max_tokens: int, overlap_tokens: int):
+    """
+    (start, end) character ranges of consecutive windows of `max_tokens`
+    tokens, overlapping by `overlap_tokens`, given tokenizer offsets.
+    """
+    step = max(1, max_tokens - overlap_tokens)
+    for i in range(0, len(offsets), step):
+        window_offsets = offsets[i : i + max_tokens]
+        yield window_offsets[0][0], window_offsets[-1][1]
+        if i + max_tokens >= len(offsets):
+            break
+
+
+def _resolve_budget(tokenizer, max_tokens: int | None):
+    if tokenizer is None or max_tokens is None:
+        default_tokenizer, default_budget = token_budget()
+        tokenizer = tokenizer or default_tokenizer
+        max_tokens = max_tokens or default_budget
+    return tokenizer, max_tokens
+
+
+def _count_tokens(tokenizer, texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def iter_token_chunks(
+    pieces: Iterable[str],
+    tokenizer=None,
+    max_tokens: int | None = None,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    """
+    Streaming tokenizer-aware chunker.
+    Sentences are tokenized once with the embedder's own tokenizer and
+    packed into chunks of at most `max_tokens` tokens, so no part of a
+    chunk is cut off by the model's max sequence length.
+    """
+    tokenizer, max_tokens = _resolve_budget(tokenizer, max_tokens)
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    def sentences() -> Iterator[Sentence]:
+        buffer = ""
+        buffer_start = 0
+        pieces_iter = iter(pieces)
+        final = False
+        while not final:
+            piece = next(pieces_iter, None)
+            if piece is None:
+                final = True
+            else:
+                buffer += piece
+            spans, consumed = _split_sentences(buffer, final)
+            texts = [buffer[a:b] for a, b in spans]
+            for (a, b), text, n in zip(spans, texts, _count_tokens(tokenizer, texts)):
+                yield buffer_start + a, buffer_start + b, n, text
+            buffer = buffer[consumed:]
+            buffer_start += consumed
+
+    def split_long(sentence: Sentence) -> Iterator[Chunk]:
+        start, text = sentence[0], sentence[3]
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        for a, b in _token_windows(enc["offset_mapping"], max_tokens, overlap_tokens):
+            yield " ".join(text[a:b].split()), start + a, start + b
+
+    return _pack_sentences(sentences(), max_tokens, overlap_tokens, split_long)
+
+
+# ------------------------------------------------------------
+# Memory-mapped sources (byte offsets, no text held)
+# ------------------------------------------------------------
+WORD_RE_BYTES = re.compile(rb"\S+")
+SENTENCE_BOUNDARY_RE_BYTES = re.compile(rb"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+|\n\s*")
+
+# Sentences decoded + tokenized together in one tokenizer call
+SENTENCE_BATCH = 256
+
+
+def iter_mapped_word_chunks(buf) -> Iterator[Chunk]:
+    """
+    Word chunker over a bytes-like buffer (e.g. an mmap) of an
+    ASCII-compatible encoding. Only word byte offsets are kept, and
+    chunks are returned as (None, start_byte, end_byte).
+    """
+    overlap = min(CHUNK_OVERLAP, CHUNK_SIZE - 1)
+    spans: deque = deque()
+    emitted = 0
+
+    for m in WORD_RE_BYTES.finditer(buf):
+        spans.append((m.start(), m.end()))
+        if len(spans) == CHUNK_SIZE:
+            yield None, spans[0][0], spans[-1][1]
+            for _ in range(CHUNK_SIZE - overlap):
+                spans.popleft()
+            emitted = overlap
+
+    if len(spans) > emitted:
+        yield None, spans[0][0], spans[-1][1]
+
+
+def _iter_mapped_sentence_spans(buf) -> Iterator[Tuple[int, int]]:
+    """
+    Whitespace-trimmed sentence byte spans of `buf`. Runs longer than
+    MAX_SENTENCE_CHARS bytes without a boundary are cut at whitespace.
+    """
+    start = 0
+    boundaries = SENTENCE_BOUNDARY_RE_BYTES.finditer(buf)
+    while True:
+        m = next(boundaries, None)
+        end, next_start = (m.start(), m.end()) if m else (len(buf), len(buf))
+
+        while end - start > MAX_SENTENCE_CHARS:
+            cut = buf.rfind(b" ", start, start + MAX_SENTENCE_CHARS) + 1
+            if cut <= start:
+                cut = start + MAX_SENTENCE_CHARS
+            yield from _trimmed_span(buf, start, cut)
+            start = cut
+
+        yield from _trimmed_span(buf, start, end)
+        if m is None:
+            return
+        start = next_start
+
+
+def _trimmed_span(buf, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    segment = buf[start:end]
+    stripped = segment.strip()
+    if stripped:
+        start += len(segment) - len(segment.lstrip())
+        yield start, start + len(stripped)
+
+
+def iter_mapped_token_chunks(
+    buf,
+    encoding: str,
+    tokenizer=None,
+    max_tokens: int | None = None,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    """
+    Tokenizer-aware chunker over a bytes-like buffer (e.g. an mmap).
+    Sentences are decoded only to be tokenized, then dropped; chunks are
+    returned as (None, start_byte, end_byte).
+    """
+    tokenizer, max_tokens = _resolve_budget(tokenizer, max_tokens)
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    def sentences() -> Iterator[Sentence]:
+        spans = _iter_mapped_sentence_spans(buf)
+        while True:
+            batch = list(islice(spans, SENTENCE_BATCH))
+            if not batch:
+                return
+            texts = [buf[a:b].decode(encoding, errors="replace") for a, b in batch]
+            for (a, b), n in zip(batch, _count_tokens(tokenizer, texts)):
+                yield a, b, n, None
+
+    def split_long(sentence: Sentence) -> Iterator[Chunk]:
+        start, end = sentence[0], sentence[1]
+        text = buf[start:end].decode(encoding, errors="replace")
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        for a, b in _token_windows(enc["offset_mapping"], max_tokens, overlap_tokens):
+            # character offsets -> byte offsets within the sentence
+            byte_a = len(text[:a].encode(encoding, errors="replace"))
+            byte_b = byte_a + len(text[a:b].encode(encoding, errors="replace"))
+            yield None, start + byte_a, start + byte_b
+
+    return _pack_sentences(sentences(), max_tokens, overlap_tokens, split_long)
+
+
+class ChunkSpan:
+    """
+    A chunk as a (source, start, end) byte range of a memory-mapped file.
+    The text is only decoded when text() is called (i.e. when the chunk
+    is embedded or displayed), so big text dumps are never copied.
+    """
+
+    __slots__ = ("path", "start", "end", "encoding")
+
+    def __init__(self, path: str, start: int, end: int, encoding: str):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.encoding = encoding
+
+    def text(self) -> str:
+        buf = map_file(self.path)
+        raw = buf[self.start : self.end].decode(self.encoding, errors="replace")
+        return " ".join(raw.split())
+
+    def __repr__(self) -> str:
+        return f"ChunkSpan({self.path!r}, {self.start}, {self.end})"
+
+
+@lru_cache(maxsize=16)
+def _mapped_file(path: str, size: int, mtime_ns: int) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def map_file(path: str) -> mmap.mmap | None:
+    """
+    Read-only memory map of a file (shared with ChunkSpan.text()).
+    Maps are cached per (size, mtime), so a rewritten file is re-mapped.
+    Returns None for empty files, which cannot be mapped.
+    """
+    stat = os.stat(path)
+    if stat.st_size == 0:
+        return None
+    return _mapped_file(path, stat.st_size, stat.st_mtime_ns)
+
+
+def release_mapped_files() -> None:
+    """Drops cached maps, e.g. before files are modified or deleted."""
+    _mapped_file.cache_clear()
+
+
+# ------------------------------------------------------------
+# Dispatch
+# ------------------------------------------------------------
+def iter_chunks(pieces: Iterable[str]) -> Iterator[Chunk]:
+    """
+    Chunks a stream of text pieces with the configured CHUNKER
+    ("tokens" or "words"), yielding (text, start_char, end_char).
+    """
+    if CHUNKER == "words":
+        return iter_word_chunks(pieces)
+    return iter_token_chunks(pieces)
+
+
+def iter_mapped_chunks(buf, encoding: str) -> Iterator[Chunk]:
+    """
+    Chunks a memory-mapped ASCII-compatible text file with the configured
+    CHUNKER, yielding (None, start_byte, end_byte).
+    """
+    if CHUNKER == "words":
+        return iter_mapped_word_chunks(buf)
+    return iter_mapped_token_chunks(buf, encoding)
@@ -0,0 +1,103 @@
+"""
+HNSW settings of Chroma collections, and rebuilding a collection under
+its own name.
+
+Chroma fixes a collection's HNSW parameters when it is created, so
+applying new HNSW_PARAMS (or storing differently projected vectors)
+means copying the records into a new collection and swapping it in.
+The swap renames the original aside to <name>_replaced before the copy
+takes its name; finish_swap() completes a swap interrupted in between.
+"""
+from __future__ import annotations
+
+from typing import List, Dict, Any, Callable
+
+import numpy as np
+
+from config import HNSW_PARAMS
+
+# Records copied (and re-embedded by reproject()) per step of a rebuild
+REBUILD_PAGE_SIZE = 1024
+
+# Chroma's values for HNSW parameters a collection was created without
+CHROMA_HNSW_DEFAULTS = {"space": "l2", "M": 16, "construction_ef": 100, "search_ef": 10}
+
+
+def hnsw_metadata(collection_name: str, **overrides) -> Dict[str, Any]:
+    """
+    Chroma collection metadata ({"hnsw:M": ..., ...}) with the HNSW_PARAMS
+    of the collection (Chroma's defaults for unconfigured collections).
+    """
+    params = {**CHROMA_HNSW_DEFAULTS, **HNSW_PARAMS.get(collection_name, {}), **overrides}
+    return {f"hnsw:{key}": value for key, value in params.items()}
+
+
+def hnsw_changes(metadata: Dict[str, Any] | None, settings_name: str) -> str:
+    """
+    The HNSW parameters of a collection (its metadata) that differ from
+    the HNSW_PARAMS of settings_name, as "M 16 -> 32, ..." ("" if none).
+    """
+    wanted = hnsw_metadata(settings_name)
+    defaults = {f"hnsw:{key}": value for key, value in CHROMA_HNSW_DEFAULTS.items()}
+    current = {key: (metadata or {}).get(key, value) for key, value in defaults.items()}
+    return ", ".join(
+        f"{key[5:]} {current[key]} -> {wanted[key]}" for key in wanted if current[key] != wanted[key]
+    )
+
+
+def finish_swap(client, name: str) -> None:
+    """
+    Completes a rebuild_collection() interrupted during its swap: the
+    original collection, renamed aside, is dropped if the new one took
+    its name, and renamed back otherwise (the rebuild then runs again).
+    """
+    try:
+        replaced = client.get_collection(name=f"{name}_replaced")
+    except ValueError:
+        return
+    try:
+        client.get_collection(name=name)
+    except ValueError:
+        print(f"[WARNING] Rebuild of '{name}' was interrupted; restoring the original collection.")
+        replaced.modify(name=name)
+        return
+    client.delete_collection(replaced.name)
+
+
+def rebuild_collection(
+    client,
+    collection,
+    create: Callable[[str], Any],
+    ids: List[str],
+    include: List[str],
+    vectors: Callable[[Dict[str, Any]], np.ndarray],
+):
+    """
+    Copies the records `ids` of collection into a new one, created by
+    create(name) under a temporary name, storing vectors(page) for
+    every page of REBUILD_PAGE_SIZE records read with `include`, then
+    swaps it in. The original stays until the copy has its name.
+    Returns the new collection.
+    """
+    name = collection.name
+    tmp_name = f"{name}_rebuild"
+    try:
+        client.delete_collection(tmp_name)
+    except ValueError:
+        pass
+    target = create(tmp_name)
+
+    for start in range(0, len(ids), REBUILD_PAGE_SIZE):
+        page = collection.get(ids=ids[start : start + REBUILD_PAGE_SIZE], include=include)
+        target.add(
+            ids=page["ids"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+            embeddings=vectors(page),
+        )
+
+    replaced_name = f"{name}_replaced"
+    collection.modify(name=replaced_name)
+    target.modify(name=name)
+    client.delete_collection(replaced_name)
+    return target
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from config import NEAR_DUP_DETECTION, NEAR_DUP_MAX_DISTANCE
+from .index_manifest import TrackedDict
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+# Metadata key flagging one file a stored chunk belongs to ("file:<name>":
+# True). A chunk shared by several files has one flag per file, so
+# delete_source() / source_ids() of the stores match every file, not just
+# 'source'. Chroma can't drop a metadata key on update, so a released
+# file's flag is set to False.
+SOURCE_FLAG_PREFIX = "file:"
+
+
+def source_flag(name: str) -> str:
+    return f"{SOURCE_FLAG_PREFIX}{name}"
+
+
+def flagged_sources(metadata: Dict[str, Any]) -> List[str]:
+    """Files whose flag is set in a stored chunk's metadata."""
+    return [
+        key[len(SOURCE_FLAG_PREFIX) :]
+        for key, value in metadata.items()
+        if key.startswith(SOURCE_FLAG_PREFIX) and value is True
+    ]
+
+
+def cited_sources(metadata: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """(file name, chunk index) of every file a retrieved chunk belongs to."""
+    positions = metadata.get("positions")
+    if positions:
+        return [(name, position[0]) for name, position in json.loads(positions).items()]
+    return [(metadata.get("source", "unknown"), metadata.get("chunk_index", "?"))]
+
+
+def content_chunk_id(text: str) -> str:
+    """
+    Content-addressed chunk ID: identical chunk text -> identical ID,
+    whichever file (or position) it came from.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over word 3-shingles.
+    Near-identical texts get fingerprints with a small Hamming distance.
+    """
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [
+            " ".join(words[i : i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        ]
+
+    hashes = np.array(
+        [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+            for s in shingles
+        ],
+        dtype=np.uint64,
+    )
+    # Per bit: +1 if the shingle hash has it set, -1 otherwise
+    bits = (hashes[:, None] >> np.arange(SIMHASH_BITS, dtype=np.uint64)) & np.uint64(1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+
+    fingerprint = 0
+    for bit in np.flatnonzero(votes > 0):
+        fingerprint |= 1 << int(bit)
+    return fingerprint
+
+
+def _band_keys(fingerprint: int, bands: int) -> List[Tuple[int, int]]:
+    """
+    Splits a fingerprint into `bands` bit ranges. Two fingerprints within
+    Hamming distance bands-1 share at least one band exactly
+    (pigeonhole), so near-dup lookup is a handful of dict hits.
+    """
+    width = SIMHASH_BITS // bands
+    keys = []
+    for band in range(bands):
+        shift = band * width
+        bits = SIMHASH_BITS - shift if band == bands - 1 else width
+        keys.append((band, (fingerprint >> shift) & ((1 << bits) - 1)))
+    return keys
+
+
+class ChunkDeduplicator:
+    """
+    Index-time chunk deduplication.
+
+    - Exact duplicates: chunks are keyed by content_chunk_id(), so the same
+      text from several files is embedded and stored once.
+    - Near duplicates: SimHash fingerprints within NEAR_DUP_MAX_DISTANCE
+      bits of a stored chunk from another file are folded into it. The
+      stored text is the other file's, so the folded file is recorded
+      without offsets.
+
+    State lives in `registry` (persisted by the index manifest):
+      { chunk_id: {"sources": {file_name: [chunk_index, start_offset, end_offset]},
+                   "simhash": "hex"} }
+    Every changed entry is touch()ed so only those rows are saved.
+    """
+
+    def __init__(
+        self,
+        registry: TrackedDict,
+        near_dup: bool = NEAR_DUP_DETECTION,
+        max_distance: int = NEAR_DUP_MAX_DISTANCE,
+    ):
+        self.registry = registry
+        self.near_dup = near_dup
+        self.max_distance = max_distance
+        self._bands = max_distance + 1
+        # Built on first near-dup lookup, so a no-change reindex never pays for it
+        self._band_index: Dict[Tuple[int, int], List[str]] | None = None
+        # Stored chunks whose source list changed and need a metadata update
+        self.dirty: set[str] = set()
+        # Files dropped from a stored chunk, whose flag must be cleared
+        self._released: Dict[str, set[str]] = {}
+        self._seen: set[Tuple[str, str]] = set()
+        self.report: Dict[str, int] = {
+            "chunks_seen": 0,
+            "chunks_embedded": 0,
+            "chunks_reused": 0,
+            "exact_duplicates": 0,
+            "near_duplicates": 0,
+            "chars_embedded": 0,
+            "chars_saved": 0,
+        }
+
+    # ------------------------------------------------------------
+    # Band index
+    # ------------------------------------------------------------
+    def _ensure_band_index(self) -> Dict[Tuple[int, int], List[str]]:
+        if self._band_index is None:
+            self._band_index = {}
+            for chunk_id, entry in self.registry.items():
+                self._index_fingerprint(chunk_id, int(entry["simhash"], 16))
+        return self._band_index
+
+    def _index_fingerprint(self, chunk_id: str, fingerprint: int) -> None:
+        if self._band_index is None:
+            return
+        for key in _band_keys(fingerprint, self._bands):
+            self._band_index.setdefault(key, []).append(chunk_id)
+
+    def _unindex_fingerprint(self, chunk_id: str, fingerprint: int) -> None:
+        if self._band_index is None:
+            return
+        for key in _band_keys(fingerprint, self._bands):
+            ids = self._band_index.get(key)
+            if ids and chunk_id in ids:
+                ids.remove(chunk_id)
+
+    def _find_near_duplicate(self, fingerprint: int, source: str) -> str | None:
+        band_index = self._ensure_band_index()
+        for key in _band_keys(fingerprint, self._bands):
+            for candidate in band_index.get(key, []):
+                entry = self.registry[candidate]
+                # Never fold a file into its own (previous) chunks, otherwise
+                # small edits to a file would never reach the index.
+                if not any(name != source for name in entry["sources"]):
+                    continue
+                distance = bin(fingerprint ^ int(entry["simhash"], 16)).count("1")
+                if distance <= self.max_distance:
+                    return candidate
+        return None
+
+    def _count_duplicate(self, kind: str, text: str) -> None:
+        self.report[kind] += 1
+        self.report["chars_saved"] += len(text)
+
+    # ------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------
+    def add(self, source: str, text: str, metadata: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Registers a chunk of `source`.
+        Returns (chunk_id, is_new). Only new chunks need to be embedded;
+        duplicates just gain `source` in their source list.
+        """
+        position = [
+            metadata.get("chunk_index", 0),
+            metadata.get("start_offset"),
+            metadata.get("end_offset"),
+        ]
+        self.report["chunks_seen"] += 1
+
+        chunk_id = content_chunk_id(text)
+        entry = self.registry.get(chunk_id)
+        if entry is not None:
+            if (chunk_id, source) in self._seen:
+                # Same text twice within this file
+                self._count_duplicate("exact_duplicates", text)
+            elif source in entry["sources"]:
+                # Unchanged chunk of a file being re-indexed: keep the vector
+                self.report["chunks_reused"] += 1
+                if entry["sources"][source] != position:
+                    entry["sources"][source] = position
+                    self.registry.touch(chunk_id)
+                    self.dirty.add(chunk_id)
+            else:
+                entry["sources"][source] = position
+                self.registry.touch(chunk_id)
+                self.dirty.add(chunk_id)
+                self._count_duplicate("exact_duplicates", text)
+            self._seen.add((chunk_id, source))
+            return chunk_id, False
+
+        fingerprint = simhash(text)
+        if self.near_dup:
+            near_id = self._find_near_duplicate(fingerprint, source)
+            if near_id is not None:
+                sources = self.registry[near_id]["sources"]
+                if source not in sources:
+                    sources[source] = [position[0], None, None]
+                    self.registry.touch(near_id)
+                    self.dirty.add(near_id)
+                self._count_duplicate("near_duplicates", text)
+                self._seen.add((near_id, source))
+                return near_id, False
+
+        self.registry[chunk_id] = {
+            "sources": {source: position},
+            "simhash": format(fingerprint, "016x"),
+        }
+        self._index_fingerprint(chunk_id, fingerprint)
+        self._seen.add((chunk_id, source))
+        self.report["chunks_embedded"] += 1
+        self.report["chars_embedded"] += len(text)
+        return chunk_id, True
+
+    def release(self, source: str, chunk_ids: List[str]) -> List[str]:
+        """
+        Drops `source` from the given chunks.
+        Returns the chunk IDs that no longer have any source and must be
+        deleted from the vector store.
+        """
+        orphaned = []
+        for chunk_id in chunk_ids:
+            entry = self.registry.get(chunk_id)
+            if entry is None or source not in entry["sources"]:
+                continue
+            del entry["sources"][source]
+            if entry["sources"]:
+                self.registry.touch(chunk_id)
+                self.dirty.add(chunk_id)
+                self._released.setdefault(chunk_id, set()).add(source)
+                continue
+            self._unindex_fingerprint(chunk_id, int(entry["simhash"], 16))
+            del self.registry[chunk_id]
+            self.dirty.discard(chunk_id)
+            self._released.pop(chunk_id, None)
+            orphaned.append(chunk_id)
+        return orphaned
+
+    def metadata(self, chunk_id: str) -> Dict[str, Any]:
+        """
+        Chroma metadata for a stored chunk. Chroma only accepts scalar
+        values, so every file is kept as a source_flag() key, and the
+        position of each file (see cited_sources()) as a JSON string;
+        'source' / 'chunk_index' / offsets refer to the first file that
+        holds the exact text. Offsets are -1 if no file does (only near
+        duplicates left): Chroma keeps keys an update leaves out.
+        """
+        sources = self.registry[chunk_id]["sources"]
+        exact = [name for name, position in sources.items() if position[1] is not None]
+        first = exact[0] if exact else next(iter(sources))
+        chunk_index, start_offset, end_offset = sources[first]
+        metadata = {
+            "source": first,
+            "chunk_index": chunk_index,
+            "sources": ", ".join(sources),
+            "positions": json.dumps(sources),
+        }
+        for name in self._released.pop(chunk_id, ()):
+            if name not in sources:
+                metadata[source_flag(name)] = False
+        metadata.update({source_flag(name): True for name in sources})
+        metadata["start_offset"] = -1 if start_offset is None else start_offset
+        metadata["end_offset"] = -1 if end_offset is None else end_offset
+        return metadata
+
+    def summary(self) -> str:
+        r = self.report
+        total = r["chars_embedded"] + r["chars_saved"]
+        saved_pct = 100.0 * r["chars_saved"] / total if total else 0.0
+        return (
+            f"{r['chunks_seen']} chunks seen, {r['chunks_embedded']} embedded, "
+            f"{r['chunks_reused']} unchanged, "
+            f"{r['exact_duplicates']} exact + {r['near_duplicates']} near duplicates skipped "
+            f"({saved_pct:.1f}% of embedding work / storage saved)"
+        )
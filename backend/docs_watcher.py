@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Any, Tuple
+
+from config import WATCH_POLL_SECONDS, WATCH_BATCH_FILES
+from .document_loader import DOCS_DIR, SUPPORTED_SUFFIXES
+from .rag_pipeline import index_all_documents, get_last_index_report
+
+Snapshot = Dict[str, Tuple[int, int]]  # name -> (size, mtime_ns)
+
+
+def _snapshot() -> Snapshot:
+    snap: Snapshot = {}
+    if not DOCS_DIR.exists():
+        return snap
+    for path in DOCS_DIR.iterdir():
+        if path.suffix.lower() not in SUPPORTED_SUFFIXES:
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        snap[path.name] = (stat.st_size, stat.st_mtime_ns)
+    return snap
+
+
+class DocsWatcher:
+    """
+    Background indexer for data/docs.
+
+    Polls the folder every WATCH_POLL_SECONDS (woken up early by
+    filesystem events when the optional `watchdog` package is installed).
+    Once no file has changed for WATCH_POLL_SECONDS (so half-written
+    uploads are not indexed, however often events wake the loop), it
+    runs index_all_documents() in batches of WATCH_BATCH_FILES files
+    until nothing is pending.
+
+    watermark() reports the time up to which every change in the folder
+    is indexed. Queries never wait on this thread.
+    """
+
+    def __init__(
+        self,
+        poll_seconds: float = WATCH_POLL_SECONDS,
+        batch_files: int = WATCH_BATCH_FILES,
+    ):
+        self.poll_seconds = poll_seconds
+        self.batch_files = batch_files
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._observer = None
+
+        # Last snapshot seen, and when each file in it (or removed from
+        # it) last changed, for changes younger than poll_seconds
+        self._seen: Snapshot = {}
+        self._changed_at: Dict[str, float] = {}
+
+        self._indexed_snapshot: Snapshot | None = None
+        self._indexed_through: float | None = None
+        self._pending_files = 0
+        self._last_error: str | None = None
+
+    # ------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------
+    def start(self) -> "DocsWatcher":
+        if self._thread is not None:
+            return self
+
+        self._start_observer()
+        self._thread = threading.Thread(target=self._run, name="docs-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _start_observer(self) -> None:
+        """
+        inotify / FSEvents / ReadDirectoryChanges through watchdog,
+        if installed. Without it, plain polling is used.
+        """
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return
+
+        wake = self._wake
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), str(DOCS_DIR), recursive=False)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+    # ------------------------------------------------------------
+    # Status
+    # ------------------------------------------------------------
+    def watermark(self) -> Dict[str, Any]:
+        """
+        indexed_through: wall-clock time (epoch seconds) such that every
+        file change before it is searchable; None until the first run.
+        """
+        return {
+            "indexed_through": self._indexed_through,
+            "pending_files": self._pending_files,
+            "last_error": self._last_error,
+        }
+
+    # ------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._poll(time.time())
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _poll(self, now: float) -> None:
+        snap = _snapshot()
+        for name in snap.keys() | self._seen.keys():
+            if snap.get(name) != self._seen.get(name):
+                self._changed_at[name] = now
+        self._seen = snap
+        self._changed_at = {
+            name: changed for name, changed in self._changed_at.items() if now - changed < self.poll_seconds
+        }
+
+        if snap == self._indexed_snapshot:
+            self._indexed_through = now
+        elif not self._changed_at:
+            # Every change has been stable for a full interval
+            self._index(snap, now)
+
+    def _index(self, snap: Snapshot, started: float) -> None:
+        try:
+            while not self._stop.is_set():
+                index_all_documents(max_files=self.batch_files)
+                self._pending_files = get_last_index_report().get("pending_files", 0)
+                if not self._pending_files:
+                    break
+        except Exception as e:
+            print(f"[WARNING] Background indexing failed: {e}")
+            self._last_error = str(e)
+            return
+
+        self._last_error = None
+        self._indexed_snapshot = snap
+        self._indexed_through = started
+
+
+_watcher: DocsWatcher | None = None
+
+
+def start_docs_watcher() -> DocsWatcher:
+    """Starts (once per process) and returns the background indexer."""
+    global _watcher
+    if _watcher is None:
+        _watcher = DocsWatcher().start()
+    return _watcher
@@ -57,70 +57,137 @@
 
 
 from pathlib import Path
-from typing import List, Dict
-from config import BASE_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+from typing import List, Iterable, Iterator
+import codecs
+
+from config import (
+    BASE_DIR,
+    INGEST_WORKERS,
+    INGEST_MAX_BATCH_MB,
+    PDF_PAGES_PER_TASK,
+)
+from .chunking import Chunk, ChunkSpan, iter_chunks, iter_mapped_chunks, map_file
+from . import pdf_cache
 
 DOCS_DIR = BASE_DIR / "data" / "docs"
+SUPPORTED_SUFFIXES = (".txt", ".pdf")
 
+# TXT files are decoded and chunked in blocks of this many characters
+TXT_BLOCK_CHARS = 1 << 20
 
-def _chunk_text(text: str) -> List[str]:
-    words = text.split()
-    chunks: List[str] = []
-    start = 0
+# Encodings where whitespace / punctuation are single ASCII bytes, so
+# files can be chunked directly on their bytes (memory-mapped)
+MAPPABLE_ENCODINGS = ("utf-8", "latin-1")
 
-    while start < len(words):
-        end = min(start + CHUNK_SIZE, len(words))
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        if end >= len(words):
-            break
-        start = end - CHUNK_OVERLAP
 
-    return chunks
+def _chunk_text(text: str) -> List[str]:
+    return [chunk for chunk, _, _ in iter_chunks([text])]
 
 
-def _load_txt(path: Path) -> str:
+def _detect_txt_encoding(path: Path) -> str | None:
+    """
+    Finds the first of utf-8 / utf-16 / latin-1 that decodes the file,
+    checked block by block so the file is never fully loaded.
+    """
     for encoding in ("utf-8", "utf-16", "latin-1"):
+        decoder = codecs.getincrementaldecoder(encoding)()
         try:
-            return path.read_text(encoding=encoding)
+            with path.open("rb") as f:
+                for block in iter(lambda: f.read(TXT_BLOCK_CHARS), b""):
+                    decoder.decode(block)
+            decoder.decode(b"", final=True)
+            return encoding
         except Exception:
             continue
-    print(f"[WARNING] Could not decode TXT file: {path.name}")
-    return ""
+    return None
 
 
-def _load_pdf(path: Path) -> str:
+def _iter_txt_blocks(path: Path) -> Iterator[str]:
+    encoding = _detect_txt_encoding(path)
+    if encoding is None:
+        print(f"[WARNING] Could not decode TXT file: {path.name}")
+        return
+
+    with path.open("r", encoding=encoding) as f:
+        for block in iter(lambda: f.read(TXT_BLOCK_CHARS), ""):
+            yield block
+
+
+def _load_txt(path: Path) -> str:
+    return "".join(_iter_txt_blocks(path))
+
+
+def _pdf_page_count(path: Path) -> int:
+    try:
+        import PyPDF2
+
+        with path.open("rb") as f:
+            return len(PyPDF2.PdfReader(f).pages)
+    except Exception:
+        return 0
+
+
+def _extract_pdf_pages(path: Path, start: int = 0, end: int | None = None) -> Iterator[str]:
     """
-    Safe PDF loader.
-    - Does NOT raise errors
-    - Returns empty text if PDF unreadable
+    Yields the text of pages [start, end) of a PDF, one page at a time.
+    Pages without extractable text are yielded as "" so that page
+    ranges extracted by different workers line up when merged.
+    Raises if PyPDF2 is missing or the file cannot be read.
+    """
+    import PyPDF2
+
+    with path.open("rb") as f:
+        reader = PyPDF2.PdfReader(f)
+
+        # Some PDFs have no extractable text
+        for page in reader.pages[start:end]:
+            try:
+                yield page.extract_text() or ""
+            except Exception:
+                yield ""
+
+
+def _iter_pdf_pages(path: Path) -> Iterator[str]:
     """
+    Page texts of a whole PDF, served from the PDF text cache when the
+    file was already extracted. Freshly extracted files are added to the
+    cache once every page was read. Never raises.
+    """
+    cached = pdf_cache.load_pages(path)
+    if cached is not None:
+        yield from cached
+        return
+
+    pages: List[str] = []
     try:
-        import PyPDF2
+        for page in _extract_pdf_pages(path):
+            pages.append(page)
+            yield page
     except ImportError:
         print("[ERROR] PyPDF2 not installed.")
-        return ""
+        return
+    except Exception as e:
+        print(f"[WARNING] Could not read PDF '{path.name}': {e}")
+        return
 
-    text = ""
+    pdf_cache.store_pages(path, pages)
 
-    try:
-        with path.open("rb") as f:
-            reader = PyPDF2.PdfReader(f)
-
-            # Some PDFs have no extractable text
-            for page in reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                except Exception:
-                    continue
 
-    except Exception as e:
-        print(f"[WARNING] Could not read PDF '{path.name}': {e}")
-        return ""
+def _page_pieces(pages: Iterable[str]) -> Iterator[str]:
+    # Same layout the old loader built with `text += page + "\n"`
+    for page in pages:
+        if page:
+            yield page
+            yield "\n"
 
-    return text
+
+def _load_pdf(path: Path) -> str:
+    """
+    Safe PDF loader.
+    - Does NOT raise errors
+    - Returns empty text if PDF unreadable
+    """
+    return "".join(_page_pieces(_iter_pdf_pages(path)))
 
 
 
@@ -163,47 +230,261 @@ def _load_pdf(path: Path) -> str:
 
 
 
-def load_documents() -> list[dict]:
+_skipped_files: set[str] = set()
+
+
+def iter_document_files() -> list[Path]:
+    """
+    Returns the supported files in data/docs, sorted by name so that
+    indexing order (and therefore chunk order) is deterministic.
+    """
     DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
-    docs = []
+    files = []
+    for file_path in sorted(DOCS_DIR.iterdir()):
+        if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_SUFFIXES:
+            files.append(file_path)
+        elif file_path.name not in _skipped_files:
+            # The docs watcher scans every few seconds: say it once per file
+            _skipped_files.add(file_path.name)
+            print("[DEBUG] Skipping unsupported file:", file_path.name)
+    return files
 
-    for file_path in DOCS_DIR.iterdir():
-        print("[DEBUG] Found file:", file_path.name, "suffix:", file_path.suffix)
 
-        # --- Load file text ---
-        if file_path.suffix.lower() == ".txt":
-            raw_text = _load_txt(file_path)
+def _iter_file_pieces(file_path: Path) -> Iterator[str]:
+    if file_path.suffix.lower() == ".txt":
+        return _iter_txt_blocks(file_path)
+    if file_path.suffix.lower() == ".pdf":
+        return _page_pieces(_iter_pdf_pages(file_path))
+    return iter(())
 
-        elif file_path.suffix.lower() == ".pdf":
-            raw_text = _load_pdf(file_path)
 
+def _iter_docs(
+    file_path: Path,
+    chunks: Iterable[Chunk],
+    encoding: str | None = None,
+) -> Iterator[dict]:
+    """
+    Turns (text, start, end) chunks into docs ready for the vector store.
+    Chunks of memory-mapped files come without text: their doc carries a
+    ChunkSpan under "span" instead, see doc_text().
+    """
+    count = 0
+    for idx, (chunk, start, end) in enumerate(chunks):
+        count += 1
+        doc = {
+            "id": f"{file_path.name}_{idx}",  # IMPORTANT: unique ID
+            "metadata": {
+                "source": file_path.name,
+                "chunk_index": idx,
+                "start_offset": start,
+                "end_offset": end,
+            },
+        }
+        if chunk is None:
+            doc["span"] = ChunkSpan(str(file_path), start, end, encoding)
         else:
-            print("[DEBUG] Skipping unsupported file:", file_path.name)
-            continue
+            doc["text"] = chunk
+        yield doc
+
+    if count == 0:
+        print(f"[WARNING] Empty or unreadable file: {file_path.name}")
+    else:
+        print(f"[DEBUG] {file_path.name}: {count} chunks")
+
+
+def doc_text(doc: dict) -> str:
+    """
+    Text of a loaded doc, decoded from its source file if it is a span.
+    """
+    if "text" in doc:
+        return doc["text"]
+    return doc["span"].text()
+
+
+def _with_text(docs: Iterable[dict]) -> Iterator[dict]:
+    """Docs with their span replaced by the decoded "text"."""
+    for doc in docs:
+        if "span" in doc:
+            doc = {"id": doc["id"], "text": doc_text(doc), "metadata": doc["metadata"]}
+        yield doc
+
+
+def iter_file_docs(file_path: Path) -> Iterator[dict]:
+    """
+    Streams the chunks of a single .txt or .pdf file.
+
+    UTF-8 / Latin-1 TXT files are memory-mapped and chunked on byte
+    offsets without being decoded as a whole. Other files yield
+    blocks/pages, which yield chunks.
+    """
+    if file_path.suffix.lower() == ".txt":
+        encoding = _detect_txt_encoding(file_path)
+        if encoding in MAPPABLE_ENCODINGS:
+            buf = map_file(str(file_path))
+            chunks = iter_mapped_chunks(buf, encoding) if buf is not None else iter(())
+            return _iter_docs(file_path, chunks, encoding)
+
+    return _iter_docs(file_path, iter_chunks(_iter_file_pieces(file_path)))
+
+
+def load_file(file_path: Path) -> list[dict]:
+    """
+    Loads and chunks a single .txt or .pdf file into
+    {"id", "text", "metadata"} docs.
+    Returns an empty list for unsupported, empty or unreadable files.
+    """
+    return list(_with_text(iter_file_docs(file_path)))
+
+
+# ------------------------------------------------------------
+# Parallel parsing (process pool)
+# ------------------------------------------------------------
+def _load_file_task(path_str: str) -> list[dict]:
+    # TXT chunks cross the process boundary as spans, not text
+    return list(iter_file_docs(Path(path_str)))
+
+
+def _load_pdf_task(path_str: str) -> tuple[int, list[dict] | None]:
+    """
+    Page count of a PDF, plus its chunks if it fits in one task (bigger
+    ones are split into page ranges by the caller). Counting pages here
+    keeps the parent from parsing every PDF just to split it.
+    """
+    path = Path(path_str)
+    page_count = _pdf_page_count(path)
+    if page_count <= PDF_PAGES_PER_TASK:
+        return page_count, list(iter_file_docs(path))
+    return page_count, None
 
-        # ✅ ADD THE DEBUG LINE HERE
-        print(f"[DEBUG] Loaded {file_path.name}, text length =", len(raw_text))
 
-        # Skip empty files
-        if not raw_text.strip():
-            print(f"[WARNING] Empty or unreadable file: {file_path.name}")
+def _load_pdf_pages_task(path_str: str, start: int, end: int) -> List[str] | None:
+    """
+    Extracts one page range; None if the PDF could not be read.
+    """
+    path = Path(path_str)
+    try:
+        return list(_extract_pdf_pages(path, start, end))
+    except ImportError:
+        print("[ERROR] PyPDF2 not installed.")
+    except Exception as e:
+        print(f"[WARNING] Could not read PDF '{path.name}' pages {start}-{end}: {e}")
+    return None
+
+
+def _pdf_page_ranges(page_count: int) -> list[tuple[int, int]]:
+    """Splits a big PDF into page ranges of PDF_PAGES_PER_TASK pages."""
+    return [
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+
+
+def _merged_pages(path: Path, futures: list) -> Iterator[str]:
+    """
+    Page pieces of a split PDF in page order. The merged page texts are
+    cached once every range was extracted.
+    """
+    pages: List[str] = []
+    complete = True
+    for future in futures:
+        range_pages = future.result()
+        if range_pages is None:
+            complete = False
             continue
+        pages.extend(range_pages)
+        yield from _page_pieces(range_pages)
 
-        # --- Chunking ---
-        chunks = _chunk_text(raw_text)
-        print(f"[DEBUG] {file_path.name}: {len(chunks)} chunks")
-
-        for idx, chunk in enumerate(chunks):
-            docs.append(
-                {
-                    "id": f"{file_path.name}_{idx}",  # IMPORTANT: unique ID
-                    "text": chunk,
-                    "metadata": {
-                        "source": file_path.name,
-                        "chunk_index": idx,
-                    },
-                }
-            )
+    if complete:
+        pdf_cache.store_pages(path, pages)
+
+
+def load_files(
+    paths: List[Path],
+    workers: int | None = None,
+) -> Iterator[tuple[Path, Iterator[dict]]]:
+    """
+    Parses and chunks files, yielding (path, docs) in the order of
+    `paths` so chunk order stays deterministic. `docs` is an iterator
+    and must be consumed before advancing to the next file.
+
+    With workers > 1, files are parsed on a process pool: work is split
+    per file, and big PDFs are further split into page ranges (once a
+    worker counted their pages) that are merged back in page order while
+    chunking. Only a bounded number of
+    tasks is in flight, and TXT files larger than INGEST_MAX_BATCH_MB
+    are streamed in-process instead of being shipped whole from a worker,
+    so memory stays flat however big the corpus is.
+    With workers <= 1 everything is streamed in-process.
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    paths = list(paths)
+
+    if workers <= 1 or not paths:
+        for path in paths:
+            yield path, iter_file_docs(path)
+        return
+
+    import multiprocessing
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    max_in_flight = workers * 2
+    stream_over_bytes = INGEST_MAX_BATCH_MB * 1024 * 1024
+
+    # spawn, not fork: this runs inside the app too, and forking a process
+    # with live torch / tokenizer / Chroma threads can deadlock the children
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+
+        def submit(path: Path):
+            if path.suffix.lower() == ".txt" and path.stat().st_size > stream_over_bytes:
+                return None
+            if path.suffix.lower() == ".pdf" and pdf_cache.is_cached(path):
+                # Already extracted: re-chunking from the cache is cheap
+                return None
+            if path.suffix.lower() == ".pdf":
+                return pool.submit(_load_pdf_task, str(path))
+            return pool.submit(_load_file_task, str(path))
+
+        pending: deque = deque()
+        remaining = iter(paths)
+
+        def refill() -> None:
+            while len(pending) < max_in_flight:
+                path = next(remaining, None)
+                if path is None:
+                    return
+                pending.append((path, submit(path)))
+
+        refill()
+        while pending:
+            path, task = pending.popleft()
+            refill()
+            if task is None:
+                yield path, iter_file_docs(path)
+            elif path.suffix.lower() == ".pdf":
+                page_count, docs = task.result()
+                if docs is not None:
+                    yield path, iter(docs)
+                    continue
+                futures = [
+                    pool.submit(_load_pdf_pages_task, str(path), start, end)
+                    for start, end in _pdf_page_ranges(page_count)
+                ]
+                yield path, _iter_docs(path, iter_chunks(_merged_pages(path, futures)))
+            else:
+                yield path, iter(task.result())
+
+
+def load_documents(workers: int | None = None) -> list[dict]:
+    """
+    Loads and chunks every file in data/docs into
+    {"id", "text", "metadata"} docs.
+    """
+    docs = []
+
+    for file_path, file_docs in load_files(iter_document_files(), workers=workers):
+        print("[DEBUG] Found file:", file_path.name, "suffix:", file_path.suffix)
+        docs.extend(_with_text(file_docs))
 
     return docs
@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from config import EMBED_CACHE, EMBED_CACHE_DIR, EMBED_CACHE_MAX_MB
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking between processes
+    fcntl = None
+
+INITIAL_CAPACITY = 1024
+# Share of entries dropped at once when the cache is full
+EVICT_FRACTION = 0.1
+
+# One record per stored vector, appended to index.bin
+INDEX_DTYPE = np.dtype([("key", "S16"), ("row", "<i4")])
+
+
+def normalize_text(text: str) -> str:
+    """
+    Texts that embed identically share a key: Unicode NFC and collapsed
+    whitespace (tokenizers split on whitespace, so runs of it don't matter).
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed embedding cache for one model.
+
+    Files in `directory`:
+      - vectors.f32: float32 matrix (capacity x dim), memory-mapped
+      - index.bin:   append-only (key, row) records; a later record for
+                     the same row wins (rows are reused after eviction)
+      - meta.json:   model name, dim, capacity
+      - lock:        flock()ed by every process using the directory
+
+    A vector is written before its index record, so a crash can lose
+    entries but never map a key to a half-written row.
+    Several processes (app, ingest CLI) can share the cache: writes hold
+    an exclusive lock on the lock file, lookups a shared one, and both
+    first catch up with what other processes wrote (see _sync()).
+    Once the matrix would exceed max_mb, the least recently used
+    EVICT_FRACTION of entries is dropped and their rows reused.
+    """
+
+    def __init__(self, model_name: str, directory: Path, max_mb: float = EMBED_CACHE_MAX_MB):
+        self.model_name = model_name
+        self.directory = Path(directory)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+        self.dim: int | None = None
+        self.capacity = 0
+        self._vectors: np.memmap | None = None
+        self._rows: Dict[bytes, int] = {}
+        self._keys: Dict[int, bytes] = {}
+        self._last_used: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._clock = 0
+        self._lock = threading.Lock()
+        self._lock_file = None
+        # (meta.json, index.bin) state last read: see _file_state()
+        self._synced = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        with self._file_lock(exclusive=False):
+            self._load()
+
+    # ------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.directory / "vectors.f32"
+
+    @property
+    def _index_path(self) -> Path:
+        return self.directory / "index.bin"
+
+    def _load(self) -> None:
+        self._synced = self._file_state()
+        if self._synced is None:
+            return
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            if meta.get("model") != self.model_name:
+                raise ValueError(f"cache belongs to {meta.get('model')}")
+            self.dim = int(meta["dim"])
+            self.capacity = int(meta["capacity"])
+            self._open_vectors()
+
+            records = (
+                np.fromfile(self._index_path, dtype=INDEX_DTYPE)
+                if self._index_path.exists()
+                else np.empty(0, dtype=INDEX_DTYPE)
+            )
+        except Exception as e:
+            print(f"[WARNING] Embedding cache unreadable, starting empty: {e}")
+            self._reset_files()
+            return
+
+        self._synced = (self._synced[0], self._synced[1], records.nbytes)
+        self._apply(records)
+        used = set(self._keys)
+        self._free = [row for row in range(self.capacity - 1, -1, -1) if row not in used]
+
+    def _apply(self, records: np.ndarray) -> None:
+        for key, row in zip(records["key"].tolist(), records["row"].tolist()):
+            if not 0 <= row < self.capacity:
+                continue
+            # "S16" strips trailing NUL bytes on read
+            key = key.ljust(16, b"\0")
+            old_key = self._keys.get(row)
+            if old_key is not None:
+                self._rows.pop(old_key, None)
+            self._rows[key] = row
+            self._keys[row] = key
+            # Recency is not persisted: older records count as less recent
+            self._last_used[row] = self._tick()
+
+    def _file_state(self):
+        """
+        (meta.json identity, index.bin inode, index.bin size), or None
+        if the cache has no files. meta.json and a compacted index.bin
+        are replaced on write, so a new inode means they changed.
+        """
+        try:
+            meta = os.stat(self._meta_path)
+        except FileNotFoundError:
+            return None
+        try:
+            index = os.stat(self._index_path)
+        except FileNotFoundError:
+            return (meta.st_ino, meta.st_mtime_ns), None, 0
+        return (meta.st_ino, meta.st_mtime_ns), index.st_ino, index.st_size
+
+    def _sync(self) -> None:
+        """
+        Catches up with other processes' writes (called under the file
+        lock): index records appended since index.bin was last read are
+        applied; a grown matrix, a compacted index or a reset cache is
+        reloaded from scratch.
+        """
+        state = self._file_state()
+        if state == self._synced:
+            return
+        if (
+            state is None
+            or self._synced is None
+            or state[:2] != self._synced[:2]
+            or state[2] < self._synced[2]
+        ):
+            self._vectors = None
+            self.dim = None
+            self.capacity = 0
+            self._rows, self._keys, self._last_used, self._free = {}, {}, {}, []
+            self._load()
+            return
+
+        with open(self._index_path, "rb") as f:
+            f.seek(self._synced[2])
+            records = np.fromfile(f, dtype=INDEX_DTYPE)
+        self._apply(records)
+        self._free = [row for row in self._free if row not in self._keys]
+        self._synced = (state[0], state[1], self._synced[2] + records.nbytes)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """flock() on the lock file, shared with the cache's other processes."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(self.directory / "lock", "a+b")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _reset_files(self) -> None:
+        for path in (self._meta_path, self._vectors_path, self._index_path):
+            path.unlink(missing_ok=True)
+        self._synced = None
+        self.dim = None
+        self.capacity = 0
+        self._vectors = None
+        self._rows, self._keys, self._last_used, self._free = {}, {}, {}, []
+
+    def _open_vectors(self) -> None:
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim)
+        )
+
+    def _write_meta(self) -> None:
+        tmp_path = self._meta_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"model": self.model_name, "dim": self.dim, "capacity": self.capacity}),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self._meta_path)
+
+    def _max_rows(self) -> int:
+        return max(1, self.max_bytes // (4 * self.dim))
+
+    def _grow(self, needed: int) -> None:
+        """
+        Extends the matrix file (doubling, up to the size cap) so that at
+        least `needed` rows are free, if the cap allows it.
+        """
+        new_capacity = max(self.capacity, INITIAL_CAPACITY)
+        while new_capacity - len(self._rows) < needed and new_capacity < self._max_rows():
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self._max_rows())
+        if new_capacity <= self.capacity:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+
+        self._free = list(range(new_capacity - 1, self.capacity - 1, -1)) + self._free
+        self.capacity = new_capacity
+        self._open_vectors()
+        self._write_meta()
+
+    def _evict(self, needed: int) -> None:
+        """
+        Drops least recently used entries until `needed` rows are free,
+        then rewrites index.bin without them.
+        """
+        count = max(needed - len(self._free), int(self.capacity * EVICT_FRACTION))
+        victims = sorted(self._last_used, key=self._last_used.__getitem__)[:count]
+        for row in victims:
+            key = self._keys.pop(row)
+            del self._rows[key]
+            del self._last_used[row]
+            self._free.append(row)
+        self.evictions += len(victims)
+
+        records = np.array(list(self._rows.items()), dtype=INDEX_DTYPE)
+        tmp_path = self._index_path.with_suffix(".tmp")
+        records.tofile(tmp_path)
+        os.replace(tmp_path, self._index_path)
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    # ------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------
+    def get_many(self, keys: List[bytes]) -> Tuple[np.ndarray | None, List[int]]:
+        """
+        Looks up keys. Returns (vectors, missing): vectors is an
+        (n x dim) float32 array with the hits filled in (None if the
+        cache is still empty), missing the positions of the misses.
+        """
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+            missing = [i for i, key in enumerate(keys) if key not in self._rows]
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+            if self._vectors is None:
+                return None, missing
+
+            out = np.zeros((len(keys), self.dim), dtype=np.float32)
+            hit_positions = [i for i, key in enumerate(keys) if key in self._rows]
+            if hit_positions:
+                rows = [self._rows[keys[i]] for i in hit_positions]
+                out[hit_positions] = self._vectors[rows]
+                for row in rows:
+                    self._last_used[row] = self._tick()
+            return out, missing
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock(exclusive=True):
+            self._sync()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                print("[WARNING] Embedding dimension changed, clearing the embedding cache.")
+                self._reset_files()
+                self.dim = vectors.shape[1]
+
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows:
+                    new[key] = vector
+            if not new:
+                return
+
+            # Never cache more than fits under the cap
+            items = list(new.items())[: self._max_rows()]
+
+            if len(self._free) < len(items):
+                self._grow(len(items))
+            if len(self._free) < len(items):
+                self._evict(len(items))
+
+            records = np.empty(len(items), dtype=INDEX_DTYPE)
+            for i, (key, vector) in enumerate(items):
+                row = self._free.pop()
+                self._vectors[row] = vector
+                self._rows[key] = row
+                self._keys[row] = key
+                self._last_used[row] = self._tick()
+                records[i] = (key, row)
+
+            # Vectors first, then the records that point at them
+            self._vectors.flush()
+            with open(self._index_path, "ab") as f:
+                records.tofile(f)
+            self._synced = self._file_state()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._rows),
+            "capacity": self.capacity,
+            "size_mb": round(self.capacity * (self.dim or 0) * 4 / (1024 * 1024), 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str) -> EmbeddingCache | None:
+    """
+    Process-wide cache of `model_name`, or None if EMBED_CACHE is off.
+    """
+    if not EMBED_CACHE:
+        return None
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+            cache = EmbeddingCache(model_name, EMBED_CACHE_DIR / slug)
+            _caches[model_name] = cache
+        return cache
@@ -0,0 +1,118 @@
+"""
+Parity check of an embedding backend against PyTorch:
+
+    python -m backend.embedding_parity --backend onnx-int8
+
+Embeds chunks of data/docs (plus a few questions) with both backends and
+reports cosine similarity between the two vectors of every text, and the
+single-query latency of each backend. Exits with status 1 if any cosine
+is below --min-cosine.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from itertools import islice
+from typing import List
+
+import numpy as np
+
+from config import EMBED_BACKEND, EMBED_BATCH_SIZE
+from .document_loader import iter_document_files, iter_file_docs, doc_text
+from .embeddings import EMBED_BACKENDS, load_embedder, _encode
+
+SAMPLE_QUESTIONS = [
+    "What is retrieval augmented generation?",
+    "Who is the author of this document?",
+    "Summarize the main findings.",
+    "How does the system handle errors?",
+]
+
+
+def sample_texts(limit: int) -> List[str]:
+    texts = list(SAMPLE_QUESTIONS)
+    per_file = max(1, limit // max(1, len(iter_document_files())))
+    for path in iter_document_files():
+        texts.extend(doc_text(doc) for doc in islice(iter_file_docs(path), per_file))
+    return texts[:limit]
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True).clip(min=1e-12)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True).clip(min=1e-12)
+    return (a * b).sum(axis=1)
+
+
+def query_latency_ms(model, queries: List[str], repeat: int = 5) -> float:
+    """Median latency of embedding one query at a time."""
+    model.encode(queries[:1])  # warm-up
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            model.encode([query])
+            timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.embedding_parity",
+        description="Compare an embedding backend with the PyTorch backend.",
+    )
+    parser.add_argument(
+        "--backend", choices=[b for b in EMBED_BACKENDS if b != "torch"],
+        default=EMBED_BACKEND if EMBED_BACKEND != "torch" else "onnx-int8",
+    )
+    parser.add_argument("--samples", type=int, default=200, help="texts to compare (default: 200)")
+    parser.add_argument(
+        "--min-cosine", type=float, default=0.95,
+        help="fail if any text's cosine similarity is lower (default: 0.95)",
+    )
+    args = parser.parse_args(argv)
+
+    texts = sample_texts(args.samples)
+    if not texts:
+        print("[ERROR] No texts to compare.")
+        return 1
+
+    reference_model = load_embedder("torch")
+    try:
+        candidate_model = load_embedder(args.backend)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    timings = {}
+    vectors = {}
+    for name, model in (("torch", reference_model), (args.backend, candidate_model)):
+        started = time.perf_counter()
+        vectors[name] = _encode(texts, EMBED_BATCH_SIZE, model=model)
+        timings[name] = time.perf_counter() - started
+
+    cosines = cosine_rows(vectors["torch"], vectors[args.backend])
+    worst = int(np.argmin(cosines))
+
+    print(f"Texts compared:   {len(texts)}")
+    print(
+        f"Cosine vs torch:  mean {cosines.mean():.5f} | p1 {np.percentile(cosines, 1):.5f} "
+        f"| min {cosines.min():.5f}"
+    )
+    print(f"Worst text:       {texts[worst][:80]!r}")
+    for name in ("torch", args.backend):
+        model = reference_model if name == "torch" else candidate_model
+        print(
+            f"{name:<17} {len(texts) / timings[name]:8.1f} texts/s batched | "
+            f"{query_latency_ms(model, SAMPLE_QUESTIONS):6.1f} ms per query (p50)"
+        )
+
+    if cosines.min() < args.min_cosine:
+        print(f"[WARNING] Parity check failed: min cosine {cosines.min():.5f} < {args.min_cosine}")
+        return 1
+    print("[DEBUG] Parity check passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+from config import EMBED_WORKERS, EMBED_THREADS_PER_WORKER, EMBED_BACKEND, EMBED_BATCH_SIZE
+
+# Kept light on purpose: worker processes import this module before
+# their thread limits are set, so torch / the model load in _init_worker.
+
+_worker_model = None
+
+
+def _init_worker(threads: int, backend: str) -> None:
+    global _worker_model
+
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    # One pool process = one tokenizer thread; parallelism comes from the pool
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    from .embeddings import load_embedder
+
+    _worker_model = load_embedder(backend, threads)
+
+
+def _embed_task(texts: List[str], batch_size: int) -> np.ndarray:
+    from .embeddings import _encode
+
+    return _encode(texts, batch_size, model=_worker_model)
+
+
+class PendingEmbeddings:
+    """
+    Result handle of EmbeddingPool.submit(). result() blocks until the
+    cache misses are embedded and returns the (n x dim) float32 matrix,
+    rows in the order the texts were submitted.
+    """
+
+    def __init__(self, texts: List[str], lookup, future: Future | None):
+        self._count = len(texts)
+        self._lookup = lookup
+        self._future = future
+        self._result: np.ndarray | None = None
+
+    def result(self) -> np.ndarray:
+        if self._result is None:
+            from .embeddings import merge_computed
+
+            cache, keys, embeddings, missing = self._lookup
+            if self._future is not None:
+                embeddings = merge_computed(
+                    cache, keys, embeddings, missing, self._future.result(), self._count
+                )
+            self._result = embeddings
+        return self._result
+
+
+class EmbeddingPool:
+    """
+    Embeds text batches on `workers` processes, each holding its own
+    model and pinned to `threads_per_worker` threads, so throughput
+    scales with cores instead of fighting over one torch thread pool.
+
+    - Backpressure: submit() blocks while max_in_flight batches are
+      being embedded, so producers can't queue unbounded text.
+    - Ordered results: map() yields matrices in submission order.
+    - The embedding cache is consulted in this process; only misses
+      are shipped to the workers.
+    """
+
+    def __init__(
+        self,
+        workers: int = EMBED_WORKERS,
+        threads_per_worker: int = EMBED_THREADS_PER_WORKER,
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_in_flight: int | None = None,
+        backend: str = EMBED_BACKEND,
+    ):
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // self.workers
+        )
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+
+        # spawn, not fork: forking a process with live torch / OpenMP
+        # thread pools can deadlock the children
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, backend),
+        )
+
+    def submit(self, texts: List[str]) -> PendingEmbeddings:
+        from .embeddings import lookup_cached
+
+        texts = list(texts)
+        lookup = lookup_cached(texts)
+        missing = lookup[3]
+        if not missing:
+            return PendingEmbeddings(texts, lookup, None)
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(
+                _embed_task, [texts[i] for i in missing], self.batch_size
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return PendingEmbeddings(texts, lookup, future)
+
+    def map(self, batches: Iterable[List[str]]) -> Iterator[np.ndarray]:
+        """
+        Embeds every batch, keeping up to max_in_flight of them in the
+        pool, and yields their matrices in input order.
+        """
+        from collections import deque
+
+        pending: deque = deque()
+        for texts in batches:
+            pending.append(self.submit(texts))
+            if len(pending) >= self.max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,12 +1,253 @@
-from sentence_transformers import SentenceTransformer
+from __future__ import annotations
 from functools import lru_cache
-from config import EMBED_MODEL
+from typing import TYPE_CHECKING
+import numpy as np
+import re
+import threading
+from pathlib import Path
+from config import (
+    EMBED_MODEL,
+    EMBED_BACKEND,
+    EMBED_ONNX_QUANTIZATION,
+    EMBED_ONNX_DIR,
+    EMBED_BATCH_SIZE,
+    QUERY_EMBED_CACHE_SIZE,
+)
+from .embedding_cache import get_embedding_cache, text_key, normalize_text
+
+# sentence_transformers pulls in torch (seconds): imported on first model load
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def embedder_id(backend: str = EMBED_BACKEND) -> str:
+    """
+    Identifies the vectors a backend produces: ONNX / int8 vectors are
+    close to, but not bit-identical with, the PyTorch ones.
+    """
+    if backend == "torch":
+        return EMBED_MODEL
+    if backend == "onnx-int8":
+        return f"{EMBED_MODEL}@onnx-qint8-{EMBED_ONNX_QUANTIZATION}"
+    return f"{EMBED_MODEL}@{backend}"
+
+def _onnx_model_dir() -> Path:
+    return EMBED_ONNX_DIR / re.sub(r"[^A-Za-z0-9._-]+", "_", EMBED_MODEL)
+
+def _onnx_session_kwargs(threads: int | None) -> dict:
+    if not threads:
+        return {}
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return {"session_options": options}
+
+def _load_onnx(quantized: bool, threads: int | None = None) -> SentenceTransformer:
+    """
+    Loads EMBED_MODEL on ONNX Runtime. The graph is exported (and
+    quantized) on first use and saved under EMBED_ONNX_DIR, so later
+    starts just load the .onnx file.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = _onnx_model_dir()
+    session_kwargs = _onnx_session_kwargs(threads)
+    if not (model_dir / "onnx" / "model.onnx").exists():
+        print(f"[DEBUG] Exporting {EMBED_MODEL} to ONNX: {model_dir}")
+        model = SentenceTransformer(EMBED_MODEL, backend="onnx", model_kwargs=session_kwargs)
+        model.save_pretrained(str(model_dir))
+        if not quantized:
+            return model
+
+    if not quantized:
+        return SentenceTransformer(str(model_dir), backend="onnx", model_kwargs=session_kwargs)
+
+    file_name = f"onnx/model_qint8_{EMBED_ONNX_QUANTIZATION}.onnx"
+    if not (model_dir / file_name).exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        print(f"[DEBUG] Quantizing {EMBED_MODEL} to int8 ({EMBED_ONNX_QUANTIZATION})")
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(str(model_dir), backend="onnx"),
+            EMBED_ONNX_QUANTIZATION,
+            str(model_dir),
+            file_suffix=f"qint8_{EMBED_ONNX_QUANTIZATION}",
+        )
+
+    return SentenceTransformer(
+        str(model_dir),
+        backend="onnx",
+        model_kwargs={"file_name": file_name, **session_kwargs},
+    )
+
+@lru_cache(maxsize=None)
+def load_embedder(backend: str = EMBED_BACKEND, threads: int | None = None) -> SentenceTransformer:
+    """
+    EMBED_MODEL on the given backend (see EMBED_BACKEND).
+    threads caps ONNX Runtime's intra-op threads (torch threads are set
+    process-wide with torch.set_num_threads).
+    If an ONNX backend can't be loaded (e.g. optimum missing) this
+    raises: falling back to PyTorch would store torch vectors under the
+    ONNX embedder_id() in the embedding cache and the index manifest.
+    """
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND '{backend}', expected one of {EMBED_BACKENDS}")
+
+    if backend != "torch":
+        try:
+            return _load_onnx(quantized=backend == "onnx-int8", threads=threads)
+        except Exception as e:
+            raise RuntimeError(
+                f"Could not load the {backend} embedding backend (set EMBED_BACKEND=torch "
+                f"or install optimum[onnxruntime]): {e}"
+            ) from e
+
+    from sentence_transformers import SentenceTransformer
 
-@lru_cache(maxsize=1)
-def get_embedder():
     return SentenceTransformer(EMBED_MODEL)
 
-def embed_texts(texts: list[str]):
-    model = get_embedder()
-    embeddings = model.encode(texts, convert_to_numpy=True)  # <--- FORCE NUMPY
-    return embeddings.tolist()  # <--- RETURN pure Python lists
+# lru_cache does not stop two threads (warm-up + first request) from
+# both loading the model
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    with _embedder_lock:
+        return load_embedder(EMBED_BACKEND)
+
+def _encode(texts: list[str], batch_size: int, model=None) -> np.ndarray:
+    """
+    Encodes texts in batches of `batch_size`. SentenceTransformer.encode()
+    already sorts the texts by length, so each batch pads to a similar
+    length, and returns the rows in input order.
+    """
+    model = model or get_embedder()
+    return model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,  # <--- FORCE NUMPY
+    )
+
+def lookup_cached(texts: list[str]):
+    """
+    Embedding-cache lookup shared by embed_texts() and the embedding pool.
+    Returns (cache, keys, embeddings, missing): embeddings holds the hits
+    (None if nothing is cached yet), missing the positions to compute.
+    """
+    cache = get_embedding_cache(embedder_id())
+    if cache is None:
+        return None, None, None, list(range(len(texts)))
+
+    keys = [text_key(text) for text in texts]
+    embeddings, missing = cache.get_many(keys)
+    return cache, keys, embeddings, missing
+
+def merge_computed(cache, keys, embeddings, missing, computed: np.ndarray, count: int) -> np.ndarray:
+    """
+    Stores freshly computed vectors in the cache and fills them into
+    the positions lookup_cached() reported as missing.
+    """
+    if cache is not None:
+        cache.put_many([keys[i] for i in missing], computed)
+    if embeddings is None:
+        embeddings = np.empty((count, computed.shape[1]), dtype=np.float32)
+    embeddings[missing] = computed
+    return embeddings
+
+def embed_array(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    Embeds texts (see _encode) into a C-contiguous (n x dim) float32
+    matrix, the format used everywhere inside the app; only hand it to
+    code that needs Python lists at the very last boundary.
+    With EMBED_CACHE on, vectors of texts embedded before are read from
+    the embedding cache and only the misses reach the model.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    cache, keys, embeddings, missing = lookup_cached(texts)
+    if missing:
+        computed = _encode([texts[i] for i in missing], batch_size)
+        embeddings = merge_computed(cache, keys, embeddings, missing, computed, len(texts))
+
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+def embed_texts(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> list[list[float]]:
+    """
+    embed_array() as nested Python lists, for Chroma's EmbeddingFunction
+    interface (it rejects arrays there).
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    return embed_array(texts, batch_size).tolist()  # <--- RETURN pure Python lists
+
+def iter_embedded_batches(docs: list[dict], embeddings=None, batch_size: int = 0, pipeline: bool = True):
+    """
+    Splits docs ({"text": ...} dicts) into batches of batch_size and
+    yields (batch, (len(batch) x dim) float32 matrix).
+    embeddings: precomputed rows for docs, sliced instead of embedding.
+    With pipeline, batch N+1 is embedded on a background thread while
+    the caller writes batch N.
+    """
+    size = batch_size if batch_size > 0 else max(1, len(docs))
+    batches = [docs[start : start + size] for start in range(0, len(docs), size)]
+
+    if embeddings is not None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        for n, batch in enumerate(batches):
+            yield batch, embeddings[n * size : n * size + len(batch)]
+        return
+
+    if not pipeline or len(batches) <= 1:
+        for batch in batches:
+            yield batch, embed_array([d["text"] for d in batch])
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-next") as executor:
+        pending = executor.submit(embed_array, [d["text"] for d in batches[0]])
+        for n, batch in enumerate(batches):
+            vectors = pending.result()
+            if n + 1 < len(batches):
+                pending = executor.submit(embed_array, [d["text"] for d in batches[n + 1]])
+            yield batch, vectors
+
+def _embed_queries(queries: list[str]) -> np.ndarray:
+    # Straight to the model: one-off questions would only fill the
+    # embedding cache, which is for chunk texts
+    return np.ascontiguousarray(_encode(queries, EMBED_BATCH_SIZE), dtype=np.float32)
+
+@lru_cache(maxsize=QUERY_EMBED_CACHE_SIZE)
+def _embed_normalized_query(query: str) -> np.ndarray:
+    vector = _embed_queries([query])[0]
+    # Shared by every caller of the same query: make it immutable
+    vector.flags.writeable = False
+    return vector
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    Embedding of a search query as a read-only float32 vector.
+    Recent queries are kept in an in-memory LRU, so asking the same
+    question again costs no model call; they never go to the embedding
+    cache on disk.
+    """
+    return _embed_normalized_query(normalize_text(query))
+
+def embed_queries(queries: list[str]) -> np.ndarray:
+    """
+    Embeddings of many search queries as one (n x dim) float32 matrix,
+    from batched model calls (the same vectors as embed_query()).
+    """
+    if not queries:
+        return np.empty((0, 0), dtype=np.float32)
+    return _embed_queries([normalize_text(query) for query in queries])
+
+def embedding_cache_stats() -> dict:
+    """Hit/miss counters and size of the embedding cache ({} if disabled)."""
+    cache = get_embedding_cache(embedder_id())
+    return cache.stats() if cache is not None else {}
@@ -0,0 +1,477 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from config import (
+    VECTOR_DB_DIR,
+    EMBED_REDUCED_DIM,
+    STORE_WRITE_BATCH_SIZE,
+    STORE_PIPELINE_EMBEDDING,
+    LEXICAL_INDEX,
+)
+from .embeddings import embed_query, embed_queries, iter_embedded_batches
+from .lexical_index import LexicalIndex
+from .dedup import flagged_sources
+
+INITIAL_CAPACITY = 1024
+# Upper bound of the (queries x rows) distance matrix scored at once
+SCORE_BLOCK_FLOATS = 1 << 24
+# Ids per SQL statement (SQLite caps bound parameters)
+SQL_CHUNK = 500
+# Rows read at once when norms.npy has to be rebuilt
+NORMS_BLOCK = 65536
+
+
+def resized_npy(path: Path, array: np.ndarray | None, shape: Tuple[int, ...], dtype) -> np.memmap:
+    """
+    Replaces the .npy file at `path` with a zero-filled one of `shape`,
+    `array` (if any) copied into its start, and returns it memory-mapped.
+    """
+    tmp_path = path.with_name(f"{path.stem}.tmp.npy")
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+    if array is not None:
+        out[tuple(slice(0, n) for n in array.shape)] = array
+    out.flush()
+    del out
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r+")
+
+
+class FlatVectorStore:
+    """
+    Exact, brute-force vector store with the VectorStore interface,
+    used instead of Chroma with VECTOR_BACKEND=flat.
+
+    Files in VECTOR_DB_DIR/flat/<collection>/:
+      - vectors.npy:    float32 (capacity x dim) matrix, memory-mapped;
+                        grows by doubling, rows of deleted chunks are reused
+      - norms.npy:      float32 squared L2 norm of every row, memory-mapped
+      - chunks.sqlite3: id, text, source and metadata (JSON) of every
+                        stored vector, keyed by its matrix row
+      - lexical.sqlite3: BM25 index of the texts (see lexical_index.py)
+
+    A vector is flushed before its chunk row is committed, so a crash can
+    lose writes but never expose a chunk without its vector.
+    Opening the store reads the row numbers from SQLite only (the matrix
+    stays on disk until searched); ids are looked up in SQLite, and the
+    only per-row state in memory is one "row in use" flag.
+    Search is exact top-k by L2 distance (Chroma's default space) with
+    one matrix multiply per block of queries and np.argpartition.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        directory: Path | None = None,
+        lexical: bool = LEXICAL_INDEX,
+    ):
+        self.collection_name = collection_name
+        self.directory = Path(directory) if directory else VECTOR_DB_DIR / "flat" / collection_name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+        if EMBED_REDUCED_DIM:
+            print("[WARNING] EMBED_REDUCED_DIM only applies to the Chroma backend; storing full vectors.")
+
+        self._db = sqlite3.connect(self.directory / "chunks.sqlite3", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT NOT NULL, "
+            "source TEXT, metadata TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        # Files flagged in a chunk's metadata besides its 'source' (see dedup.py)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_files ("
+            "source TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (source, id)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunk_files_id ON chunk_files (id)")
+        self._db.commit()
+
+        self.dim: int | None = None
+        self.capacity = 0
+        self._vectors: np.memmap | None = None
+        self._sq_norms: np.memmap | None = None
+        self._valid = np.zeros(0, dtype=bool)
+        # Rows [0, _size) may hold vectors; everything above is unused
+        self._size = 0
+        self._count = 0
+        self._load()
+
+        # BM25 index of the chunk texts, updated with every write
+        self.lexical: LexicalIndex | None = None
+        if lexical:
+            self.lexical = LexicalIndex(self.directory / "lexical.sqlite3")
+            self.lexical.sync(self.count(), self._iter_texts)
+
+    # ------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------
+    @property
+    def _vectors_path(self) -> Path:
+        return self.directory / "vectors.npy"
+
+    @property
+    def _norms_path(self) -> Path:
+        return self.directory / "norms.npy"
+
+    def _load(self) -> None:
+        if self._vectors_path.exists():
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            self.capacity, self.dim = self._vectors.shape
+
+        rows = np.fromiter((row for (row,) in self._db.execute("SELECT row FROM chunks")), dtype=np.int64)
+        if (rows >= self.capacity).any():
+            # Committed rows without a vector file behind them (lost file)
+            self._db.execute("DELETE FROM chunks WHERE row >= ?", (self.capacity,))
+            self._db.execute("DELETE FROM chunk_files WHERE id NOT IN (SELECT id FROM chunks)")
+            self._db.commit()
+            rows = rows[rows < self.capacity]
+
+        self._valid = np.zeros(self.capacity, dtype=bool)
+        self._valid[rows] = True
+        self._count = len(rows)
+        self._size = int(rows.max()) + 1 if len(rows) else 0
+        if self._vectors is not None:
+            self._sq_norms = self._load_norms()
+
+    def _load_norms(self) -> np.memmap:
+        if self._norms_path.exists():
+            norms = np.load(self._norms_path, mmap_mode="r+")
+            if norms.shape == (self.capacity,):
+                return norms
+        # Missing (store written before norms.npy existed) or left behind
+        # by a crash while growing: computed once from the vectors
+        print(f"[DEBUG] Computing vector norms of '{self.collection_name}' ({self._size} rows)...")
+        norms = resized_npy(self._norms_path, None, (self.capacity,), np.float32)
+        for start in range(0, self._size, NORMS_BLOCK):
+            block = self._vectors[start : start + NORMS_BLOCK]
+            norms[start : start + len(block)] = np.einsum("ij,ij->i", block, block)
+        norms.flush()
+        return norms
+
+    def _grow(self, needed: int) -> None:
+        """Re-creates the matrix (and norms) files with at least `needed` free rows."""
+        new_capacity = max(self.capacity, INITIAL_CAPACITY)
+        while new_capacity - self._count < needed:
+            new_capacity *= 2
+
+        self._vectors = resized_npy(self._vectors_path, self._vectors, (new_capacity, self.dim), np.float32)
+        self._sq_norms = resized_npy(self._norms_path, self._sq_norms, (new_capacity,), np.float32)
+        self._valid = np.concatenate([self._valid, np.zeros(new_capacity - self.capacity, dtype=bool)])
+        self.capacity = new_capacity
+
+    # ------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------
+    def add_documents(
+        self,
+        docs: List[Dict[str, Any]],
+        embeddings=None,
+        batch_size: int = STORE_WRITE_BATCH_SIZE,
+        pipeline: bool = STORE_PIPELINE_EMBEDDING,
+    ) -> None:
+        """
+        Same contract as VectorStore.add_documents(): upserts docs
+        ({"id", "text", "metadata"}) with their embeddings (embedded
+        here if None), in batches of batch_size.
+        """
+        if not docs:
+            return
+        for batch, vectors in iter_embedded_batches(docs, embeddings, batch_size, pipeline):
+            self._upsert(batch, vectors)
+
+    def _upsert(self, docs: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        # The last occurrence of an id wins, as with Chroma's upsert
+        positions = list({d["id"]: i for i, d in enumerate(docs)}.values())
+        docs = [docs[i] for i in positions]
+        embeddings = np.asarray(embeddings, dtype=np.float32)[positions]
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match "
+                    f"collection dimensionality {self.dim}"
+                )
+
+            # Existing chunks keep their row; new ones take the lowest free rows
+            existing = dict(self._select("id, row", [d["id"] for d in docs]))
+            new_count = len(docs) - len(existing)
+            if self.capacity - self._count < new_count:
+                self._grow(new_count)
+            free = iter(np.flatnonzero(~self._valid)[:new_count].tolist())
+            rows = [existing[d["id"]] if d["id"] in existing else next(free) for d in docs]
+
+            self._write_vectors(rows, embeddings)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, text, source, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        row,
+                        d["id"],
+                        d["text"],
+                        d.get("metadata", {}).get("source"),
+                        json.dumps(d.get("metadata", {})),
+                    )
+                    for row, d in zip(rows, docs)
+                ],
+            )
+            self._write_files([(d["id"], d.get("metadata", {})) for d in docs])
+            self._db.commit()
+
+            self._valid[rows] = True
+            self._count += new_count
+            self._size = max(self._size, max(rows) + 1)
+            if self.lexical is not None:
+                self.lexical.add([d["id"] for d in docs], [d["text"] for d in docs])
+
+    def _write_vectors(self, rows: List[int], embeddings: np.ndarray) -> None:
+        """Stores vectors and their norms at their rows (flushed before the chunk rows are committed)."""
+        self._vectors[rows] = embeddings
+        self._sq_norms[rows] = np.einsum("ij,ij->i", embeddings, embeddings)
+        self._vectors.flush()
+        self._sq_norms.flush()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Merges into the stored metadata; a None value removes the key (like Chroma)."""
+        if not ids:
+            return
+        with self._lock:
+            stored = dict(self._select("id, metadata", ids))
+            updates, flagged = [], []
+            for chunk_id, changes in zip(ids, metadatas):
+                if chunk_id not in stored:
+                    continue
+                metadata = json.loads(stored[chunk_id])
+                metadata.update(changes)
+                metadata = {key: value for key, value in metadata.items() if value is not None}
+                updates.append((metadata.get("source"), json.dumps(metadata), chunk_id))
+                flagged.append((chunk_id, metadata))
+            self._db.executemany("UPDATE chunks SET source = ?, metadata = ? WHERE id = ?", updates)
+            self._write_files(flagged)
+            self._db.commit()
+
+    def _write_files(self, chunks: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Replaces the chunk_files rows of (id, metadata) pairs."""
+        self._delete_files([chunk_id for chunk_id, _ in chunks])
+        self._db.executemany(
+            "INSERT OR IGNORE INTO chunk_files (source, id) VALUES (?, ?)",
+            [(name, chunk_id) for chunk_id, metadata in chunks for name in flagged_sources(metadata)],
+        )
+
+    def _delete_files(self, ids: List[str]) -> None:
+        for start in range(0, len(ids), SQL_CHUNK):
+            part = ids[start : start + SQL_CHUNK]
+            self._db.execute(f"DELETE FROM chunk_files WHERE id IN ({','.join('?' * len(part))})", part)
+
+    def delete_documents(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            found = self._select("id, row", list(set(ids)))
+            ids = [chunk_id for chunk_id, _ in found]
+            for start in range(0, len(ids), SQL_CHUNK):
+                part = ids[start : start + SQL_CHUNK]
+                self._db.execute(
+                    f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(part))})", part
+                )
+            self._delete_files(ids)
+            self._db.commit()
+
+            self._valid[[row for _, row in found]] = False
+            self._count -= len(found)
+            if self.lexical is not None:
+                self.lexical.delete(ids)
+
+    def delete_source(self, source: str) -> None:
+        """Deletes every chunk of the given file name (its 'source' or a source flag, see dedup.py)."""
+        self.delete_documents(self.source_ids(source))
+
+    def source_ids(self, source: str) -> List[str]:
+        """Ids of the chunks of the given file name ('source' or source flag)."""
+        with self._lock:
+            return [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT id FROM chunks WHERE source = ? UNION SELECT id FROM chunk_files WHERE source = ?",
+                    (source, source),
+                )
+            ]
+
+    # ------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------
+    def count(self) -> int:
+        return self._count
+
+    def _iter_texts(self, page_size: int = 1024):
+        with self._lock:
+            rows = self._db.execute("SELECT id, text FROM chunks").fetchall()
+        for start in range(0, len(rows), page_size):
+            page = rows[start : start + page_size]
+            yield [r[0] for r in page], [r[1] for r in page]
+
+    def get_documents(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """Stored chunks ({"id", "text", "metadata"}) of ids, in that order; unknown ids are skipped."""
+        with self._lock:
+            found = {
+                chunk_id: {"id": chunk_id, "text": text, "metadata": json.loads(metadata)}
+                for chunk_id, text, metadata in self._select("id, text, metadata", ids)
+            }
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def existing_ids(self, ids: List[str]) -> List[str]:
+        """The ids that are stored."""
+        with self._lock:
+            found = {row[0] for row in self._select("id", ids)}
+        return [chunk_id for chunk_id in ids if chunk_id in found]
+
+    def _select(self, columns: str, ids: List[str], key: str = "id") -> List[tuple]:
+        out: List[tuple] = []
+        for start in range(0, len(ids), SQL_CHUNK):
+            part = ids[start : start + SQL_CHUNK]
+            out.extend(
+                self._db.execute(
+                    f"SELECT {columns} FROM chunks WHERE {key} IN ({','.join('?' * len(part))})",
+                    part,
+                )
+            )
+        return out
+
+    def _top_k(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact k nearest rows of every query: (rows, squared L2 distances),
+        both (m x k), nearest first.
+        """
+        k = min(k, self._count)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0))
+
+        size = self._size
+        matrix = self._vectors[:size]
+        invalid = ~self._valid[:size]
+        block = max(1, SCORE_BLOCK_FLOATS // size)
+
+        all_rows, all_distances = [], []
+        for start in range(0, len(queries), block):
+            q = queries[start : start + block]
+            # ||v - q||^2 = ||v||^2 - 2 v.q + ||q||^2 (the last term added after ranking)
+            distances = self._sq_norms[:size] - 2.0 * (q @ matrix.T)
+            distances[:, invalid] = np.inf
+            rows = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            top = np.take_along_axis(distances, rows, axis=1)
+            order = np.argsort(top, axis=1)
+            all_rows.append(np.take_along_axis(rows, order, axis=1))
+            all_distances.append(
+                np.take_along_axis(top, order, axis=1) + np.einsum("ij,ij->i", q, q)[:, None]
+            )
+        return np.vstack(all_rows), np.vstack(all_distances)
+
+    def query(self, query_embeddings: np.ndarray, k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Batched search: one result list ({"id", "text", "metadata",
+        "distance"}, nearest first, squared L2 distance as with Chroma)
+        per row of the (m x dim) query matrix.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        with self._lock:
+            if self.dim is None:
+                return [[] for _ in range(len(queries))]
+            rows, distances = self._top_k(queries, k)
+            wanted = sorted(set(rows.ravel().tolist()))
+            chunks = {
+                row: {"id": chunk_id, "text": text, "metadata": json.loads(metadata)}
+                for row, chunk_id, text, metadata in self._select(
+                    "row, id, text, metadata", wanted, key="row"
+                )
+            }
+        return [
+            [
+                {**chunks[row], "distance": float(distance)}
+                for row, distance in zip(query_rows, query_distances)
+                if row in chunks
+            ]
+            for query_rows, query_distances in zip(rows.tolist(), distances.tolist())
+        ]
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        query_embedding: np.ndarray | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        query_embedding: vector of `query` if the caller already has it
+        (e.g. shared between document and memory search).
+        """
+        if not query.strip():
+            return []
+
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+        return self.query(query_embedding, k)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        query_embeddings: np.ndarray | None = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        search() for many queries at once: one result list per query, in
+        order, from one batch of embeddings and one batched query().
+        query_embeddings: their (n x dim) vectors, if the caller already
+        has them. Blank queries get no results.
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        wanted = [i for i, query in enumerate(queries) if query.strip()]
+        if not wanted:
+            return results
+
+        if query_embeddings is None:
+            vectors = embed_queries([queries[i] for i in wanted])
+        else:
+            vectors = np.asarray(query_embeddings, dtype=np.float32)[wanted]
+        for i, found in zip(wanted, self.query(vectors, k)):
+            results[i] = found
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._sq_norms.flush()
+                self._vectors = self._sq_norms = None
+            self._db.close()
+            if self.lexical is not None:
+                self.lexical.close()
+
+
+class FlatMemoryStore(FlatVectorStore):
+    """MemoryStore interface on the flat backend."""
+
+    def __init__(self, collection_name: str = "memory", directory: Path | None = None):
+        super().__init__(collection_name, directory, lexical=False)
+
+    def add_memory(self, text: str, metadata: Dict[str, Any] | None = None) -> None:
+        if not text.strip():
+            return
+
+        metadata = metadata or {}
+        metadata.setdefault("source", "memory")
+        metadata.setdefault("kind", "user_fact")
+
+        self.add_documents([{"id": str(uuid.uuid4()), "text": text, "metadata": metadata}])
@@ -0,0 +1,166 @@
+"""
+HNSW parameter sweep on the indexed corpus:
+
+    python -m backend.hnsw_tuning --m 8,16,32 --construction-ef 100,200 --search-ef 10,50,100
+
+Samples stored vectors of a Chroma collection, holds some out as queries
+and, for every combination of M / construction_ef / search_ef, builds a
+temporary collection with those settings and reports recall@k against
+exact search, single-query p50/p99 latency, build time and the size of
+the HNSW index files. Chroma fixes search_ef when a collection is
+created, so every combination is a separate build.
+
+The fastest setting reaching --target-recall is printed as the
+environment variables to put in .env (see HNSW_PARAMS in config.py).
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Any, List
+
+import numpy as np
+
+from config import HNSW_PARAMS
+from .collection_rebuild import hnsw_metadata, CHROMA_HNSW_DEFAULTS, REBUILD_PAGE_SIZE
+from .vector_store import _persistent_client
+
+ENV_PREFIX = {"documents": "DOCS", "memory": "MEMORY"}
+
+
+def parse_ints(value: str) -> List[int]:
+    return sorted({int(v) for v in value.split(",") if v.strip()})
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> List[List[int]]:
+    """Exact k nearest corpus rows per query in Chroma's distance `space`."""
+    if space == "l2":
+        distances = (corpus * corpus).sum(axis=1) - 2.0 * (queries @ corpus.T)
+    elif space == "cosine":
+        normed = corpus / np.linalg.norm(corpus, axis=1, keepdims=True).clip(min=1e-12)
+        distances = -(queries @ normed.T)
+    else:  # "ip"
+        distances = -(queries @ corpus.T)
+    best = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return best.tolist()
+
+
+def load_vectors(collection_name: str, samples: int, queries: int):
+    collection = _persistent_client().get_collection(collection_name)
+    ids = collection.get(include=[])["ids"]
+    picked = random.Random(0).sample(ids, min(len(ids), samples + queries))
+    vectors = []
+    for start in range(0, len(picked), REBUILD_PAGE_SIZE):
+        page = collection.get(ids=picked[start : start + REBUILD_PAGE_SIZE], include=["embeddings"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    vectors = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    n_queries = min(queries, len(vectors) // 2)
+    return vectors[n_queries:], vectors[:n_queries]
+
+
+def directory_mb(paths: List[Path]) -> float:
+    return sum(f.stat().st_size for p in paths for f in p.rglob("*") if f.is_file()) / (1024 * 1024)
+
+
+def measure(client, work_dir: Path, params: Dict[str, Any], corpus, queries, truth, k) -> Dict[str, Any]:
+    before = {p for p in work_dir.iterdir() if p.is_dir()}
+    collection = client.create_collection(
+        name="hnsw_tuning", metadata=hnsw_metadata("", **params)
+    )
+    ids = [str(i) for i in range(len(corpus))]
+
+    started = time.perf_counter()
+    for start in range(0, len(corpus), REBUILD_PAGE_SIZE):
+        collection.add(
+            ids=ids[start : start + REBUILD_PAGE_SIZE],
+            embeddings=corpus[start : start + REBUILD_PAGE_SIZE],
+        )
+    build_s = time.perf_counter() - started
+
+    collection.query(query_embeddings=queries[:1], n_results=k, include=[])  # warm-up
+    timings, hits = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = collection.query(query_embeddings=query.reshape(1, -1), n_results=k, include=[])["ids"][0]
+        timings.append((time.perf_counter() - started) * 1000)
+        hits.append(len({int(i) for i in found} & set(expected)) / len(expected))
+
+    index_mb = directory_mb([p for p in work_dir.iterdir() if p.is_dir() and p not in before])
+    client.delete_collection("hnsw_tuning")
+    return {
+        **params,
+        "recall": float(np.mean(hits)),
+        "p50": float(np.percentile(timings, 50)),
+        "p99": float(np.percentile(timings, 99)),
+        "build_s": build_s,
+        "index_mb": index_mb,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.hnsw_tuning",
+        description="Sweep HNSW parameters on the indexed corpus.",
+    )
+    parser.add_argument("--collection", choices=sorted(HNSW_PARAMS), default="documents")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default=None,
+                        help="distance (default: the collection's configured space)")
+    parser.add_argument("--m", type=parse_ints, default=parse_ints("8,16,32"))
+    parser.add_argument("--construction-ef", type=parse_ints, default=parse_ints("100,200"))
+    parser.add_argument("--search-ef", type=parse_ints, default=parse_ints("10,50,100"))
+    parser.add_argument("--k", type=int, default=5, help="results per query (default: 5)")
+    parser.add_argument("--samples", type=int, default=20000, help="indexed vectors (default: 20000)")
+    parser.add_argument("--queries", type=int, default=200, help="held-out queries (default: 200)")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    space = args.space or HNSW_PARAMS[args.collection].get("space", CHROMA_HNSW_DEFAULTS["space"])
+    corpus, queries = load_vectors(args.collection, args.samples, args.queries)
+    if len(queries) == 0:
+        print(f"[ERROR] Not enough vectors in '{args.collection}': index some documents first.")
+        return 1
+    k = min(args.k, len(corpus))
+    truth = exact_top_k(corpus, queries, k, space)
+
+    import chromadb
+
+    work_dir = Path(tempfile.mkdtemp(prefix="hnsw_tuning_"))
+    results = []
+    try:
+        client = chromadb.PersistentClient(path=str(work_dir))
+        print(
+            f"'{args.collection}': {len(corpus)} vectors ({corpus.shape[1]} dims), "
+            f"{len(queries)} held-out queries, space {space}"
+        )
+        print(f"{'M':>4} {'c_ef':>5} {'s_ef':>5} {f'recall@{k}':>9} {'p50 ms':>7} {'p99 ms':>7} {'build s':>8} {'index MB':>9}")
+        for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+            params = {"space": space, "M": m, "construction_ef": construction_ef, "search_ef": search_ef}
+            row = measure(client, work_dir, params, corpus, queries, truth, k)
+            results.append(row)
+            print(
+                f"{m:>4} {construction_ef:>5} {search_ef:>5} {row['recall']:9.3f} {row['p50']:7.2f} "
+                f"{row['p99']:7.2f} {row['build_s']:8.1f} {row['index_mb']:9.1f}"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    good = [r for r in results if r["recall"] >= args.target_recall]
+    if not good:
+        print(f"[WARNING] No setting reached recall@{k} {args.target_recall}; try larger search_ef / M.")
+        return 0
+    best = min(good, key=lambda r: (r["p50"], r["index_mb"]))
+    prefix = ENV_PREFIX.get(args.collection, args.collection.upper())
+    print(f"Fastest setting with recall@{k} >= {args.target_recall}:")
+    for key in ("space", "M", "construction_ef", "search_ef"):
+        print(f"  {prefix}_HNSW_{key.upper()}={best[key]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
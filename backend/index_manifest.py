@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Any, List
+
+from config import (
+    INDEX_MANIFEST_PATH,
+    CHUNKER,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    EMBED_MODEL,
+    EMBED_BACKEND,
+    EMBED_ONNX_QUANTIZATION,
+    NEAR_DUP_DETECTION,
+    NEAR_DUP_MAX_DISTANCE,
+    VECTOR_BACKEND,
+    VECTOR_SHARDS,
+    SHARD_KEY,
+)
+
+# 5: stored chunks carry one source flag per file (see dedup.py); older
+# indexes are rebuilt, their vectors come from the embedding cache
+MANIFEST_VERSION = 5
+
+
+def file_content_hash(path: Path, block_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of the file contents, read in blocks so big PDFs are never
+    held in memory at once.
+    """
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def current_settings() -> Dict[str, Any]:
+    """
+    Settings that change the produced chunks / vectors.
+    If any of them differ from the manifest, every file is reindexed.
+    """
+    return {
+        "chunker": CHUNKER,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunk_max_tokens": CHUNK_MAX_TOKENS,
+        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "embed_model": EMBED_MODEL,
+        "embed_backend": (
+            f"{EMBED_BACKEND}-{EMBED_ONNX_QUANTIZATION}"
+            if EMBED_BACKEND == "onnx-int8"
+            else EMBED_BACKEND
+        ),
+        "near_dup": NEAR_DUP_DETECTION,
+        "near_dup_max_distance": NEAR_DUP_MAX_DISTANCE,
+        # Each backend has its own files: switching starts from an empty store
+        "vector_backend": VECTOR_BACKEND,
+        # Only when sharded, so unsharded indexes keep their manifest
+        **({"vector_shards": VECTOR_SHARDS, "shard_key": SHARD_KEY} if VECTOR_SHARDS > 1 else {}),
+    }
+
+
+class TrackedDict(dict):
+    """
+    Dict that remembers which keys were set or deleted since the last
+    save, so only those rows are written. Changes inside a value (e.g. a
+    chunk's source list) are reported with touch().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed: set[str] = set()
+        # Set when the stored rows must all be dropped first
+        self.cleared = False
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.changed.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self.changed.add(key)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        self.changed.add(key)
+        return super().pop(key, *default)
+
+    def touch(self, key: str) -> None:
+        self.changed.add(key)
+
+
+class IndexManifest:
+    """
+    Persistent record of every indexed file:
+      { name: {"path", "size", "mtime_ns", "sha256", "chunk_ids"} }
+    plus the chunk registry used for deduplication (see dedup.py).
+
+    Stored in SQLite, one row per file / chunk, so a checkpoint only
+    writes the rows that changed instead of the whole registry.
+
+    Used by index_all_documents() to only parse + embed new or changed
+    files and to delete chunks of files that were modified or removed.
+    """
+
+    def __init__(self, path: Path = INDEX_MANIFEST_PATH):
+        self.path = Path(path)
+        self.settings = current_settings()
+        self.settings_changed = False
+        self.modified = False
+        self.files = TrackedDict()
+        self.chunks = TrackedDict()
+        self._pending_hashes: Dict[str, str] = {}
+        self._legacy_path = self.path.with_suffix(".json")
+        self._load()
+
+    # ------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------
+    def _load(self) -> None:
+        if not self.path.exists():
+            if self._legacy_path.exists() and self._legacy_path != self.path:
+                self._load_legacy()
+            return
+
+        try:
+            with closing(sqlite3.connect(self.path)) as db:
+                meta = dict(db.execute("SELECT key, value FROM meta"))
+                if meta.get("version") != str(MANIFEST_VERSION):
+                    print("[WARNING] Index manifest version changed, rebuilding.")
+                    self._start_over()
+                    return
+                files = {name: json.loads(entry) for name, entry in db.execute("SELECT name, entry FROM files")}
+                chunks = {chunk_id: json.loads(entry) for chunk_id, entry in db.execute("SELECT id, entry FROM chunks")}
+                settings = json.loads(meta.get("settings", "null"))
+        except Exception as e:
+            print(f"[WARNING] Could not read index manifest, rebuilding: {e}")
+            self.path.unlink(missing_ok=True)
+            return
+
+        # Plain dict.update(): loaded rows are not changes
+        dict.update(self.files, files)
+        dict.update(self.chunks, chunks)
+        self.settings_changed = settings != self.settings
+        self.modified = self.settings_changed
+
+    def _load_legacy(self) -> None:
+        """Manifest of older versions (one JSON file): migrated on the next save()."""
+        try:
+            data = json.loads(self._legacy_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"[WARNING] Could not read index manifest, rebuilding: {e}")
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            print("[WARNING] Index manifest version changed, rebuilding.")
+            return
+
+        self.files = TrackedDict(data.get("files", {}))
+        self.chunks = TrackedDict(data.get("chunks", {}))
+        self.files.changed.update(self.files)
+        self.chunks.changed.update(self.chunks)
+        self.settings_changed = data.get("settings") != self.settings
+        self.modified = True
+
+    def _start_over(self) -> None:
+        self.files.cleared = True
+        self.chunks.cleared = True
+        self.modified = True
+
+    def save(self) -> None:
+        """
+        Writes the settings and the changed file / chunk rows in one
+        transaction. Does nothing if nothing changed since the last save.
+        """
+        pending = self.modified or self.files.changed or self.chunks.changed
+        if not pending and self.path.exists():
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as db:
+            with db:
+                self._write(db)
+
+        for entries in (self.files, self.chunks):
+            entries.changed.clear()
+            entries.cleared = False
+        if self._legacy_path != self.path:
+            self._legacy_path.unlink(missing_ok=True)
+        self.settings_changed = False
+        self.modified = False
+
+    def _write(self, db: sqlite3.Connection) -> None:
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+        db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("version", str(MANIFEST_VERSION)), ("settings", json.dumps(self.settings))],
+        )
+        self._write_rows(db, "files", "name", self.files)
+        self._write_rows(db, "chunks", "id", self.chunks)
+
+    @staticmethod
+    def _write_rows(db: sqlite3.Connection, table: str, key: str, entries: TrackedDict) -> None:
+        if entries.cleared:
+            db.execute(f"DELETE FROM {table}")
+        changed = sorted(entries.changed)
+        db.executemany(
+            f"INSERT OR REPLACE INTO {table} ({key}, entry) VALUES (?, ?)",
+            [(name, json.dumps(entries[name])) for name in changed if name in entries],
+        )
+        db.executemany(
+            f"DELETE FROM {table} WHERE {key} = ?",
+            [(name,) for name in changed if name not in entries],
+        )
+
+    # ------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------
+    def names(self) -> List[str]:
+        return list(self.files.keys())
+
+    def chunk_ids(self, name: str) -> List[str]:
+        entry = self.files.get(name)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def total_chunks(self) -> int:
+        """Number of distinct chunks stored (duplicates count once)."""
+        return len(self.chunks)
+
+    def needs_indexing(self, path: Path) -> bool:
+        """
+        True if the file is new, changed, or indexed with other settings.
+
+        Fast path: same size + mtime -> unchanged, no hashing.
+        If only the mtime moved (e.g. file re-uploaded with the same bytes),
+        the content hash decides.
+        """
+        entry = self.files.get(path.name)
+        if entry is None or self.settings_changed:
+            return True
+
+        stat = path.stat()
+        if stat.st_size != entry["size"]:
+            return True
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return False
+
+        content_hash = file_content_hash(path)
+        if content_hash != entry["sha256"]:
+            self._pending_hashes[path.name] = content_hash
+            return True
+
+        # Same bytes, just touched: remember the new mtime
+        entry["mtime_ns"] = stat.st_mtime_ns
+        self.files.touch(path.name)
+        return False
+
+    # ------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------
+    def record(self, path: Path, chunk_ids: List[str]) -> None:
+        stat = path.stat()
+        content_hash = self._pending_hashes.pop(path.name, None) or file_content_hash(path)
+        self.files[path.name] = {
+            "path": str(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash,
+            "chunk_ids": list(chunk_ids),
+        }
+
+    def reset(self) -> List[str]:
+        """
+        Forgets every file and chunk, e.g. after a settings change.
+        Returns the chunk IDs that were indexed so they can be deleted.
+        """
+        chunk_ids = list(self.chunks.keys())
+        self.files = TrackedDict()
+        self.chunks = TrackedDict()
+        self._pending_hashes = {}
+        self._start_over()
+        return chunk_ids
+
+    def remove(self, name: str) -> None:
+        self.files.pop(name, None)
+        self._pending_hashes.pop(name, None)
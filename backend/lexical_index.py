@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from config import RRF_K
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Ids per SQL statement (SQLite caps bound parameters)
+SQL_CHUNK = 500
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset(
+    """
+    a about an and are as at be been but by can could did do does for from had has
+    have how i if in into is it its me my not of on or our please she so than that
+    the their them then there these they this those to tell us was we were what
+    when where which who whom why will with would you your
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    Persistent BM25 inverted index over the chunk texts of a collection,
+    kept in sync by the store on every write / delete (so it is built
+    during ingestion).
+
+    SQLite file with:
+      - docs:     doc ordinal, chunk id, token length, its distinct terms
+      - postings: (term, doc, term frequency), clustered by term, so a
+                  query reads one contiguous range per term
+    Document lengths live in memory as a NumPy array for scoring. The
+    file can be shared with another process (e.g. `python -m
+    backend.ingest` while the app is open): every read / write runs in
+    one SQLite transaction and first reloads the in-memory maps if
+    another connection committed since (PRAGMA data_version).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "doc INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL, terms TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, doc)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+        self._data_version: int | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._docs: Dict[str, int] = {}
+        self._ids: Dict[int, str] = {}
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._total_length = 0
+        self._next_doc = 0
+
+    def _refresh(self) -> None:
+        """Reloads the maps if the file changed under them (call inside a transaction)."""
+        # The first read pins the transaction's snapshot, so the version
+        # and the rows read after it agree
+        self._db.execute("SELECT 1 FROM docs LIMIT 1").fetchall()
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._reset()
+        for doc, chunk_id, length in self._db.execute("SELECT doc, id, length FROM docs"):
+            self._docs[chunk_id] = doc
+            self._ids[doc] = chunk_id
+            self._set_length(doc, length)
+            self._next_doc = max(self._next_doc, doc + 1)
+        self._data_version = version
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        """
+        One SQLite transaction on fresh maps. Writes take the write lock
+        up front (BEGIN IMMEDIATE), so no other process can take the same
+        doc ordinals in between.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                self._refresh()
+                yield
+            except BaseException:
+                self._db.rollback()
+                if write:
+                    # The maps may hold rows that were rolled back
+                    self._data_version = None
+                raise
+            self._db.commit()
+
+    def _set_length(self, doc: int, length: int) -> None:
+        if doc >= len(self._lengths):
+            grown = np.zeros(max(doc + 1, 2 * len(self._lengths), 1024), dtype=np.float32)
+            grown[: len(self._lengths)] = self._lengths
+            self._lengths = grown
+        self._total_length += length - int(self._lengths[doc])
+        self._lengths[doc] = length
+
+    def count(self) -> int:
+        with self._transaction():
+            return len(self._docs)
+
+    # ------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        """Indexes (or re-indexes) chunks."""
+        with self._transaction(write=True):
+            self._delete(ids)
+            docs, postings = [], []
+            for chunk_id, text in zip(ids, texts):
+                doc = self._next_doc
+                self._next_doc += 1
+                tokens = tokenize(text)
+                counts = Counter(tokens)
+                docs.append((doc, chunk_id, len(tokens), " ".join(counts)))
+                postings.extend((term, doc, tf) for term, tf in counts.items())
+                self._docs[chunk_id] = doc
+                self._ids[doc] = chunk_id
+                self._set_length(doc, len(tokens))
+            self._db.executemany("INSERT INTO docs (doc, id, length, terms) VALUES (?, ?, ?, ?)", docs)
+            self._db.executemany("INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)", postings)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._transaction(write=True):
+            self._delete(ids)
+
+    def _delete(self, ids: Iterable[str]) -> None:
+        docs = [self._docs[i] for i in set(ids) if i in self._docs]
+        for start in range(0, len(docs), SQL_CHUNK):
+            part = docs[start : start + SQL_CHUNK]
+            marks = ",".join("?" * len(part))
+            rows = self._db.execute(f"SELECT doc, terms FROM docs WHERE doc IN ({marks})", part).fetchall()
+            self._db.executemany(
+                "DELETE FROM postings WHERE term = ? AND doc = ?",
+                [(term, doc) for doc, terms in rows for term in terms.split()],
+            )
+            self._db.execute(f"DELETE FROM docs WHERE doc IN ({marks})", part)
+        for doc in docs:
+            del self._docs[self._ids.pop(doc)]
+            self._set_length(doc, 0)
+
+    def clear(self) -> None:
+        with self._transaction(write=True):
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM docs")
+            self._reset()
+
+    def sync(self, count: int, iter_texts: Callable[[], Iterable[Tuple[List[str], List[str]]]]) -> None:
+        """
+        Rebuilds the index from the store's texts if it does not hold
+        `count` chunks (an index from before this feature, or a crash
+        between the store write and the index write).
+        """
+        if self.count() == count:
+            return
+        print(f"[DEBUG] Building the BM25 index '{self.path.name}' for {count} chunks...")
+        with self._lock:
+            self.clear()
+            for ids, texts in iter_texts():
+                self.add(ids, texts)
+
+    # ------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float, int]]:
+        """
+        Top-k chunks by BM25: (chunk id, score, number of distinct query
+        terms the chunk contains), best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._transaction():
+            n = len(self._docs)
+            if not terms or n == 0:
+                return []
+            avg_length = self._total_length / n
+
+            all_docs, all_scores = [], []
+            for term in terms:
+                rows = self._db.execute("SELECT doc, tf FROM postings WHERE term = ?", (term,)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+                postings = np.asarray(rows, dtype=np.int64)
+                docs, tf = postings[:, 0], postings[:, 1].astype(np.float32)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[docs] / avg_length)
+                all_docs.append(docs)
+                all_scores.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+            if not all_docs:
+                return []
+
+            docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+            matched = np.bincount(inverse)
+            k = min(k, len(docs))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [
+                (self._ids[int(docs[i])], float(scores[i]), int(matched[i])) for i in best
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """
+    Merges ranked id lists: every id scores sum(1 / (k + rank)) over the
+    lists it appears in (rank from 1). Returns ids by fused score.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])
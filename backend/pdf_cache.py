@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Iterable
+
+from config import PDF_TEXT_CACHE, PDF_TEXT_CACHE_DIR
+from .index_manifest import file_content_hash
+
+# Bump when the way page text is extracted changes (not the chunking),
+# so old cache entries are ignored and eventually pruned.
+EXTRACTOR_REVISION = 1
+
+
+@lru_cache(maxsize=1)
+def extractor_version() -> str:
+    try:
+        import PyPDF2
+
+        library = f"pypdf2-{PyPDF2.__version__}"
+    except ImportError:
+        library = "pypdf2-missing"
+    return f"{library}-r{EXTRACTOR_REVISION}"
+
+
+@lru_cache(maxsize=256)
+def _hash_for(path_str: str, size: int, mtime_ns: int) -> str:
+    return file_content_hash(Path(path_str))
+
+
+def _cache_path(path: Path) -> Path:
+    stat = path.stat()
+    content_hash = _hash_for(str(path), stat.st_size, stat.st_mtime_ns)
+    return PDF_TEXT_CACHE_DIR / f"{content_hash}.{extractor_version()}.json"
+
+
+def is_cached(path: Path) -> bool:
+    if not PDF_TEXT_CACHE:
+        return False
+    try:
+        return _cache_path(path).exists()
+    except OSError:
+        return False
+
+
+def load_pages(path: Path) -> List[str] | None:
+    """
+    Cached page texts of a PDF, or None if it was never extracted
+    with the current extractor (or the cache is disabled).
+    """
+    if not PDF_TEXT_CACHE:
+        return None
+    try:
+        cache_path = _cache_path(path)
+        if not cache_path.exists():
+            return None
+        return json.loads(cache_path.read_text(encoding="utf-8"))["pages"]
+    except Exception as e:
+        print(f"[WARNING] Ignoring unreadable PDF text cache for '{path.name}': {e}")
+        return None
+
+
+def store_pages(path: Path, pages: List[str]) -> None:
+    """
+    Atomic write (temp file + replace), safe with several parser processes.
+    """
+    if not PDF_TEXT_CACHE:
+        return
+    try:
+        cache_path = _cache_path(path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"pages": pages}), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"[WARNING] Could not cache PDF text for '{path.name}': {e}")
+
+
+def prune(keep_hashes: Iterable[str]) -> int:
+    """
+    Deletes cache entries of files that are no longer indexed and of
+    older extractor versions. Returns the number of removed entries.
+    """
+    if not PDF_TEXT_CACHE_DIR.exists():
+        return 0
+
+    keep = set(keep_hashes)
+    suffix = f".{extractor_version()}.json"
+    removed = 0
+    for entry in PDF_TEXT_CACHE_DIR.iterdir():
+        content_hash = entry.name.split(".", 1)[0]
+        if entry.name.endswith(suffix) and content_hash in keep:
+            continue
+        try:
+            entry.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from config import (
+    VECTOR_DB_DIR,
+    LEXICAL_INDEX,
+    PQ_SUBVECTORS,
+    PQ_TRAIN_MIN,
+    PQ_TRAIN_SAMPLES,
+    PQ_RERANK,
+)
+from .flat_index import FlatVectorStore, SCORE_BLOCK_FLOATS, resized_npy
+
+# Centroids per sub-vector codebook (codes are one byte each)
+CODEBOOK_SIZE = 256
+KMEANS_ITERATIONS = 20
+# Rows encoded / read from disk at once
+ENCODE_BLOCK = 8192
+
+
+class ProductQuantizer:
+    """
+    Product quantizer: the vector is split into `subvectors` equal parts
+    and each part is replaced by the index of its nearest centroid in
+    that part's codebook, so a vector is stored in `subvectors` bytes.
+
+    Distances to a query are computed asymmetrically (ADC): the query
+    stays exact, one (subvectors x 256) table of squared distances to
+    the centroids is built per query, and a code's distance is the sum
+    of its table entries.
+    """
+
+    def __init__(self, codebooks: np.ndarray):
+        # (subvectors x CODEBOOK_SIZE x sub-vector dim)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+
+    @property
+    def subvectors(self) -> int:
+        return self.codebooks.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.codebooks.shape[0] * self.codebooks.shape[2]
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n x dim) -> (subvectors x n x sub-vector dim)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.subvectors, -1)
+        return vectors.transpose(1, 0, 2)
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, subvectors: int, seed: int = 0) -> "ProductQuantizer":
+        """Trains one k-means codebook per sub-vector on an (n x dim) sample."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) < CODEBOOK_SIZE:
+            raise ValueError(f"product quantization needs at least {CODEBOOK_SIZE} training vectors")
+        if vectors.shape[1] % subvectors:
+            raise ValueError(f"{vectors.shape[1]} dimensions do not split into {subvectors} sub-vectors")
+
+        rng = np.random.default_rng(seed)
+        parts = vectors.reshape(len(vectors), subvectors, -1).transpose(1, 0, 2)
+        codebooks = np.empty((subvectors, CODEBOOK_SIZE, parts.shape[2]), dtype=np.float32)
+        for j, part in enumerate(parts):
+            part = np.ascontiguousarray(part)
+            centroids = part[rng.choice(len(part), CODEBOOK_SIZE, replace=False)].copy()
+            for _ in range(KMEANS_ITERATIONS):
+                assigned = _nearest(part, centroids)
+                counts = np.bincount(assigned, minlength=CODEBOOK_SIZE)
+                for d in range(part.shape[1]):
+                    sums = np.bincount(assigned, weights=part[:, d], minlength=CODEBOOK_SIZE)
+                    # Empty clusters keep their previous centroid
+                    np.divide(sums, counts, out=centroids[:, d], where=counts > 0, casting="unsafe")
+            codebooks[j] = centroids
+        return cls(codebooks)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """(n x dim) -> (n x subvectors) uint8 codes."""
+        parts = self._split(vectors)
+        codes = np.empty((parts.shape[1], self.subvectors), dtype=np.uint8)
+        for j, part in enumerate(parts):
+            codes[:, j] = _nearest(part, self.codebooks[j])
+        return codes
+
+    def distance_table(self, query: np.ndarray) -> np.ndarray:
+        """(subvectors x CODEBOOK_SIZE) squared distances of the query's parts to the centroids."""
+        parts = np.asarray(query, dtype=np.float32).reshape(self.subvectors, 1, -1)
+        return ((self.codebooks - parts) ** 2).sum(axis=2)
+
+    def distances(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate squared L2 distances of a query (its table) to
+        (subvectors x n) codes, i.e. codes stored one sub-vector per row.
+        """
+        out = np.zeros(codes.shape[1], dtype=np.float32)
+        for j in range(self.subvectors):
+            out += table[j].take(codes[j])
+        return out
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, codebooks=self.codebooks)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ProductQuantizer | None":
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(data["codebooks"])
+        except Exception as e:
+            print(f"[WARNING] Ignoring unreadable codebooks '{path.name}': {e}")
+            return None
+
+
+def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid of every point (blocked)."""
+    sq_centroids = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(points), dtype=np.int64)
+    block = max(1, SCORE_BLOCK_FLOATS // len(centroids))
+    for start in range(0, len(points), block):
+        part = points[start : start + block]
+        # ||p - c||^2 without the ||p||^2 term, which doesn't change the argmin
+        out[start : start + len(part)] = np.argmin(sq_centroids - 2.0 * (part @ centroids.T), axis=1)
+    return out
+
+
+class PQVectorStore(FlatVectorStore):
+    """
+    Compressed vector store with the VectorStore interface, used with
+    VECTOR_BACKEND=pq.
+
+    Same files as FlatVectorStore (in VECTOR_DB_DIR/pq/<collection>/),
+    plus:
+      - codebooks.npz: product quantizer (see ProductQuantizer)
+      - codes.npy:     uint8 (PQ_SUBVECTORS x capacity) codes, memory-mapped;
+                       stored by sub-vector so a scan reads contiguous rows
+
+    Search scans the codes only (PQ_SUBVECTORS bytes per vector instead
+    of dim x 4), keeps the PQ_RERANK best and re-ranks them with exact
+    distances to their full vectors, read from vectors.npy on disk.
+    Until the collection holds PQ_TRAIN_MIN vectors there are no
+    codebooks and search is exact; then they are trained on a background
+    thread while reads and writes go on (see train()).
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        directory: Path | None = None,
+        lexical: bool = LEXICAL_INDEX,
+        subvectors: int = PQ_SUBVECTORS,
+        train_min: int = PQ_TRAIN_MIN,
+        rerank: int = PQ_RERANK,
+    ):
+        self.subvectors = subvectors
+        self.train_min = train_min
+        self.rerank = rerank
+        self.quantizer: ProductQuantizer | None = None
+        self._codes: np.memmap | None = None
+        self._trainer: threading.Thread | None = None
+        # One training at a time; rows written while it runs, to re-encode
+        self._train_lock = threading.Lock()
+        self._written_while_training: List[int] | None = None
+        super().__init__(
+            collection_name,
+            Path(directory) if directory else VECTOR_DB_DIR / "pq" / collection_name,
+            lexical,
+        )
+        self._maybe_train()
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Vector bytes scanned (and kept in memory) per stored chunk."""
+        if self.quantizer is not None:
+            return self.quantizer.subvectors
+        return (self.dim or 0) * 4
+
+    # ------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------
+    @property
+    def _codes_path(self) -> Path:
+        return self.directory / "codes.npy"
+
+    @property
+    def _codebooks_path(self) -> Path:
+        return self.directory / "codebooks.npz"
+
+    def _load(self) -> None:
+        super()._load()
+        quantizer = ProductQuantizer.load(self._codebooks_path)
+        if quantizer is not None:
+            if quantizer.dim == self.dim and self._codes_path.exists():
+                codes = np.load(self._codes_path, mmap_mode="r+")
+                if codes.shape == (quantizer.subvectors, self.capacity):
+                    self.quantizer, self._codes = quantizer, codes
+            if self.quantizer is None:
+                print(f"[WARNING] PQ codes of '{self.collection_name}' don't match its vectors; retraining.")
+
+    def _grow(self, needed: int) -> None:
+        super()._grow(needed)
+        if self.quantizer is not None:
+            self._codes = resized_npy(
+                self._codes_path, self._codes, (self.quantizer.subvectors, self.capacity), np.uint8
+            )
+
+    # ------------------------------------------------------------
+    # Training
+    # ------------------------------------------------------------
+    def _maybe_train(self) -> None:
+        """Starts training on a background thread once the collection is big enough."""
+        if self.quantizer is not None or self.dim is None or self._count < max(self.train_min, CODEBOOK_SIZE):
+            return
+        if self._trainer is None or not self._trainer.is_alive():
+            self._trainer = threading.Thread(
+                target=self._train_in_background, name=f"pq-train-{self.collection_name}", daemon=True
+            )
+            self._trainer.start()
+
+    def _train_in_background(self) -> None:
+        try:
+            self.train()
+        except Exception as e:
+            print(f"[WARNING] PQ training of '{self.collection_name}' failed: {e}")
+
+    def _pick_subvectors(self) -> int:
+        """Largest divisor of the dimension not above the configured sub-vector count."""
+        subvectors = max(d for d in range(1, min(self.subvectors, self.dim) + 1) if self.dim % d == 0)
+        if subvectors != self.subvectors:
+            print(
+                f"[WARNING] {self.dim} dimensions do not split into {self.subvectors} "
+                f"sub-vectors; using {subvectors}."
+            )
+        return subvectors
+
+    def train(self, samples: int = PQ_TRAIN_SAMPLES) -> None:
+        """
+        (Re)trains the codebooks on a sample of the stored vectors and
+        re-encodes every row. Runs automatically (on a background thread)
+        once the collection reaches train_min vectors; call again after
+        the corpus changed a lot.
+        Fitting and encoding run outside the store lock, so writes and
+        searches go on meanwhile (with the previous codes, or exact);
+        rows written in the meantime are re-encoded when the new codes
+        are swapped in.
+        """
+        with self._train_lock:
+            with self._lock:
+                rows = np.flatnonzero(self._valid[: self._size])
+                if len(rows) < CODEBOOK_SIZE:
+                    raise ValueError(f"product quantization needs at least {CODEBOOK_SIZE} stored vectors")
+                vectors, size, capacity = self._vectors, self._size, self.capacity
+                self._written_while_training = []
+            try:
+                self._train(vectors, rows, size, capacity, samples)
+            finally:
+                with self._lock:
+                    self._written_while_training = None
+
+    def _train(self, vectors: np.ndarray, rows: np.ndarray, size: int, capacity: int, samples: int) -> None:
+        started = time.perf_counter()
+        sample = np.sort(np.random.default_rng(0).choice(rows, min(samples, len(rows)), replace=False))
+        quantizer = ProductQuantizer.fit(vectors[sample], self._pick_subvectors())
+
+        tmp_path = self.directory / "codes.training.npy"
+        codes = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.uint8, shape=(quantizer.subvectors, capacity)
+        )
+        for start in range(0, size, ENCODE_BLOCK):
+            end = min(start + ENCODE_BLOCK, size)
+            codes[:, start:end] = quantizer.encode(vectors[start:end]).T
+
+        with self._lock:
+            if self.capacity != capacity:
+                codes = resized_npy(tmp_path, codes, (quantizer.subvectors, self.capacity), np.uint8)
+            written = sorted(set(self._written_while_training))
+            if written:
+                codes[:, written] = quantizer.encode(self._vectors[written]).T
+            codes.flush()
+            del codes
+
+            # Old codebooks go first: a crash before the new ones are
+            # saved leaves no codebooks, so the next open retrains
+            # instead of mixing them with the new codes
+            self._codebooks_path.unlink(missing_ok=True)
+            self._codes = None
+            os.replace(tmp_path, self._codes_path)
+            self._codes = np.load(self._codes_path, mmap_mode="r+")
+            quantizer.save(self._codebooks_path)
+            self.quantizer = quantizer
+        print(
+            f"[DEBUG] Trained PQ codebooks for '{self.collection_name}' on {len(sample)} vectors "
+            f"in {time.perf_counter() - started:.1f}s: {quantizer.subvectors} bytes per vector "
+            f"instead of {self.dim * 4}"
+        )
+
+    # ------------------------------------------------------------
+    # Writes / search
+    # ------------------------------------------------------------
+    def _write_vectors(self, rows: List[int], embeddings: np.ndarray) -> None:
+        super()._write_vectors(rows, embeddings)
+        if self.quantizer is not None:
+            self._codes[:, rows] = self.quantizer.encode(embeddings).T
+            self._codes.flush()
+        if self._written_while_training is not None:
+            self._written_while_training.extend(rows)
+
+    def _upsert(self, docs: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        super()._upsert(docs, embeddings)
+        with self._lock:
+            self._maybe_train()
+
+    def _top_k(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        ADC scan of the codes for a shortlist of max(rerank, k) rows per
+        query, then exact squared L2 distances on their full vectors.
+        """
+        if self.quantizer is None:
+            return super()._top_k(queries, k)
+
+        k = min(k, self._count)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0))
+
+        size = self._size
+        codes = self._codes[:, :size]
+        invalid = ~self._valid[:size]
+        shortlist = min(max(self.rerank, k), self._count)
+
+        all_rows, all_distances = [], []
+        for query in queries:
+            approx = self.quantizer.distances(self.quantizer.distance_table(query), codes)
+            approx[invalid] = np.inf
+            # Sorted so the re-rank reads vectors.npy front to back
+            candidates = np.sort(np.argpartition(approx, shortlist - 1)[:shortlist])
+            exact = ((self._vectors[candidates] - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            all_rows.append(candidates[order])
+            all_distances.append(exact[order])
+        return np.vstack(all_rows), np.vstack(all_distances)
+
+    def close(self) -> None:
+        if self._trainer is not None:
+            self._trainer.join()
+        with self._lock:
+            if self._codes is not None:
+                self._codes.flush()
+                self._codes = None
+            super().close()
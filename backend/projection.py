@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+
+class PCAProjection:
+    """
+    Linear projection of embeddings onto their top principal components,
+    used to store (dim x 4) bytes per vector instead of (model dim x 4).
+
+    Projected vectors are re-normalized to unit length, so L2 distance
+    between them still ranks like cosine similarity.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance: float = 0.0):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        # (dim x input_dim), rows are orthonormal
+        self.components = np.asarray(components, dtype=np.float32)
+        self.explained_variance = float(explained_variance)
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int) -> "PCAProjection":
+        """
+        Fits the projection on an (n x input_dim) sample.
+        With fewer samples than `dim`, the missing components are an
+        arbitrary orthonormal completion (they carry no variance of
+        the sample, so refit once more vectors are stored).
+        """
+        vectors = np.asarray(vectors, dtype=np.float64)
+        if vectors.ndim != 2 or len(vectors) == 0:
+            raise ValueError("PCA needs a non-empty (n x dim) sample")
+        if not 0 < dim <= vectors.shape[1]:
+            raise ValueError(f"cannot reduce {vectors.shape[1]} dimensions to {dim}")
+
+        mean = vectors.mean(axis=0) if len(vectors) > 1 else np.zeros(vectors.shape[1])
+        centered = vectors - mean
+        full = len(vectors) < dim
+        _, singular, vt = np.linalg.svd(centered, full_matrices=full)
+
+        variance = singular**2
+        total = variance.sum()
+        explained = variance[:dim].sum() / total if total > 0 else 1.0
+        return cls(mean, vt[:dim], explained)
+
+    def fingerprint(self) -> str:
+        """Short hash of the fitted projection, recorded on the collection it produced."""
+        digest = hashlib.sha1(self.mean.tobytes())
+        digest.update(self.components.tobytes())
+        return digest.hexdigest()[:16]
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """(n x input_dim) -> (n x dim) float32, unit-length rows."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        projected = (vectors - self.mean) @ self.components.T
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        return np.ascontiguousarray(projected / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            mean=self.mean,
+            components=self.components,
+            explained_variance=np.float64(self.explained_variance),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "PCAProjection | None":
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(data["mean"], data["components"], float(data["explained_variance"]))
+        except Exception as e:
+            print(f"[WARNING] Ignoring unreadable projection '{path.name}': {e}")
+            return None
+
+
+class SavedProjection:
+    """
+    The projection a collection's vectors are stored through (None:
+    full size), saved at `path`. A newly fitted projection is staged as
+    <name>.pending.npz until the collection has been rewritten with it,
+    so recover() can tell which one the stored vectors went through.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.pending_path = self.path.with_suffix(".pending.npz")
+        self.projection = PCAProjection.load(self.path)
+
+    @property
+    def dim(self) -> int | None:
+        return self.projection.dim if self.projection is not None else None
+
+    def fingerprint(self) -> str | None:
+        return self.projection.fingerprint() if self.projection is not None else None
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Full-size vector(s) -> (n x stored dim) float32 matrix."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        return vectors if self.projection is None else self.projection.transform(vectors)
+
+    def set(self, projection: PCAProjection | None) -> None:
+        """Saves the projection the collection's vectors now went through."""
+        if projection is None:
+            self.path.unlink(missing_ok=True)
+        else:
+            projection.save(self.path)
+        self.pending_path.unlink(missing_ok=True)
+        self.projection = projection
+
+    def stage(self, projection: PCAProjection) -> None:
+        """Saves a projection the collection is about to be rewritten with."""
+        projection.save(self.pending_path)
+
+    def fit(self, name: str, vectors: np.ndarray, dim: int) -> PCAProjection:
+        """Fits a projection on a sample of the collection `name` and stages it."""
+        projection = PCAProjection.fit(vectors, dim)
+        print(
+            f"[DEBUG] Fitted PCA projection for '{name}' on {len(vectors)} vectors: "
+            f"{projection.input_dim} -> {projection.dim} dims, "
+            f"{100 * projection.explained_variance:.1f}% variance kept."
+        )
+        self.stage(projection)
+        return projection
+
+    def recover(self, name: str, stored_id: str | None, stored_dim: Callable[[], int | None]) -> None:
+        """
+        Matches the projection with the collection `name` after an
+        interrupted rewrite. stored_id: fingerprint recorded on the
+        collection; stored_dim(): size of its stored vectors.
+        """
+        if stored_id != self.fingerprint():
+            pending = PCAProjection.load(self.pending_path)
+            if pending is not None and pending.fingerprint() == stored_id:
+                self.set(pending)
+            elif stored_id is None and (self.projection is None or stored_dim() != self.projection.dim):
+                # Full-size vectors (collections projected before the
+                # fingerprint was recorded have the projection's size)
+                self.set(None)
+            elif stored_id is not None:
+                print(
+                    f"[WARNING] The PCA projection of '{name}' is missing: "
+                    "run `python -m backend.projection_eval --refit`."
+                )
+        self.pending_path.unlink(missing_ok=True)
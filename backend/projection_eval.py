@@ -0,0 +1,117 @@
+"""
+Recall vs memory of PCA-reduced vector storage (EMBED_REDUCED_DIM):
+
+    python -m backend.projection_eval --dims 64,96,128,192 --k 10
+
+Samples chunks of the indexed documents, holds some out as queries and
+compares, for every candidate dimension, the exact top-k neighbours of
+the projected vectors with those of the full-size vectors (recall@k),
+next to the vector memory of the whole collection at that size.
+
+--refit re-projects the stored collections to EMBED_REDUCED_DIM
+afterwards (refitting the projection on the current corpus).
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from typing import List
+
+import numpy as np
+
+from config import EMBED_REDUCED_DIM
+from .embeddings import embed_array
+from .projection import PCAProjection
+from .rag_pipeline import get_store, get_memory_store
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k most cosine-similar corpus rows per query, best first."""
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True).clip(min=1e-12)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True).clip(min=1e-12)
+    scores = queries @ corpus.T
+    k = min(k, corpus.shape[0])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1)
+    return np.take_along_axis(best, order, axis=1)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = [len(set(t) & set(f)) for t, f in zip(truth.tolist(), found.tolist())]
+    return float(np.mean(hits)) / truth.shape[1]
+
+
+def parse_dims(value: str) -> List[int]:
+    return sorted({int(d) for d in value.split(",") if d.strip()})
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.projection_eval",
+        description="Measure recall@k vs memory of PCA-reduced embeddings.",
+    )
+    parser.add_argument("--dims", type=parse_dims, default=parse_dims("32,64,96,128,192"))
+    parser.add_argument("--k", type=int, default=10, help="neighbours compared (default: 10)")
+    parser.add_argument("--samples", type=int, default=5000, help="corpus chunks (default: 5000)")
+    parser.add_argument("--queries", type=int, default=200, help="held-out query chunks (default: 200)")
+    parser.add_argument(
+        "--refit", action="store_true",
+        help=f"re-project the stored collections to EMBED_REDUCED_DIM ({EMBED_REDUCED_DIM})",
+    )
+    args = parser.parse_args(argv)
+
+    store = get_store()
+    if getattr(store, "saved_projection", None) is None:
+        print("[ERROR] Reduced-dimension storage needs VECTOR_BACKEND=chroma.")
+        return 1
+    # The Chroma collection, or those of its shards
+    collections = [shard.collection for shard in getattr(store, "shards", [store])]
+    total = sum(collection.count() for collection in collections)
+    ids = [(collection, i) for collection in collections for i in collection.get(include=[])["ids"]]
+    if len(ids) < 2:
+        print("[ERROR] Index some documents first.")
+        return 1
+
+    picked = random.Random(0).sample(ids, min(len(ids), args.samples + args.queries))
+    found = {}
+    for collection in collections:
+        wanted = [i for c, i in picked if c is collection]
+        if wanted:
+            page = collection.get(ids=wanted, include=["documents"])
+            found.update(zip(page["ids"], page["documents"]))
+    texts = [found[i] for _, i in picked]
+    n_queries = min(args.queries, len(texts) // 2)
+    query_vectors = embed_array(texts[:n_queries])
+    corpus_vectors = embed_array(texts[n_queries:])
+    full_dim = corpus_vectors.shape[1]
+
+    truth = top_k(corpus_vectors, query_vectors, args.k)
+    k = truth.shape[1]
+
+    print(f"Corpus: {len(corpus_vectors)} chunks, {n_queries} held-out queries, {total} stored vectors")
+    if len(corpus_vectors) <= max(args.dims):
+        print("[WARNING] Corpus sample smaller than the largest dimension: recall is not meaningful.")
+    print(f"{'dims':>6} {'variance':>9} {'recall@1':>9} {f'recall@{k}':>10} {'bytes/vec':>10} {'vectors MB':>11}")
+    for dim in [d for d in args.dims if 0 < d < full_dim] + [full_dim]:
+        if dim == full_dim:
+            found, variance = truth, 1.0
+        else:
+            projection = PCAProjection.fit(corpus_vectors, dim)
+            variance = projection.explained_variance
+            found = top_k(
+                projection.transform(corpus_vectors), projection.transform(query_vectors), k
+            )
+        print(
+            f"{dim:>6} {100 * variance:8.1f}% {recall_at_k(truth[:, :1], found[:, :1]):>9.3f} "
+            f"{recall_at_k(truth, found):>10.3f} {dim * 4:>10} {total * dim * 4 / (1024 * 1024):>11.1f}"
+        )
+
+    if args.refit:
+        for collection in (store, get_memory_store()):
+            collection.reproject(EMBED_REDUCED_DIM or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -70,44 +70,344 @@
 #     return orch.answer_question(question, history=history)
 
 
-from typing import Dict, Any
-
-from .vector_store import VectorStore, MemoryStore
-from .document_loader import load_documents
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable
+
+from config import (
+    INGEST_BATCH_SIZE,
+    INGEST_MAX_BATCH_MB,
+    INGEST_CHECKPOINT_SECONDS,
+    EMBED_WORKERS,
+    EMBED_BATCH_SIZE,
+    STORE_PIPELINE_EMBEDDING,
+)
+from .vector_store import VectorStore, MemoryStore, get_document_store
+from . import vector_store
+from .document_loader import iter_document_files, load_files, doc_text
+from .index_manifest import IndexManifest
+from .dedup import ChunkDeduplicator
+from .chunking import release_mapped_files
+from .embedding_pool import EmbeddingPool
+from .embeddings import get_embedder, embed_array
+from .startup import mark, format_timeline
+from . import pdf_cache
 from .agents.orchestrator import Orchestrator
 from .llm_client import HistoryType
 
-_store: VectorStore | None = None
 _orch: Orchestrator | None = None
-_memory_store: MemoryStore | None = None
+_last_index_report: Dict[str, Any] = {}
+_index_lock = threading.Lock()
+# The orchestrator may be first requested by the warm-up thread and a
+# request at the same time: build it only once
+_init_lock = threading.Lock()
+_warmup_thread: threading.Thread | None = None
 
 
 def get_store() -> VectorStore:
-    global _store
-    if _store is None:
-        _store = VectorStore()
-    return _store
+    return get_document_store()
 
 
 def get_memory_store() -> MemoryStore:
-    global _memory_store
-    if _memory_store is None:
-        _memory_store = MemoryStore()
-    return _memory_store
+    return vector_store.get_memory_store()
 
 
 def get_orchestrator() -> Orchestrator:
     global _orch
-    if _orch is None:
-        _orch = Orchestrator()
+    with _init_lock:
+        if _orch is None:
+            _orch = Orchestrator()
     return _orch
 
 
-def index_all_documents() -> int:
-    docs = load_documents()
-    store = get_store()
-    store.add_documents(docs)
-    return len(docs)
+def warm_up() -> None:
+    """
+    Opens Chroma, loads the embedding model (running one encode so
+    kernels are initialized) and builds the agents, marking each step
+    on the startup timeline.
+    """
+    try:
+        mark("warm-up: started")
+        get_store()
+        get_memory_store()
+        mark("warm-up: Chroma client + collections open")
+        get_embedder().encode(["warm-up"])
+        mark("warm-up: embedding model loaded")
+        get_orchestrator()
+        mark("warm-up: agents ready")
+    except Exception as e:
+        print(f"[WARNING] Warm-up failed, loading on first request instead: {e}")
+        mark(f"warm-up: failed ({e})")
+        return
+    print(f"[DEBUG] Startup timeline:\n{format_timeline()}")
+
+
+def start_warmup() -> threading.Thread:
+    """Runs warm_up() once per process on a daemon thread."""
+    global _warmup_thread
+    with _init_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+class _BatchWriter:
+    """
+    Buffers streamed chunks and writes them to the store in fixed-size
+    batches, so embedding + Chroma writes never see more than
+    INGEST_BATCH_SIZE chunks / INGEST_MAX_BATCH_MB of text at once.
+
+    With embed_workers > 1, batches are embedded on an EmbeddingPool
+    (started on the first batch) while parsing continues; finished
+    batches are written in order, with at most the pool's max_in_flight
+    batches waiting. In-process (and with STORE_PIPELINE_EMBEDDING), one
+    background thread embeds the next batch while the previous one is
+    written.
+    """
+
+    def __init__(
+        self,
+        store: VectorStore,
+        batch_size: int = INGEST_BATCH_SIZE,
+        max_bytes: int = INGEST_MAX_BATCH_MB * 1024 * 1024,
+        embed_workers: int = EMBED_WORKERS,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.embed_workers = embed_workers
+        self._buffer: List[Dict[str, Any]] = []
+        self._bytes = 0
+        self._pool: EmbeddingPool | None = None
+        self._embed_thread: ThreadPoolExecutor | None = None
+        self._in_flight: deque = deque()
+        self.written = 0
+
+    def add(self, doc: Dict[str, Any]) -> None:
+        self._buffer.append(doc)
+        self._bytes += len(doc["text"])
+        if len(self._buffer) >= self.batch_size or self._bytes >= self.max_bytes:
+            self._submit()
+
+    def _submit(self) -> None:
+        if not self._buffer:
+            return
+        docs = self._buffer
+        self._buffer = []
+        self._bytes = 0
+
+        if self.embed_workers <= 1:
+            if not STORE_PIPELINE_EMBEDDING:
+                self.store.add_documents(docs)
+                self.written += len(docs)
+                return
+            if self._embed_thread is None:
+                self._embed_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+            self._in_flight.append(
+                (docs, self._embed_thread.submit(embed_array, [d["text"] for d in docs]))
+            )
+            while len(self._in_flight) > 1:
+                self._write_oldest()
+            return
+
+        if self._pool is None:
+            self._pool = EmbeddingPool(workers=self.embed_workers, batch_size=EMBED_BATCH_SIZE)
+        self._in_flight.append((docs, self._pool.submit([d["text"] for d in docs])))
+        while len(self._in_flight) > self._pool.max_in_flight:
+            self._write_oldest()
+
+    def _write_oldest(self) -> None:
+        docs, pending = self._in_flight.popleft()
+        self.store.add_documents(docs, embeddings=pending.result())
+        self.written += len(docs)
+
+    def flush(self) -> None:
+        """Writes everything added so far (waits for in-flight batches)."""
+        self._submit()
+        while self._in_flight:
+            self._write_oldest()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._embed_thread is not None:
+            self._embed_thread.shutdown(wait=True, cancel_futures=True)
+            self._embed_thread = None
+
+
+def index_all_documents(
+    force: bool = False,
+    workers: int | None = None,
+    batch_size: int | None = None,
+    max_files: int | None = None,
+    progress: Callable[[Dict[str, Any]], None] | None = None,
+    checkpoint_seconds: float = INGEST_CHECKPOINT_SECONDS,
+    embed_workers: int | None = None,
+) -> int:
+    """
+    Incrementally indexes data/docs using the index manifest:
+      - new / changed files are parsed and chunked
+      - only chunks not already stored (exactly or nearly, see dedup.py)
+        are embedded; duplicates just gain another source
+      - chunks no longer referenced by any file are deleted
+      - unchanged files are skipped without being read
+    Chunks are streamed from the loader into the store in batches,
+    so memory does not grow with corpus size.
+    force=True reindexes every file.
+    workers / batch_size / embed_workers override INGEST_WORKERS /
+    INGEST_BATCH_SIZE / EMBED_WORKERS.
+    max_files limits how many changed files are indexed in this call;
+    the rest is reported as 'pending_files'.
+    progress(stats) is called after every file with counters
+    (files_done, files_total, chunks, embedded, elapsed).
+    Every checkpoint_seconds, at a file boundary, written chunks and the
+    manifest are persisted, so an interrupted run resumes from there.
+    Only one indexing run happens at a time (UI button vs. watcher);
+    queries never take this lock.
+    Returns the total number of distinct indexed chunks.
+    """
+    with _index_lock:
+        writer = _BatchWriter(
+            get_store(),
+            batch_size=batch_size or INGEST_BATCH_SIZE,
+            embed_workers=EMBED_WORKERS if embed_workers is None else embed_workers,
+        )
+        try:
+            return _index_documents(
+                force, workers, max_files, progress, checkpoint_seconds, writer
+            )
+        finally:
+            writer.close()
+
+
+def _index_documents(
+    force: bool,
+    workers: int | None,
+    max_files: int | None,
+    progress: Callable[[Dict[str, Any]], None] | None,
+    checkpoint_seconds: float,
+    writer: _BatchWriter,
+) -> int:
+    global _last_index_report
+
+    started = time.perf_counter()
+
+    store = writer.store
+    manifest = IndexManifest()
+
+    # Settings changed (or forced): vectors are stale, start from scratch
+    if force or manifest.settings_changed:
+        store.delete_documents(manifest.reset())
+
+    dedup = ChunkDeduplicator(manifest.chunks)
+
+    present = {path.name: path for path in iter_document_files()}
+
+    # 1️⃣ Drop chunks of files that were removed from data/docs
+    removed = [name for name in manifest.names() if name not in present]
+    for name in removed:
+        print(f"[DEBUG] Removing deleted file from index: {name}")
+        store.delete_documents(dedup.release(name, manifest.chunk_ids(name)))
+        manifest.remove(name)
+
+    # 2️⃣ (Re)index new or changed files only, parsed on the worker pool
+    changed = [path for path in present.values() if manifest.needs_indexing(path)]
+    pending = changed[max_files:] if max_files else []
+    changed = changed[:max_files] if max_files else changed
+
+    stats = {
+        "files_total": len(changed),
+        "files_skipped": len(present) - len(changed) - len(pending),
+        "files_done": 0,
+        "chunks": 0,
+        "embedded": 0,
+        "elapsed": 0.0,
+    }
+
+    def checkpoint() -> None:
+        # Order matters: chunks reach the store before the manifest says so
+        writer.flush()
+        dirty = sorted(dedup.dirty)
+        store.update_metadatas(dirty, [dedup.metadata(chunk_id) for chunk_id in dirty])
+        dedup.dirty.clear()
+        manifest.save()
+
+    if progress:
+        progress(dict(stats))
+
+    last_checkpoint = time.perf_counter()
+    for path, docs in load_files(changed, workers=workers):
+        name = path.name
+        if name not in manifest.files:
+            # No manifest entry: clear leftovers from older, manifest-less runs
+            store.delete_source(name)
+
+        chunk_ids: List[str] = []
+        seen_ids: set[str] = set()
+        for doc in docs:
+            # Span chunks are only decoded here, right before embedding
+            text = doc_text(doc)
+            chunk_id, is_new = dedup.add(name, text, doc["metadata"])
+            stats["chunks"] += 1
+            if chunk_id not in seen_ids:
+                seen_ids.add(chunk_id)
+                chunk_ids.append(chunk_id)
+            if is_new:
+                writer.add(
+                    {
+                        "id": chunk_id,
+                        "text": text,
+                        "metadata": dedup.metadata(chunk_id),
+                    }
+                )
+
+        # Chunks of the previous version of this file that are gone now
+        stale = set(manifest.chunk_ids(name)) - seen_ids
+        store.delete_documents(dedup.release(name, list(stale)))
+
+        manifest.record(path, chunk_ids)
+
+        if time.perf_counter() - last_checkpoint >= checkpoint_seconds:
+            checkpoint()
+            last_checkpoint = time.perf_counter()
+
+        if progress:
+            stats["files_done"] += 1
+            stats["embedded"] = writer.written
+            stats["elapsed"] = time.perf_counter() - started
+            progress(dict(stats))
+
+    # 3️⃣ Final flush + refresh source lists of chunks shared with other files
+    checkpoint()
+    release_mapped_files()
+
+    # Forget cached PDF text of files that are gone or changed
+    if (changed or removed) and not pending:
+        pdf_cache.prune(entry["sha256"] for entry in manifest.files.values())
+
+    if progress:
+        stats["embedded"] = writer.written
+        stats["elapsed"] = time.perf_counter() - started
+        progress(dict(stats))
+    _last_index_report = dict(
+        dedup.report,
+        total_chunks=manifest.total_chunks(),
+        pending_files=len(pending),
+    )
+    print(f"[DEBUG] Index: {dedup.summary()}, {manifest.total_chunks()} total")
+    return manifest.total_chunks()
+
+
+def get_last_index_report() -> Dict[str, Any]:
+    """
+    Counters of the last index_all_documents() run, including how many
+    duplicate chunks were skipped instead of embedded / stored.
+    """
+    return dict(_last_index_report)
 
 
 def _should_remember(text: str) -> bool:
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import itertools
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Iterable
+
+import numpy as np
+
+from config import (
+    VECTOR_DB_DIR,
+    EMBED_REDUCED_DIM,
+    PCA_FIT_SAMPLES,
+    VECTOR_BACKEND,
+    VECTOR_SHARDS,
+    SHARD_KEY,
+    SHARD_WORKERS,
+    SHARD_DIRS,
+    LEXICAL_INDEX,
+    STORE_WRITE_BATCH_SIZE,
+    STORE_PIPELINE_EMBEDDING,
+)
+from .embeddings import embed_query, embed_queries, iter_embedded_batches
+from .lexical_index import LexicalIndex
+from .flat_index import FlatVectorStore
+from .pq_index import PQVectorStore
+from .projection import PCAProjection, SavedProjection
+from .vector_store import VectorStore, _projection_path
+
+
+def shard_index(key: str, shards: int) -> int:
+    """Shard of a key: crc32, so it is the same in every process (unlike hash())."""
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class ShardedVectorStore:
+    """
+    Document store split over VECTOR_SHARDS stores of the VECTOR_BACKEND,
+    with the VectorStore interface. Used when VECTOR_SHARDS > 1.
+
+    Every shard is a complete store with its own index (Chroma collection
+    <name>_shard<i> with the collection's HNSW_PARAMS, or a flat / pq
+    directory, spread over SHARD_DIRS), so each index stays as small as
+    1 / VECTOR_SHARDS of the corpus.
+      - writes: a chunk goes to the shard of its id, or of its source
+        file (SHARD_KEY); the shards of a batch are written in parallel
+      - search: every shard returns its top-k in parallel and the lists
+        are merged by distance
+    Shards run on a thread pool: hnswlib and NumPy release the GIL while
+    searching / building, and all shards share the process's Chroma
+    client and embedder.
+
+    The BM25 index (see lexical_index.py) and, with EMBED_REDUCED_DIM,
+    the PCA projection of the Chroma shards are kept once for the whole
+    collection: BM25 scores don't depend on the sharding, and distances
+    from every shard are in the same space, so the merged top-k is the
+    collection's top-k.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        shards: int = VECTOR_SHARDS,
+        backend: str = VECTOR_BACKEND,
+        key: str = SHARD_KEY,
+        workers: int = SHARD_WORKERS,
+        lexical: bool = LEXICAL_INDEX,
+    ):
+        if shards < 1:
+            raise ValueError(f"VECTOR_SHARDS must be at least 1 (got {shards})")
+        if key not in ("id", "source"):
+            raise ValueError(f"Unknown SHARD_KEY '{key}' (expected 'id' or 'source')")
+
+        self.collection_name = collection_name
+        self.key = key
+        self.saved_projection: SavedProjection | None = None
+        if backend not in ("flat", "pq"):
+            self.saved_projection = SavedProjection(_projection_path(collection_name))
+        self.shards = [self._open_shard(backend, i) for i in range(shards)]
+        self._pool = ThreadPoolExecutor(max_workers=workers or shards, thread_name_prefix="shard")
+        if self.saved_projection is not None:
+            self._recover_projection()
+            self._check_projection()
+
+        # BM25 index of all shards' texts, updated with every write
+        self.lexical: LexicalIndex | None = None
+        if lexical:
+            self.lexical = LexicalIndex(VECTOR_DB_DIR / "lexical" / f"{collection_name}.sqlite3")
+            self.lexical.sync(self.count(), self._iter_texts)
+
+    def _open_shard(self, backend: str, i: int):
+        name = f"{self.collection_name}_shard{i}"
+        if backend in ("flat", "pq"):
+            store_class = PQVectorStore if backend == "pq" else FlatVectorStore
+            root = SHARD_DIRS[i % len(SHARD_DIRS)] if SHARD_DIRS else VECTOR_DB_DIR / backend
+            return store_class(name, directory=Path(root) / name, lexical=False)
+        return VectorStore(
+            name, lexical=False, settings_name=self.collection_name, saved_projection=self.saved_projection
+        )
+
+    def _map(self, fn: Callable, items: Iterable) -> List[Any]:
+        """fn over items on the shard pool (results in order; re-raises the first error)."""
+        return list(self._pool.map(fn, items))
+
+    # ------------------------------------------------------------
+    # Shared projection (Chroma shards)
+    # ------------------------------------------------------------
+    def _recover_projection(self) -> None:
+        """
+        Brings every shard to the shared projection: after an interrupted
+        reproject(), the shards not rewritten yet are rewritten with the
+        staged projection. Empty shards are recreated with it.
+        """
+        saved = self.saved_projection
+        stored = {shard._stored_projection_id() for shard in self.shards if shard.count()}
+        pending = PCAProjection.load(saved.pending_path)
+        if pending is not None and pending.fingerprint() in stored:
+            for shard in self.shards:
+                if shard._stored_projection_id() != pending.fingerprint():
+                    shard.apply_projection(pending)
+            saved.set(pending)
+        elif len(stored) > 1:
+            print(
+                f"[WARNING] The shards of '{self.collection_name}' store vectors of different "
+                "projections: run `python -m backend.projection_eval --refit`."
+            )
+            saved.pending_path.unlink(missing_ok=True)
+        else:
+            stored_dims = (shard._stored_dim() for shard in self.shards if shard.count())
+            saved.recover(self.collection_name, next(iter(stored), None), lambda: next(stored_dims, None))
+
+        for shard in self.shards:
+            if shard._stored_projection_id() != saved.fingerprint() and shard.count() == 0:
+                shard._recreate_empty()
+
+    def _check_projection(self) -> None:
+        """Same as VectorStore._check_projection(), for all shards."""
+        saved = self.saved_projection.dim
+        if saved is None or saved == (EMBED_REDUCED_DIM or None):
+            return
+        if self.count() == 0:
+            self.saved_projection.set(None)
+            for shard in self.shards:
+                shard._recreate_empty()
+            return
+        print(
+            f"[WARNING] '{self.collection_name}' stores {saved}-dim vectors but EMBED_REDUCED_DIM "
+            f"is {EMBED_REDUCED_DIM}: run `python -m backend.projection_eval --refit` to re-project it."
+        )
+
+    def _maybe_fit_projection(self) -> None:
+        """Projects every shard once the collection holds enough full-size vectors (after a write)."""
+        if not EMBED_REDUCED_DIM or self.saved_projection is None:
+            return
+        if self.saved_projection.projection is not None:
+            return
+        if self.count() >= max(PCA_FIT_SAMPLES, EMBED_REDUCED_DIM):
+            self.reproject(EMBED_REDUCED_DIM)
+
+    def reproject(self, dim: int | None = EMBED_REDUCED_DIM) -> None:
+        """
+        VectorStore.reproject() for the whole collection: the projection
+        is fitted on PCA_FIT_SAMPLES vectors drawn from every shard (in
+        proportion to its size), then every shard is rewritten with it.
+        """
+        if self.saved_projection is None:
+            raise ValueError("Reduced-dimension storage needs VECTOR_BACKEND=chroma")
+        projection = None
+        if dim:
+            counts = self._map(lambda shard: shard.count(), self.shards)
+            total = max(sum(counts), 1)
+            samples = self._map(
+                lambda item: item[0].sample_vectors(-(-PCA_FIT_SAMPLES * item[1] // total)),
+                zip(self.shards, counts),
+            )
+            sample = np.vstack([vectors for vectors in samples if len(vectors)] or [np.empty((0, 0))])
+            projection = self.saved_projection.fit(self.collection_name, sample, dim)
+        self._map(lambda shard: shard.apply_projection(projection), self.shards)
+        self.saved_projection.set(projection)
+
+    # ------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------
+    def _shard_of(self, doc: Dict[str, Any]) -> int:
+        key = doc["id"]
+        if self.key == "source":
+            key = doc.get("metadata", {}).get("source") or key
+        return shard_index(key, len(self.shards))
+
+    def _locate(self, ids: List[str]) -> Dict[str, int]:
+        """
+        Shard holding each id. By source, a chunk stays in the shard of the
+        file it was written for (its 'source' can change later, see
+        dedup.py), so the shards are asked; unknown ids are left out.
+        """
+        if self.key == "id":
+            return {chunk_id: shard_index(chunk_id, len(self.shards)) for chunk_id in ids}
+        found = self._map(lambda shard: shard.existing_ids(ids), self.shards)
+        return {chunk_id: i for i, existing in enumerate(found) for chunk_id in existing}
+
+    @staticmethod
+    def _group(ids: List[str], located: Dict[str, int]) -> Dict[int, List[int]]:
+        """Positions of ids per shard."""
+        groups: Dict[int, List[int]] = {}
+        for position, chunk_id in enumerate(ids):
+            if chunk_id in located:
+                groups.setdefault(located[chunk_id], []).append(position)
+        return groups
+
+    # ------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------
+    def add_documents(
+        self,
+        docs: List[Dict[str, Any]],
+        embeddings=None,
+        batch_size: int = STORE_WRITE_BATCH_SIZE,
+        pipeline: bool = STORE_PIPELINE_EMBEDDING,
+    ) -> None:
+        """
+        Same contract as VectorStore.add_documents(): upserts docs
+        ({"id", "text", "metadata"}) with their embeddings (embedded
+        here if None), in batches of batch_size, each batch split over
+        the shards and written to them in parallel.
+        """
+        if not docs:
+            return
+        for batch, vectors in iter_embedded_batches(docs, embeddings, batch_size, pipeline):
+            self._upsert(batch, vectors)
+
+    def _upsert(self, docs: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        # The last occurrence of an id wins, as with Chroma's upsert
+        positions = list({d["id"]: i for i, d in enumerate(docs)}.values())
+        docs = [docs[i] for i in positions]
+        embeddings = np.asarray(embeddings, dtype=np.float32)[positions]
+
+        ids = [d["id"] for d in docs]
+        # Existing chunks are rewritten in place; new ones go to their shard
+        located = self._locate(ids) if self.key == "source" else {}
+        located.update({d["id"]: self._shard_of(d) for d in docs if d["id"] not in located})
+
+        def write(item) -> None:
+            i, shard_positions = item
+            self.shards[i].add_documents(
+                [docs[p] for p in shard_positions],
+                embeddings=embeddings[shard_positions],
+                pipeline=False,
+            )
+
+        self._map(write, self._group(ids, located).items())
+        if self.lexical is not None:
+            self.lexical.add(ids, [d["text"] for d in docs])
+        self._maybe_fit_projection()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        if not ids:
+            return
+
+        def update(item) -> None:
+            i, shard_positions = item
+            self.shards[i].update_metadatas(
+                [ids[p] for p in shard_positions], [metadatas[p] for p in shard_positions]
+            )
+
+        self._map(update, self._group(ids, self._locate(ids)).items())
+
+    def delete_documents(self, ids: List[str]) -> None:
+        if not ids:
+            return
+
+        def delete(item) -> None:
+            i, shard_positions = item
+            self.shards[i].delete_documents([ids[p] for p in shard_positions])
+
+        self._map(delete, self._group(ids, self._locate(ids)).items())
+        if self.lexical is not None:
+            self.lexical.delete(ids)
+
+    def delete_source(self, source: str) -> None:
+        """Deletes every chunk whose metadata 'source' is the given file name (from every shard)."""
+        found = self._map(lambda shard: shard.source_ids(source), self.shards)
+        self._map(lambda item: item[0].delete_documents(item[1]), zip(self.shards, found))
+        if self.lexical is not None:
+            self.lexical.delete([chunk_id for ids in found for chunk_id in ids])
+
+    # ------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------
+    def count(self) -> int:
+        return sum(self._map(lambda shard: shard.count(), self.shards))
+
+    def _iter_texts(self):
+        return itertools.chain.from_iterable(shard._iter_texts() for shard in self.shards)
+
+    def get_documents(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """Stored chunks ({"id", "text", "metadata"}) of ids, in that order; unknown ids are skipped."""
+        if not ids:
+            return []
+        groups = self._group(ids, self._locate(ids))
+        found = self._map(
+            lambda item: self.shards[item[0]].get_documents([ids[p] for p in item[1]]),
+            groups.items(),
+        )
+        by_id = {doc["id"]: doc for docs in found for doc in docs}
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        query_embedding: np.ndarray | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        query_embedding: vector of `query` if the caller already has it
+        (e.g. shared between document and memory search).
+        """
+        if not query.strip():
+            return []
+
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+
+        per_shard = self._map(
+            lambda shard: shard.search(query, k=k, query_embedding=query_embedding), self.shards
+        )
+        merged = sorted(itertools.chain.from_iterable(per_shard), key=lambda r: r["distance"])
+        return merged[:k]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        query_embeddings: np.ndarray | None = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        search() for many queries at once: the queries are embedded in
+        one batch, every shard runs one batched search_many() in
+        parallel, and each query's per-shard top-k are merged.
+        """
+        wanted = [i for i, query in enumerate(queries) if query.strip()]
+        if not wanted:
+            return [[] for _ in queries]
+
+        if query_embeddings is None:
+            vectors = embed_queries([queries[i] for i in wanted])
+            query_embeddings = np.zeros((len(queries), vectors.shape[1]), dtype=np.float32)
+            query_embeddings[wanted] = vectors
+
+        per_shard = self._map(
+            lambda shard: shard.search_many(queries, k=k, query_embeddings=query_embeddings), self.shards
+        )
+        return [
+            sorted(itertools.chain.from_iterable(found), key=lambda r: r["distance"])[:k]
+            for found in zip(*per_shard)
+        ]
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        for shard in self.shards:
+            if hasattr(shard, "close"):
+                shard.close()
+        if self.lexical is not None:
+            self.lexical.close()
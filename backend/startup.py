@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Any, List
+
+# Reference point of the timeline: first import of this module, which
+# the app does before anything heavy.
+_T0 = time.perf_counter()
+
+_events: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+
+
+def mark(event: str) -> float:
+    """
+    Records `event` on the startup timeline.
+    Returns the seconds elapsed since the timeline started.
+    """
+    elapsed = time.perf_counter() - _T0
+    with _lock:
+        _events.append(
+            {"t": elapsed, "event": event, "thread": threading.current_thread().name}
+        )
+    return elapsed
+
+
+def timeline() -> List[Dict[str, Any]]:
+    with _lock:
+        return list(_events)
+
+
+def format_timeline() -> str:
+    return "\n".join(
+        f"{e['t'] * 1000:8.0f} ms  [{e['thread']}] {e['event']}" for e in timeline()
+    )
@@ -0,0 +1,153 @@
+"""
+Chroma vs the flat NumPy index vs the product-quantized index on the
+same data:
+
+    python -m backend.store_benchmark --queries 200 --k 5
+
+Copies the vectors, texts and metadata of the Chroma 'documents'
+collection into a temporary flat index and a temporary PQ index (its
+codebooks trained on the copy whatever its size), then runs the same
+queries (embedded chunk texts) against all three and reports
+single-query p50/p99 latency, batched throughput, recall@k against the
+flat index's exact results, vector bytes held in memory per chunk, and
+disk usage (Chroma's covers all of its collections).
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from config import VECTOR_DB_DIR
+from .embeddings import embed_array
+from .flat_index import FlatVectorStore
+from .pq_index import PQVectorStore
+from .vector_store import VectorStore
+
+COPY_PAGE_SIZE = 2048
+# Files in VECTOR_DB_DIR that are not Chroma's
+CHROMA_EXCLUDED = ("flat", "pq", "projections", "lexical", "index_manifest.sqlite3")
+
+
+def directory_mb(path: Path, exclude: tuple = ()) -> float:
+    path = Path(path)
+    return sum(
+        f.stat().st_size
+        for f in path.rglob("*")
+        if f.is_file() and f.relative_to(path).parts[0] not in exclude
+    ) / (1024 * 1024)
+
+
+def copy_to_flat(store: VectorStore, flat: FlatVectorStore) -> int:
+    """Copies the Chroma collection into a flat (or PQ) store."""
+    ids = store.collection.get(include=[])["ids"]
+    for start in range(0, len(ids), COPY_PAGE_SIZE):
+        page = store.collection.get(
+            ids=ids[start : start + COPY_PAGE_SIZE],
+            include=["documents", "metadatas", "embeddings"],
+        )
+        flat.add_documents(
+            [
+                {"id": i, "text": text, "metadata": metadata or {}}
+                for i, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+            ],
+            embeddings=np.asarray(page["embeddings"], dtype=np.float32),
+        )
+    return len(ids)
+
+
+def latencies_ms(search, queries: np.ndarray) -> np.ndarray:
+    search(queries[:1])  # warm-up
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query.reshape(1, -1))
+        timings.append((time.perf_counter() - started) * 1000)
+    return np.asarray(timings)
+
+
+def recall(truth: List[List[str]], found: List[List[str]]) -> float:
+    scores = [len(set(t) & set(f)) / len(t) for t, f in zip(truth, found) if t]
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.store_benchmark",
+        description="Benchmark Chroma against the flat NumPy index on the indexed documents.",
+    )
+    parser.add_argument("--queries", type=int, default=200, help="queries to run (default: 200)")
+    parser.add_argument("--k", type=int, default=5, help="results per query (default: 5)")
+    parser.add_argument("--rerank", type=int, default=None,
+                        help="PQ candidates re-ranked exactly (default: PQ_RERANK)")
+    args = parser.parse_args(argv)
+
+    # Read-only: no BM25 index to build or sync
+    store = VectorStore(lexical=False)
+    total = store.collection.count()
+    if total == 0:
+        print("[ERROR] The Chroma 'documents' collection is empty: index with VECTOR_BACKEND=chroma first.")
+        return 1
+
+    sample_ids = random.Random(0).sample(store.collection.get(include=[])["ids"], min(total, args.queries))
+    texts = store.collection.get(ids=sample_ids, include=["documents"])["documents"]
+    # Query vectors as stored (through the collection's PCA projection, if any)
+    queries = store.saved_projection.transform(embed_array(texts))
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="flat_bench_"))
+    try:
+        flat = FlatVectorStore("benchmark", directory=tmp_dir, lexical=False)
+        started = time.perf_counter()
+        copy_to_flat(store, flat)
+        print(f"Copied {total} vectors ({flat.dim} dims) into a flat index in {time.perf_counter() - started:.1f}s")
+
+        pq = PQVectorStore("benchmark", directory=tmp_dir / "pq", lexical=False, train_min=total + 1)
+        if args.rerank:
+            pq.rerank = args.rerank
+        copy_to_flat(store, pq)
+        pq.train()
+
+        def chroma_search(q: np.ndarray) -> List[List[str]]:
+            return store.collection.query(query_embeddings=q, n_results=args.k, include=[])["ids"]
+
+        def flat_search(q: np.ndarray) -> List[List[str]]:
+            return [[r["id"] for r in results] for results in flat.query(q, args.k)]
+
+        def pq_search(q: np.ndarray) -> List[List[str]]:
+            return [[r["id"] for r in results] for results in pq.query(q, args.k)]
+
+        print(
+            f"{'backend':<8} {'p50 ms':>8} {'p99 ms':>8} {'batched q/s':>12} "
+            f"{f'recall@{args.k}':>10} {'vec B':>6} {'disk MB':>8}"
+        )
+        exact = flat_search(queries)
+        full_bytes = flat.dim * 4
+        for name, search, vector_bytes, size_mb in (
+            ("chroma", chroma_search, full_bytes, directory_mb(VECTOR_DB_DIR, exclude=CHROMA_EXCLUDED)),
+            ("flat", flat_search, full_bytes, directory_mb(tmp_dir, exclude=("pq",))),
+            ("pq", pq_search, pq.bytes_per_vector, directory_mb(tmp_dir / "pq")),
+        ):
+            timings = latencies_ms(search, queries)
+            started = time.perf_counter()
+            found = search(queries)
+            batched = len(queries) / (time.perf_counter() - started)
+            print(
+                f"{name:<8} {np.percentile(timings, 50):8.2f} {np.percentile(timings, 99):8.2f} "
+                f"{batched:12.0f} {recall(exact, found):10.3f} {vector_bytes:6d} {size_mb:8.1f}"
+            )
+        flat.close()
+        pq.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -60,39 +60,427 @@
 from __future__ import annotations
 
 from typing import List, Dict, Any
+import random
+import threading
 import uuid
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    VECTOR_DB_DIR,
+    EMBED_REDUCED_DIM,
+    PCA_FIT_SAMPLES,
+    STORE_WRITE_BATCH_SIZE,
+    STORE_PIPELINE_EMBEDDING,
+    VECTOR_BACKEND,
+    VECTOR_SHARDS,
+    LEXICAL_INDEX,
+)
+from .collection_rebuild import REBUILD_PAGE_SIZE, hnsw_metadata, hnsw_changes, finish_swap, rebuild_collection
+from .embeddings import embed_texts, embed_array, embed_query, embed_queries, iter_embedded_batches
+from .projection import PCAProjection, SavedProjection
+from .lexical_index import LexicalIndex
+from .dedup import source_flag
+from .flat_index import FlatVectorStore, FlatMemoryStore
+from .pq_index import PQVectorStore
+
+# chromadb is imported when the first store is created, so importing
+# this module (and the pipeline) stays fast.
+
+
+@lru_cache(maxsize=1)
+def _embedding_function_class():
+    from chromadb.api.types import EmbeddingFunction
+
+    class SentenceTransformerEmbeddingFunction(EmbeddingFunction):
+        """
+        Custom embedding function wrapping our embed_texts() helper.
+        """
+
+        def __call__(self, input: List[str]) -> List[List[float]]:
+            return embed_texts(input)
+
+    return SentenceTransformerEmbeddingFunction
 
-import chromadb
-from chromadb.api.types import EmbeddingFunction
 
-from config import VECTOR_DB_DIR
-from .embeddings import embed_texts
+def __getattr__(name: str):
+    # `from backend.vector_store import SentenceTransformerEmbeddingFunction`
+    if name == "SentenceTransformerEmbeddingFunction":
+        return _embedding_function_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-class SentenceTransformerEmbeddingFunction(EmbeddingFunction):
+_client = None
+# Re-entrant: building a store (under the lock) asks for the client
+_registry_lock = threading.RLock()
+_stores: Dict[str, "_ProjectedCollection"] = {}
+
+
+def _persistent_client():
     """
-    Custom embedding function wrapping our embed_texts() helper.
+    The process-wide Chroma client. Every store shares it, so the
+    SQLite / HNSW files are opened (and cached) only once.
     """
+    global _client
+    with _registry_lock:
+        if _client is None:
+            import chromadb
+
+            _client = chromadb.PersistentClient(path=str(VECTOR_DB_DIR))
+        return _client
+
+
+def _shared_store(store_class, collection_name: str):
+    with _registry_lock:
+        store = _stores.get(collection_name)
+        if store is None:
+            store = store_class(collection_name)
+            _stores[collection_name] = store
+        elif not isinstance(store, store_class):
+            raise ValueError(
+                f"Collection '{collection_name}' is already open as {type(store).__name__}"
+            )
+        return store
 
-    def __call__(self, input: List[str]) -> List[List[float]]:
-        return embed_texts(input)
 
+def get_document_store(collection_name: str = "documents") -> "VectorStore":
+    """
+    Process-wide document store of the collection, shared by the
+    pipeline and the agents (one collection handle and projection per
+    process). VECTOR_BACKEND picks Chroma, the flat NumPy index or the
+    product-quantized index; VECTOR_SHARDS > 1 splits it into shards.
+    """
+    if VECTOR_SHARDS > 1:
+        from .sharded_store import ShardedVectorStore  # imports this module
+
+        return _shared_store(ShardedVectorStore, collection_name)
+    store_class = {"flat": FlatVectorStore, "pq": PQVectorStore}.get(VECTOR_BACKEND, VectorStore)
+    return _shared_store(store_class, collection_name)
 
-class VectorStore:
+
+def get_memory_store(collection_name: str = "memory") -> "MemoryStore":
     """
-    Vector store for DOCUMENTS.
-    Uses Chroma persistent client and a single collection 'documents'.
+    Process-wide memory store of the collection (the pq backend keeps
+    memories in a flat index: there are too few to compress).
     """
+    store_class = FlatMemoryStore if VECTOR_BACKEND in ("flat", "pq") else MemoryStore
+    return _shared_store(store_class, collection_name)
+
+
+def _projection_path(collection_name: str) -> Path:
+    return VECTOR_DB_DIR / "projections" / f"{collection_name}.npz"
 
-    def __init__(self, collection_name: str = "documents"):
-        self.client = chromadb.PersistentClient(path=str(VECTOR_DB_DIR))
 
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=SentenceTransformerEmbeddingFunction(),
+def _format_results(result: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+    """A Chroma query result as one list of {"id", "text", "metadata", "distance"} dicts per query."""
+    out: List[List[Dict[str, Any]]] = []
+    for row, documents in enumerate(result.get("documents") or [[]]):
+        ids = (result.get("ids") or [[]])[row]
+        metadatas = (result.get("metadatas") or [[]])[row]
+        distances = (result.get("distances") or [[]])[row]
+        out.append(
+            [
+                {
+                    "id": ids[i],
+                    "text": doc,
+                    "metadata": metadatas[i] if metadatas and i < len(metadatas) else {},
+                    "distance": distances[i] if distances and i < len(distances) else None,
+                }
+                for i, doc in enumerate(documents)
+            ]
         )
+    return out
+
+
+class _ProjectedCollection:
+    """
+    Chroma collection whose vectors are optionally stored reduced to
+    EMBED_REDUCED_DIM dimensions by a PCA projection. Vectors are stored
+    full-size until the collection holds PCA_FIT_SAMPLES of them; then
+    the projection is fitted on those, the collection rewritten with
+    projected vectors (see reproject()) and the projection saved next to
+    it (see SavedProjection). Queries go through the same projection.
+    The collection's HNSW index is created with HNSW_PARAMS; Chroma
+    fixes them at creation, so a change rebuilds the collection.
+    settings_name: HNSW_PARAMS entry to use if not the collection's own
+    (shards of a collection use that collection's settings).
+    saved_projection: projection shared with other collections (the
+    shards of a collection), fitted and recovered by its owner.
+    """
 
-    def add_documents(self, docs: List[Dict[str, Any]]) -> None:
+    def __init__(
+        self,
+        collection_name: str,
+        settings_name: str | None = None,
+        saved_projection: SavedProjection | None = None,
+    ):
+        self.collection_name = collection_name
+        self.settings_name = settings_name or collection_name
+        self.client = _persistent_client()
+        self._owns_projection = saved_projection is None
+        self.saved_projection = saved_projection or SavedProjection(_projection_path(collection_name))
+        self.collection = self._open_collection(collection_name)
+        if self._owns_projection:
+            self.saved_projection.recover(collection_name, self._stored_projection_id(), self._stored_dim)
+            self._check_projection()
+        self._check_hnsw()
+
+    def _open_collection(self, name: str):
+        """
+        The stored collection as it was created, or a new one.
+        get_or_create_collection() would overwrite the metadata of an
+        existing collection with the current HNSW_PARAMS while its index
+        keeps the ones it was built with, hiding a change from _check_hnsw().
+        """
+        finish_swap(self.client, name)
+        try:
+            return self.client.get_collection(name=name, embedding_function=_embedding_function_class()())
+        except ValueError:
+            return self._get_collection(name, self._shared_projection_id())
+
+    def _get_collection(self, name: str, projection_id: str | None = None):
+        metadata = hnsw_metadata(self.settings_name)
+        if projection_id:
+            # Fingerprint of the projection its vectors went through
+            metadata["projection"] = projection_id
+        return self.client.get_or_create_collection(
+            name=name,
+            embedding_function=_embedding_function_class()(),
+            metadata=metadata,
+        )
+
+    def _check_hnsw(self) -> None:
+        changed = hnsw_changes(self.collection.metadata, self.settings_name)
+        if not changed:
+            return
+        print(f"[DEBUG] HNSW settings of '{self.collection_name}' changed ({changed}).")
+        if self.collection.count() == 0:
+            self._recreate_empty()
+        else:
+            self.rebuild_index()
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def _stored_dim(self) -> int | None:
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        embeddings = sample.get("embeddings")
+        return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+    def _stored_projection_id(self) -> str | None:
+        return (self.collection.metadata or {}).get("projection")
+
+    def _shared_projection_id(self) -> str | None:
+        # A new (empty) shard stores its vectors through the shared projection
+        return None if self._owns_projection else self.saved_projection.fingerprint()
+
+    @property
+    def projection(self) -> PCAProjection | None:
+        return self.saved_projection.projection
+
+    def _check_projection(self) -> None:
+        """
+        Warns if EMBED_REDUCED_DIM changed since the collection was
+        projected: re-projecting re-embeds every stored text, so it is an
+        explicit step (projection_eval --refit) rather than part of
+        opening the store. An empty collection is simply recreated.
+        """
+        saved = self.saved_projection.dim
+        if saved is None or saved == (EMBED_REDUCED_DIM or None):
+            return
+        if self.collection.count() == 0:
+            self._recreate_empty()
+            return
+        print(
+            f"[WARNING] '{self.collection_name}' stores {saved}-dim vectors but EMBED_REDUCED_DIM "
+            f"is {EMBED_REDUCED_DIM}: run `python -m backend.projection_eval --refit` to re-project it."
+        )
+
+    def _recreate_empty(self) -> None:
+        # Chroma pins a collection's dimension and HNSW settings, even
+        # once it is empty
+        self.client.delete_collection(self.collection_name)
+        self.collection = self._get_collection(self.collection_name, self._shared_projection_id())
+        if self._owns_projection:
+            self.saved_projection.set(None)
+
+    def _maybe_fit_projection(self) -> None:
+        """Projects the collection once it holds enough full-size vectors to fit on (after a write)."""
+        if not EMBED_REDUCED_DIM or not self._owns_projection or self.projection is not None:
+            return
+        if self.collection.count() >= max(PCA_FIT_SAMPLES, EMBED_REDUCED_DIM):
+            self.reproject(EMBED_REDUCED_DIM)
+
+    def _query(self, vectors: np.ndarray, k: int) -> List[List[Dict[str, Any]]]:
+        """Top-k results of each full-size query vector (one Chroma query)."""
+        result = self.collection.query(query_embeddings=self.saved_projection.transform(vectors), n_results=k)
+        return _format_results(result)
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        query_embedding: np.ndarray | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        query_embedding: vector of `query` if the caller already has it
+        (e.g. shared between document and memory search).
+        """
+        if not query.strip():
+            return []
+
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+
+        return self._query(query_embedding, k)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        query_embeddings: np.ndarray | None = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        search() for many queries at once: one result list per query, in
+        order. All queries are embedded in one batch and sent to Chroma as
+        a single query. query_embeddings: their (n x dim) vectors, if the
+        caller already has them. Blank queries get no results.
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        wanted = [i for i, query in enumerate(queries) if query.strip()]
+        if not wanted:
+            return results
+
+        if query_embeddings is None:
+            vectors = embed_queries([queries[i] for i in wanted])
+        else:
+            vectors = np.asarray(query_embeddings, dtype=np.float32)[wanted]
+
+        for i, found in zip(wanted, self._query(vectors, k)):
+            results[i] = found
+        return results
+
+    def reproject(self, dim: int | None = EMBED_REDUCED_DIM) -> None:
+        """
+        Rewrites the collection with vectors reduced to `dim` dimensions
+        (None / 0 = full size), fitting the projection on a random sample
+        of PCA_FIT_SAMPLES stored vectors.
+        """
+        projection = None
+        if dim:
+            sample = self.sample_vectors(PCA_FIT_SAMPLES)
+            projection = self.saved_projection.fit(self.collection_name, sample, dim)
+        self.apply_projection(projection)
+        self.saved_projection.set(projection)
+
+    def _stores_full_size(self) -> bool:
+        return self.projection is None and self._stored_projection_id() is None
+
+    def _full_vectors(self, page: Dict[str, Any], full_size: bool) -> np.ndarray:
+        """
+        Full-size vectors of a page of records: stored full-size vectors
+        as they are, projected ones re-embedded from their texts (mostly
+        from the embedding cache).
+        """
+        if full_size:
+            return np.asarray(page["embeddings"], dtype=np.float32)
+        return embed_array(page["documents"])
+
+    def sample_vectors(self, n: int) -> np.ndarray:
+        """Full-size vectors of up to n random stored records."""
+        ids = self.collection.get(include=[])["ids"]
+        sample_ids = random.Random(0).sample(ids, min(len(ids), n))
+        if not sample_ids:
+            return np.empty((0, 0), dtype=np.float32)
+        full_size = self._stores_full_size()
+        page = self.collection.get(ids=sample_ids, include=["embeddings" if full_size else "documents"])
+        return self._full_vectors(page, full_size)
+
+    def apply_projection(self, projection: PCAProjection | None) -> None:
+        """
+        Rewrites the collection with its vectors through `projection`
+        (None = full size). The caller saves the projection afterwards.
+        """
+        ids = self.collection.get(include=[])["ids"]
+        print(
+            f"[DEBUG] Re-projecting '{self.collection_name}' ({len(ids)} vectors) "
+            f"to {projection.dim if projection is not None else 'full'} dims..."
+        )
+        full_size = self._stores_full_size()
+
+        def vectors(page: Dict[str, Any]) -> np.ndarray:
+            embedded = self._full_vectors(page, full_size)
+            return projection.transform(embedded) if projection is not None else embedded
+
+        include = ["documents", "metadatas"] + (["embeddings"] if full_size else [])
+        self._rebuild(ids, include, vectors, projection.fingerprint() if projection is not None else None)
+
+    def rebuild_index(self) -> None:
+        """
+        Rewrites the collection with its stored vectors, so a new HNSW
+        index is built with the current HNSW_PARAMS.
+        """
+        ids = self.collection.get(include=[])["ids"]
+        print(f"[DEBUG] Rebuilding the HNSW index of '{self.collection_name}' ({len(ids)} vectors)...")
+        self._rebuild(
+            ids,
+            ["documents", "metadatas", "embeddings"],
+            lambda page: np.asarray(page["embeddings"], dtype=np.float32),
+            self._stored_projection_id(),
+        )
+
+    def _rebuild(self, ids: List[str], include: List[str], vectors, projection_id: str | None) -> None:
+        """
+        Rewrites the collection (see collection_rebuild.py) with the
+        current HNSW_PARAMS, storing vectors(page) for every page.
+        projection_id: fingerprint of the projection the new vectors
+        went through (None for full-size vectors).
+        """
+        self.collection = rebuild_collection(
+            self.client,
+            self.collection,
+            lambda name: self._get_collection(name, projection_id),
+            ids,
+            include,
+            vectors,
+        )
+
+
+class VectorStore(_ProjectedCollection):
+    """
+    Vector store for DOCUMENTS.
+    Uses Chroma persistent client and a single collection 'documents'.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        lexical: bool = LEXICAL_INDEX,
+        settings_name: str | None = None,
+        saved_projection: SavedProjection | None = None,
+    ):
+        super().__init__(collection_name, settings_name, saved_projection)
+        # BM25 index of the chunk texts, updated with every write
+        self.lexical: LexicalIndex | None = None
+        if lexical:
+            self.lexical = LexicalIndex(VECTOR_DB_DIR / "lexical" / f"{collection_name}.sqlite3")
+            self.lexical.sync(self.collection.count(), self._iter_texts)
+
+    def _iter_texts(self):
+        ids = self.collection.get(include=[])["ids"]
+        for start in range(0, len(ids), REBUILD_PAGE_SIZE):
+            page = self.collection.get(ids=ids[start : start + REBUILD_PAGE_SIZE], include=["documents"])
+            yield page["ids"], page["documents"]
+
+    def add_documents(
+        self,
+        docs: List[Dict[str, Any]],
+        embeddings=None,
+        batch_size: int = STORE_WRITE_BATCH_SIZE,
+        pipeline: bool = STORE_PIPELINE_EMBEDDING,
+    ) -> None:
         """
         docs: list of dicts:
           {
@@ -100,58 +488,93 @@ class VectorStore:
             "text": str,
             "metadata": { ... }
           }
+        embeddings: precomputed (n x dim) float32 matrix, one row per doc
+        (e.g. from the embedding pool). If None, the texts are embedded
+        with embed_array().
+        Vectors stay NumPy arrays up to Chroma, which converts them itself.
+
+        Written with upsert in batches of batch_size (capped at Chroma's
+        max batch size), so any number of docs can be passed and writing
+        an id again replaces it. With pipeline (and no precomputed
+        embeddings), batch N+1 is embedded on a background thread while
+        batch N is written.
         """
         if not docs:
             return
 
-        ids = [d["id"] for d in docs]
-        texts = [d["text"] for d in docs]
-        metadatas = [d.get("metadata", {}) for d in docs]
-
-        self.collection.add(
-            ids=ids,
-            documents=texts,
-            metadatas=metadatas,
+        max_size = self.client.get_max_batch_size()
+        size = min(batch_size, max_size) if batch_size > 0 else max_size
+        for batch, vectors in iter_embedded_batches(docs, embeddings, size, pipeline):
+            self._upsert(batch, vectors)
+
+    def _upsert(self, docs: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        # Chroma rejects an id twice in one call: the last occurrence wins
+        positions = list({d["id"]: i for i, d in enumerate(docs)}.values())
+        if len(positions) < len(docs):
+            docs = [docs[i] for i in positions]
+            embeddings = embeddings[positions]
+
+        self.collection.upsert(
+            ids=[d["id"] for d in docs],
+            documents=[d["text"] for d in docs],
+            metadatas=[d.get("metadata", {}) for d in docs],
+            embeddings=self.saved_projection.transform(embeddings),
         )
+        if self.lexical is not None:
+            self.lexical.add([d["id"] for d in docs], [d["text"] for d in docs])
+        self._maybe_fit_projection()
 
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        if not query.strip():
-            return []
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        if not ids:
+            return
+        self.collection.update(ids=ids, metadatas=metadatas)
 
-        result = self.collection.query(
-            query_texts=[query],
-            n_results=k,
-        )
+    def delete_documents(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        self.collection.delete(ids=ids)
+        if self.lexical is not None:
+            self.lexical.delete(ids)
 
-        documents = result.get("documents", [[]])[0]
-        ids = result.get("ids", [[]])[0]
-        metadatas = result.get("metadatas", [[]])[0]
+    def delete_source(self, source: str) -> None:
+        """
+        Deletes every chunk of the given file name (its 'source' or one of
+        its source flags, see dedup.py).
+        Used when a file has no manifest entry (e.g. manifest lost).
+        """
+        self.delete_documents(self.source_ids(source))
 
-        out: List[Dict[str, Any]] = []
-        for i, doc in enumerate(documents):
-            out.append(
-                {
-                    "id": ids[i],
-                    "text": doc,
-                    "metadata": metadatas[i] if metadatas and i < len(metadatas) else {},
-                }
-            )
-        return out
+    def source_ids(self, source: str) -> List[str]:
+        """Ids of the chunks of the given file name ('source' or source flag)."""
+        where = {"$or": [{"source": source}, {source_flag(source): True}]}
+        return self.collection.get(where=where, include=[])["ids"]
+
+    def get_documents(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """Stored chunks ({"id", "text", "metadata"}) of ids, in that order; unknown ids are skipped."""
+        if not ids:
+            return []
+        result = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        found = {
+            chunk_id: {"id": chunk_id, "text": text, "metadata": metadata or {}}
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def existing_ids(self, ids: List[str]) -> List[str]:
+        """The ids that are stored."""
+        if not ids:
+            return []
+        return self.collection.get(ids=ids, include=[])["ids"]
 
 
-class MemoryStore:
+class MemoryStore(_ProjectedCollection):
     """
     Separate collection for LONG-TERM MEMORY.
     Stores user-provided sentences and retrieves them by semantic similarity.
     """
 
     def __init__(self, collection_name: str = "memory"):
-        self.client = chromadb.PersistentClient(path=str(VECTOR_DB_DIR))
-
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=SentenceTransformerEmbeddingFunction(),
-        )
+        super().__init__(collection_name)
 
     def add_memory(self, text: str, metadata: Dict[str, Any] | None = None) -> None:
         if not text.strip():
@@ -165,28 +588,6 @@ class MemoryStore:
             ids=[str(uuid.uuid4())],
             documents=[text],
             metadatas=[metadata],
+            embeddings=self.saved_projection.transform(embed_array([text])),
         )
-
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        if not query.strip():
-            return []
-
-        result = self.collection.query(
-            query_texts=[query],
-            n_results=k,
-        )
-
-        documents = result.get("documents", [[]])[0]
-        ids = result.get("ids", [[]])[0]
-        metadatas = result.get("metadatas", [[]])[0]
-
-        out: List[Dict[str, Any]] = []
-        for i, doc in enumerate(documents):
-            out.append(
-                {
-                    "id": ids[i],
-                    "text": doc,
-                    "metadata": metadatas[i] if metadatas and i < len(metadatas) else {},
-                }
-            )
-        return out
+        self._maybe_fit_projection()
@@ -73,14 +73,205 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 # ---------------------------------------
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 
+# Inference backend for EMBED_MODEL:
+#   "torch"     - PyTorch (default)
+#   "onnx"      - exported ONNX graph on ONNX Runtime
+#   "onnx-int8" - ONNX graph with int8 dynamic quantization (CPU)
+# The ONNX backends need `pip install optimum[onnxruntime]`; if the
+# configured backend can't be loaded, embedding fails (no silent fallback).
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+
+# int8 kernels to quantize for: arm64, avx2, avx512, avx512_vnni
+EMBED_ONNX_QUANTIZATION = os.getenv("EMBED_ONNX_QUANTIZATION", "avx2")
+
+# Exported / quantized ONNX models are saved here (exported once)
+EMBED_ONNX_DIR = BASE_DIR / "data" / "onnx_models"
+
+# Texts per forward pass (the model sorts texts by length first, so each
+# batch pads to a similar length)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+
+# Persistent embedding cache keyed by (model, normalized text hash):
+# unchanged chunks are never embedded twice, across reindexes too
+EMBED_CACHE = os.getenv("EMBED_CACHE", "true").lower() == "true"
+EMBED_CACHE_DIR = BASE_DIR / "data" / "embedding_cache"
+
+# Size cap of the cached vectors per model (least recently used evicted)
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", 512))
+
+# Recent query vectors kept in memory (one embedding per question,
+# shared by document and memory search)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", 256))
+
+# Embedding processes used while indexing (0 or 1 = embed in-process)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0))
+
+# Threads per embedding process (0 = CPU count / EMBED_WORKERS)
+EMBED_THREADS_PER_WORKER = int(os.getenv("EMBED_THREADS_PER_WORKER", 0))
+
 # ---------------------------------------
 # Chunking configuration
 # ---------------------------------------
+# "words":  fixed windows of CHUNK_SIZE words
+# "tokens": sentence-packed chunks sized by the embedder's tokenizer
+#           (opt-in: switching re-chunks and re-embeds the whole index)
+CHUNKER = os.getenv("CHUNKER", "words")
+
+# Word chunker
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 800))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 100))
 
+# Token chunker (0 = the embedding model's max sequence length)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 0))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+
 # ---------------------------------------
 # Vector DB directory
 # ---------------------------------------
 VECTOR_DB_DIR = BASE_DIR / "data" / "chroma_db"
 VECTOR_DB_DIR.mkdir(parents=True, exist_ok=True)
+
+# Vector store backend:
+#   "chroma" - Chroma persistent client (HNSW index, default)
+#   "flat"   - exact search over a memory-mapped NumPy matrix
+#              (VECTOR_DB_DIR/flat), for up to a few 100k chunks
+#   "pq"     - product-quantized codes in memory, exact re-ranking with
+#              the full vectors read from disk (VECTOR_DB_DIR/pq), for
+#              corpora whose float32 vectors don't fit in memory
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
+# Product quantization (VECTOR_BACKEND=pq): bytes per vector code, one
+# per sub-vector (the embedding dimension must divide into this many)
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", 48))
+
+# Codebooks are trained in the background once the collection holds this
+# many vectors (exact search from disk until then), on up to
+# PQ_TRAIN_SAMPLES of them
+PQ_TRAIN_MIN = int(os.getenv("PQ_TRAIN_MIN", 10000))
+PQ_TRAIN_SAMPLES = int(os.getenv("PQ_TRAIN_SAMPLES", 65536))
+
+# Candidates from the compressed search re-ranked with exact distances
+PQ_RERANK = int(os.getenv("PQ_RERANK", 100))
+
+# Split the documents collection into this many shards (1 = no
+# sharding): Chroma collections documents_shard<i>, or flat / pq
+# directories, each with its own index. Writes go to their shard;
+# searches run on every shard in parallel and the top-k are merged.
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", 1))
+
+# What picks a chunk's shard:
+#   "id"     - hash of the chunk id (evenly sized shards)
+#   "source" - hash of its file name (a file's chunks stay together)
+SHARD_KEY = os.getenv("SHARD_KEY", "id").lower()
+
+# Threads searching / writing shards at once (0 = one per shard)
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 0))
+
+# Comma-separated directories the flat / pq shards are spread over
+# (round-robin, e.g. one per disk; empty = under VECTOR_DB_DIR)
+SHARD_DIRS = [Path(p) for p in os.getenv("SHARD_DIRS", "").split(",") if p.strip()]
+
+# HNSW index of each Chroma collection. Set when a collection is created;
+# changing a value rebuilds the collection from its stored vectors.
+# Tune with `python -m backend.hnsw_tuning`.
+HNSW_PARAMS = {
+    "documents": {
+        "space": os.getenv("DOCS_HNSW_SPACE", "l2"),
+        "M": int(os.getenv("DOCS_HNSW_M", 16)),
+        "construction_ef": int(os.getenv("DOCS_HNSW_CONSTRUCTION_EF", 100)),
+        "search_ef": int(os.getenv("DOCS_HNSW_SEARCH_EF", 10)),
+    },
+    "memory": {
+        "space": os.getenv("MEMORY_HNSW_SPACE", "l2"),
+        "M": int(os.getenv("MEMORY_HNSW_M", 16)),
+        "construction_ef": int(os.getenv("MEMORY_HNSW_CONSTRUCTION_EF", 100)),
+        "search_ef": int(os.getenv("MEMORY_HNSW_SEARCH_EF", 10)),
+    },
+}
+
+# Manifest of indexed files and the dedup chunk registry, in SQLite
+# (lives next to the Chroma files so that wiping the DB directory also
+# forces a full reindex)
+INDEX_MANIFEST_PATH = VECTOR_DB_DIR / "index_manifest.sqlite3"
+
+# Store vectors reduced to this many dimensions by a PCA projection
+# fitted at index time (0 = store full-size vectors). A collection keeps
+# full-size vectors until it holds PCA_FIT_SAMPLES of them, then is
+# projected once. Changing the value later takes an explicit
+# `python -m backend.projection_eval --refit`.
+EMBED_REDUCED_DIM = int(os.getenv("EMBED_REDUCED_DIM", 0))
+
+# Stored vectors the projection is fitted on (and needed before fitting)
+PCA_FIT_SAMPLES = int(os.getenv("PCA_FIT_SAMPLES", 4096))
+
+# Chunks per Chroma upsert (capped at the client's max batch size;
+# 0 = use that max)
+STORE_WRITE_BATCH_SIZE = int(os.getenv("STORE_WRITE_BATCH_SIZE", 2048))
+
+# Embed the next batch while the current one is written
+STORE_PIPELINE_EMBEDDING = os.getenv("STORE_PIPELINE_EMBEDDING", "true").lower() == "true"
+
+# ---------------------------------------
+# Retrieval
+# ---------------------------------------
+# BM25 index of the document chunks (VECTOR_DB_DIR/lexical), updated on
+# every write; its hits are fused with the dense ones
+LEXICAL_INDEX = os.getenv("LEXICAL_INDEX", "true").lower() == "true"
+
+# Candidates taken from each of the dense and BM25 rankings before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+
+# Reciprocal rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# ---------------------------------------
+# Ingestion
+# ---------------------------------------
+# Processes used to parse files (1 = parse in-process). The app (Reindex
+# button, docs watcher) parses in-process by default, so the Streamlit
+# process never starts a pool next to its model / Chroma threads;
+# `python -m backend.ingest` uses INGEST_CLI_WORKERS.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+INGEST_CLI_WORKERS = int(os.getenv("INGEST_CLI_WORKERS", os.cpu_count() or 1))
+
+# Big PDFs are split into page ranges of this size across workers
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+
+# Extracted PDF page text, keyed by file hash + extractor version, so
+# re-chunking (new chunk settings / embedding model) never reparses PDFs
+PDF_TEXT_CACHE = os.getenv("PDF_TEXT_CACHE", "true").lower() == "true"
+PDF_TEXT_CACHE_DIR = BASE_DIR / "data" / "pdf_text_cache"
+
+# Chunks per embedding + Chroma write batch
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+
+# Upper bound (MB of chunk text) buffered before a batch is flushed
+INGEST_MAX_BATCH_MB = int(os.getenv("INGEST_MAX_BATCH_MB", 64))
+
+# Fold near-duplicate chunks (SimHash) into one stored chunk
+NEAR_DUP_DETECTION = os.getenv("NEAR_DUP_DETECTION", "true").lower() == "true"
+
+# Max SimHash Hamming distance (of 64 bits) to count as near-duplicate
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", 3))
+
+# ---------------------------------------
+# Background indexing of data/docs
+# ---------------------------------------
+# Start a watcher that indexes new / changed files automatically
+WATCH_DOCS = os.getenv("WATCH_DOCS", "false").lower() == "true"
+
+# Polling interval (also used to wait for uploads to finish writing)
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", 2.0))
+
+# Changed files indexed per watcher run
+WATCH_BATCH_FILES = int(os.getenv("WATCH_BATCH_FILES", 4))
+
+# Seconds between ingestion checkpoints (written chunks + manifest)
+INGEST_CHECKPOINT_SECONDS = float(os.getenv("INGEST_CHECKPOINT_SECONDS", 30))
+
+# ---------------------------------------
+# Startup
+# ---------------------------------------
+# Load the embedder and open Chroma on a background thread at app start,
+# so the first question doesn't pay for it
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "false").lower() == "true"
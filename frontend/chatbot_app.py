@@ -54,14 +54,23 @@
 
 import sys
 import os
+import time
 
 # Add project root to PYTHONPATH
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(ROOT_DIR)
 print("PYTHON EXECUTABLE:", sys.executable)
 
+from backend import startup
+
+startup.mark("app script start")
+
 import streamlit as st
-from backend.rag_pipeline import index_all_documents, answer_query
+from backend.rag_pipeline import index_all_documents, answer_query, get_last_index_report, start_warmup
+from backend.dedup import cited_sources
+from config import WATCH_DOCS, WARMUP_ON_START
+
+startup.mark("backend imported")
 
 
 DOCS_DIR = os.path.join(ROOT_DIR, "data", "docs")
@@ -69,6 +78,27 @@ os.makedirs(DOCS_DIR, exist_ok=True)
 
 st.set_page_config(page_title="Multi-Agent RAG Chatbot", layout="wide")
 
+
+@st.cache_resource
+def get_docs_watcher():
+    # One background indexer per server process, not per rerun
+    from backend.docs_watcher import start_docs_watcher
+
+    return start_docs_watcher()
+
+
+watcher = get_docs_watcher() if WATCH_DOCS else None
+
+
+@st.cache_resource
+def get_warmup_thread():
+    # Load Chroma and the embedding model while the first page renders
+    return start_warmup()
+
+
+if WARMUP_ON_START:
+    get_warmup_thread()
+
 st.title("🤖 Multi-Agent RAG Chatbot")
 st.write("Ask questions about your documents. The system uses Retrieval + Multi-Agent AI workflow with conversation memory.")
 
@@ -90,13 +120,39 @@ with st.sidebar:
             save_path = os.path.join(DOCS_DIR, file.name)
             with open(save_path, "wb") as f:
                 f.write(file.getbuffer())
-        st.success("Files uploaded. Click 'Reindex Documents' to include them.")
+        if watcher:
+            st.success("Files uploaded. They will be indexed in the background.")
+        else:
+            st.success("Files uploaded. Click 'Reindex Documents' to include them.")
+
+    if watcher:
+        mark = watcher.watermark()
+        if mark["indexed_through"] is None:
+            st.caption("Background indexing: starting...")
+        else:
+            through = time.strftime("%H:%M:%S", time.localtime(mark["indexed_through"]))
+            pending = f", {mark['pending_files']} files pending" if mark["pending_files"] else ""
+            st.caption(f"Indexed through {through}{pending}")
+        if mark["last_error"]:
+            st.warning(f"Background indexing error: {mark['last_error']}")
 
     if st.button("Reindex Documents"):
         with st.spinner("Indexing documents..."):
             count = index_all_documents()
         st.success(f"Indexed {count} chunks.")
 
+        report = get_last_index_report()
+        skipped = report.get("exact_duplicates", 0) + report.get("near_duplicates", 0)
+        if skipped:
+            st.caption(
+                f"Skipped {skipped} duplicate chunks "
+                f"({report['exact_duplicates']} exact, {report['near_duplicates']} near), "
+                f"{report['chars_saved']:,} characters not embedded."
+            )
+
+    with st.expander("Startup timeline"):
+        st.code(startup.format_timeline() or "No events yet.")
+
 
 # ----------------------------
 # Session state for chat
@@ -151,8 +207,8 @@ for msg in reversed(st.session_state.chat_history):
     if msg["sources"]:
         st.markdown("### 📄 Sources")
         for s in msg["sources"]:
-            src = s["metadata"].get("source", "unknown")
-            idx = s["metadata"].get("chunk_index", "?")
-            st.markdown(f"- **{src}** (chunk {idx})")
+            # A deduplicated chunk is cited for every file that contains it
+            for src, idx in cited_sources(s["metadata"]):
+                st.markdown(f"- **{src}** (chunk {idx})")
 
     st.markdown("---")
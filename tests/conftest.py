@@ -0,0 +1,77 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with the call signature of a Hugging Face tokenizer."""
+
+    def tokenize(self, text):
+        return text.lower().split()
+
+    def __call__(self, texts, add_special_tokens=True, truncation=False, max_length=None, **kwargs):
+        ids = []
+        for text in texts:
+            row = [hash(word) % 30000 for word in text.lower().split()]
+            if truncation and max_length:
+                row = row[:max_length]
+            ids.append(row)
+        return {"input_ids": ids}
+
+
+class StubEmbedder:
+    """
+    Stands in for the SentenceTransformer: a normalized bag of hashed
+    words, so texts sharing words are close and results are repeatable.
+    """
+
+    dim = 384
+    max_seq_length = 256
+    tokenizer = StubTokenizer()
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        self.calls += 1
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dim] += 1.0
+            norm = np.linalg.norm(out[i])
+            out[i] /= norm or 1.0
+        return out
+
+
+@pytest.fixture
+def stub_embedder(monkeypatch):
+    """Replaces the embedding model (and the on-disk embedding cache) with StubEmbedder."""
+    from backend import embeddings
+
+    model = StubEmbedder()
+    monkeypatch.setattr(embeddings, "get_embedder", lambda: model)
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda *args, **kwargs: None)
+    embeddings._embed_normalized_query.cache_clear()
+    yield model
+    embeddings._embed_normalized_query.cache_clear()
+
+
+def random_unit_vectors(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def chroma_dir(tmp_path, monkeypatch, stub_embedder):
+    """A fresh Chroma directory for the stores of vector_store.py."""
+    from backend import vector_store
+
+    monkeypatch.setattr(vector_store, "VECTOR_DB_DIR", tmp_path)
+    monkeypatch.setattr(vector_store, "_client", None)
+    monkeypatch.setattr(vector_store, "_stores", {})
+    return tmp_path
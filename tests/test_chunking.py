@@ -0,0 +1,100 @@
+import json
+import mmap
+
+import pytest
+
+from backend import chunking, embeddings
+from backend.chunking import (
+    iter_word_chunks,
+    iter_mapped_word_chunks,
+    iter_token_chunks,
+    iter_mapped_token_chunks,
+)
+
+SENTENCES = [
+    "The retriever embeds every chunk once.",
+    "Queries are embedded with the same model!",
+    "Does a long sentence about vector indexes, HNSW graphs and product quantization still fit?",
+    "Short one.",
+] * 40
+TEXT = " ".join(SENTENCES) + "\n" + "word " * 300
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    """A local 'model': a small WordPiece tokenizer and a sentence-transformers config."""
+    from tokenizers import BertWordPieceTokenizer
+    from transformers import PreTrainedTokenizerFast
+
+    trainer = BertWordPieceTokenizer(lowercase=True)
+    trainer.train_from_iterator([TEXT], vocab_size=400)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=trainer._tokenizer,
+        unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]", pad_token="[PAD]",
+    )
+    path = tmp_path_factory.mktemp("model")
+    tokenizer.save_pretrained(str(path))
+    (path / "sentence_bert_config.json").write_text(json.dumps({"max_seq_length": 34}))
+    return path
+
+
+@pytest.fixture
+def budget(model_dir, monkeypatch):
+    def no_model():
+        raise AssertionError("chunking loaded the embedding model")
+
+    monkeypatch.setattr(chunking, "EMBED_MODEL", str(model_dir))
+    monkeypatch.setattr(embeddings, "get_embedder", no_model)
+    chunking.token_budget.cache_clear()
+    yield chunking.token_budget()
+    chunking.token_budget.cache_clear()
+
+
+def pieces(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def normalized(text):
+    return " ".join(text.split())
+
+
+def test_token_budget_from_tokenizer_and_config(budget):
+    tokenizer, max_tokens = budget
+    assert max_tokens == 32
+    assert chunking.token_budget()[0] is tokenizer
+
+
+def test_token_chunks_fit_budget_and_match_offsets(budget):
+    tokenizer, max_tokens = budget
+    chunks = list(iter_token_chunks(pieces(TEXT, 97)))
+    assert len(chunks) > 10
+    for text, start, end in chunks:
+        assert len(tokenizer(text, add_special_tokens=False)["input_ids"]) <= max_tokens
+        assert text == normalized(TEXT[start:end])
+    assert chunks == list(iter_token_chunks([TEXT]))
+
+
+def test_mapped_token_chunks_match_in_memory(budget, tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_bytes(TEXT.encode("utf-8"))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        mapped = [(start, end) for _, start, end in iter_mapped_token_chunks(buf, "utf-8")]
+    # ASCII text: byte and character offsets coincide
+    assert mapped == [(start, end) for _, start, end in iter_token_chunks([TEXT])]
+
+
+def test_word_chunks_streamed_and_mapped(monkeypatch, tmp_path):
+    monkeypatch.setattr(chunking, "CHUNK_SIZE", 25)
+    monkeypatch.setattr(chunking, "CHUNK_OVERLAP", 5)
+    words = TEXT.split()
+    chunks = list(iter_word_chunks(pieces(TEXT, 13)))
+    assert [text for text, _, _ in chunks] == [
+        " ".join(words[i : i + 25]) for i in range(0, len(words) - 5, 20)
+    ]
+    for text, start, end in chunks:
+        assert text == normalized(TEXT[start:end])
+
+    path = tmp_path / "doc.txt"
+    path.write_bytes(TEXT.encode("utf-8"))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        assert [(s, e) for _, s, e in iter_mapped_word_chunks(buf)] == [(s, e) for _, s, e in chunks]
@@ -0,0 +1,57 @@
+import chromadb
+import pytest
+
+from backend import collection_rebuild
+from backend.collection_rebuild import finish_swap, hnsw_changes, hnsw_metadata, rebuild_collection
+
+
+@pytest.fixture(autouse=True)
+def params(monkeypatch):
+    monkeypatch.setitem(collection_rebuild.HNSW_PARAMS, "docs", {"M": 32})
+
+
+@pytest.fixture
+def client(tmp_path):
+    return chromadb.PersistentClient(path=str(tmp_path))
+
+
+def test_hnsw_changes():
+    assert hnsw_changes(hnsw_metadata("docs", M=32), "docs") == ""
+    # Chroma's defaults stand in for parameters the collection was created without
+    assert hnsw_changes({}, "docs") == "M 16 -> 32"
+    assert hnsw_changes({"hnsw:M": 32, "hnsw:search_ef": 50}, "docs") == "search_ef 50 -> 10"
+
+
+def test_rebuild_swaps_in_the_copy(client):
+    collection = client.create_collection("docs")
+    collection.add(
+        ids=["a", "b"],
+        documents=["one", "two"],
+        metadatas=[{"n": 1}, {"n": 2}],
+        embeddings=[[1.0, 0.0], [0.0, 1.0]],
+    )
+
+    rebuilt = rebuild_collection(
+        client,
+        collection,
+        lambda name: client.create_collection(name, metadata=hnsw_metadata("docs")),
+        ["a", "b"],
+        ["documents", "metadatas", "embeddings"],
+        lambda page: [[2 * x for x in vector] for vector in page["embeddings"]],
+    )
+    assert [c.name for c in client.list_collections()] == ["docs"]
+    assert rebuilt.metadata["hnsw:M"] == 32
+    page = client.get_collection("docs").get(ids=["b"], include=["documents", "metadatas", "embeddings"])
+    assert (page["documents"], page["metadatas"]) == (["two"], [{"n": 2}])
+    assert list(page["embeddings"][0]) == [0.0, 2.0]
+
+
+@pytest.mark.parametrize("copy_renamed", [False, True])
+def test_finish_swap(client, copy_renamed):
+    client.create_collection("docs_replaced", metadata={"kept": "original"})
+    if copy_renamed:
+        client.create_collection("docs", metadata={"kept": "copy"})
+
+    finish_swap(client, "docs")
+    assert [c.name for c in client.list_collections()] == ["docs"]
+    assert client.get_collection("docs").metadata["kept"] == ("copy" if copy_renamed else "original")
@@ -0,0 +1,171 @@
+import functools
+import json
+import sqlite3
+
+import pytest
+
+from backend import document_loader, pdf_cache, rag_pipeline
+from backend.dedup import ChunkDeduplicator, cited_sources, content_chunk_id, source_flag
+from backend.flat_index import FlatVectorStore
+from backend.index_manifest import IndexManifest, TrackedDict, MANIFEST_VERSION, current_settings
+from backend.vector_store import VectorStore
+
+TEXT = " ".join(f"word{i}" for i in range(80))
+# One word changed: SimHash distance 5
+NEAR_TEXT = TEXT.replace("word40 ", "changed ")
+OTHER_TEXT = " ".join(f"other{i}" for i in range(80))
+
+
+def meta(index, start=None, end=None):
+    return {"chunk_index": index, "start_offset": start, "end_offset": end}
+
+
+def test_exact_duplicates_share_one_chunk():
+    dedup = ChunkDeduplicator(TrackedDict(), near_dup=False)
+    chunk_id, is_new = dedup.add("a.txt", TEXT, meta(0))
+    assert (chunk_id, is_new) == (content_chunk_id(TEXT), True)
+    assert dedup.add("b.txt", TEXT, meta(3)) == (chunk_id, False)
+    assert dedup.metadata(chunk_id)["sources"] == "a.txt, b.txt"
+    assert dedup.report["exact_duplicates"] == 1
+
+    assert dedup.release("a.txt", [chunk_id]) == []
+    assert dedup.metadata(chunk_id)["source"] == "b.txt"
+    assert dedup.release("b.txt", [chunk_id]) == [chunk_id]
+    assert chunk_id not in dedup.registry
+
+
+def test_near_duplicates_fold_into_other_files_only():
+    dedup = ChunkDeduplicator(TrackedDict(), near_dup=True, max_distance=8)
+    chunk_id, _ = dedup.add("a.txt", TEXT, meta(0))
+    assert dedup.add("b.txt", NEAR_TEXT, meta(0)) == (chunk_id, False)
+    assert dedup.add("b.txt", OTHER_TEXT, meta(1))[1]
+    assert dedup.report["near_duplicates"] == 1
+
+    # An edit within the same file is a new chunk
+    dedup = ChunkDeduplicator(TrackedDict(), near_dup=True, max_distance=8)
+    dedup.add("a.txt", TEXT, meta(0))
+    assert dedup.add("a.txt", NEAR_TEXT, meta(1))[1]
+
+
+def test_metadata_attributes_every_file():
+    dedup = ChunkDeduplicator(TrackedDict(), near_dup=True, max_distance=8)
+    chunk_id, _ = dedup.add("a.txt", TEXT, meta(0, 0, 500))
+    dedup.add("b.txt", TEXT, meta(2, 900, 1400))
+    # The stored text is a.txt's: c.txt gets no offsets into it
+    dedup.add("c.txt", NEAR_TEXT, meta(5, 100, 600))
+    metadata = dedup.metadata(chunk_id)
+    assert all(metadata[source_flag(name)] is True for name in ("a.txt", "b.txt", "c.txt"))
+    assert cited_sources(metadata) == [("a.txt", 0), ("b.txt", 2), ("c.txt", 5)]
+    assert dedup.registry[chunk_id]["sources"]["c.txt"] == [5, None, None]
+
+    # Released files are unflagged; the first exact file gives the offsets
+    dedup.release("a.txt", [chunk_id])
+    metadata = dedup.metadata(chunk_id)
+    assert metadata[source_flag("a.txt")] is False
+    assert (metadata["source"], metadata["start_offset"]) == ("b.txt", 900)
+    dedup.release("b.txt", [chunk_id])
+    metadata = dedup.metadata(chunk_id)
+    assert (metadata["source"], metadata["start_offset"], metadata["end_offset"]) == ("c.txt", -1, -1)
+
+
+@pytest.mark.parametrize("backend", ["flat", "chroma"])
+def test_stores_find_chunks_of_every_file(backend, chroma_dir):
+    if backend == "flat":
+        store = FlatVectorStore("t", directory=chroma_dir / "flat", lexical=False)
+    else:
+        store = VectorStore(lexical=False)
+    dedup = ChunkDeduplicator(TrackedDict(), near_dup=False)
+    shared, _ = dedup.add("a.txt", TEXT, meta(0, 0, 500))
+    own, _ = dedup.add("a.txt", OTHER_TEXT, meta(1, 500, 1000))
+    dedup.add("b.txt", TEXT, meta(0, 0, 500))
+    store.add_documents([{"id": i, "text": t, "metadata": dedup.metadata(i)} for i, t in ((shared, TEXT), (own, OTHER_TEXT))])
+    assert sorted(store.source_ids("a.txt")) == sorted([shared, own])
+    assert store.source_ids("b.txt") == [shared]
+
+    dedup.release("b.txt", [shared])
+    store.update_metadatas([shared], [dedup.metadata(shared)])
+    assert store.source_ids("b.txt") == []
+    dedup.add("c.txt", TEXT, meta(4, 0, 500))
+    store.update_metadatas([shared], [dedup.metadata(shared)])
+    store.delete_source("c.txt")
+    assert store.source_ids("a.txt") == [own]
+
+
+def test_manifest_saves_changed_rows_only(tmp_path):
+    path = tmp_path / "manifest.sqlite3"
+    manifest = IndexManifest(path)
+    dedup = ChunkDeduplicator(manifest.chunks, near_dup=False)
+    ids = [dedup.add("a.txt", text, meta(i))[0] for i, text in enumerate([TEXT, OTHER_TEXT])]
+    manifest.save()
+
+    reloaded = IndexManifest(path)
+    assert reloaded.chunks == manifest.chunks
+    assert not reloaded.settings_changed
+
+    dedup = ChunkDeduplicator(reloaded.chunks, near_dup=False)
+    dedup.add("b.txt", TEXT, meta(0))
+    dedup.release("a.txt", [ids[1]])
+    assert reloaded.chunks.changed == set(ids)
+    reloaded.save()
+    assert not reloaded.chunks.changed
+
+    with sqlite3.connect(path) as db:
+        rows = dict(db.execute("SELECT id, entry FROM chunks"))
+    assert list(rows) == [ids[0]]
+    assert json.loads(rows[ids[0]])["sources"] == {"a.txt": [0, None, None], "b.txt": [0, None, None]}
+
+
+def test_manifest_migrates_json(tmp_path):
+    chunks = {"abc": {"sources": {"a.txt": [0, None, None]}, "simhash": "00ff"}}
+    legacy = tmp_path / "manifest.json"
+    legacy.write_text(
+        json.dumps({"version": MANIFEST_VERSION, "settings": current_settings(), "files": {}, "chunks": chunks})
+    )
+    manifest = IndexManifest(tmp_path / "manifest.sqlite3")
+    assert manifest.chunks == chunks
+    manifest.save()
+    assert not legacy.exists()
+    assert IndexManifest(tmp_path / "manifest.sqlite3").chunks == chunks
+
+
+@pytest.fixture
+def indexed_dir(tmp_path, monkeypatch, stub_embedder):
+    from backend import chunking
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    monkeypatch.setattr(chunking, "CHUNKER", "words")
+    monkeypatch.setattr(chunking, "CHUNK_SIZE", 50)
+    monkeypatch.setattr(chunking, "CHUNK_OVERLAP", 10)
+    monkeypatch.setattr(document_loader, "DOCS_DIR", docs)
+    monkeypatch.setattr(pdf_cache, "PDF_TEXT_CACHE_DIR", tmp_path / "pdf_cache")
+    monkeypatch.setattr(rag_pipeline, "IndexManifest", functools.partial(IndexManifest, tmp_path / "manifest.sqlite3"))
+
+    store = FlatVectorStore("documents", directory=tmp_path / "flat", lexical=False)
+    monkeypatch.setattr(rag_pipeline, "get_store", lambda: store)
+    yield docs, store
+    store.close()
+    chunking.release_mapped_files()
+
+
+def test_reindex_reuses_manifest(indexed_dir, stub_embedder):
+    docs, store = indexed_dir
+    (docs / "a.txt").write_text(TEXT)
+    (docs / "b.txt").write_text(TEXT + " " + OTHER_TEXT)
+
+    total = rag_pipeline.index_all_documents(workers=1)
+    assert total == store.count()
+    assert rag_pipeline.get_last_index_report()["exact_duplicates"] > 0
+    shared = set(store.source_ids("a.txt")) & set(store.source_ids("b.txt"))
+    assert len(shared) == 1
+    cited = cited_sources(store.get_documents(list(shared))[0]["metadata"])
+    assert [name for name, _ in cited] == ["a.txt", "b.txt"]
+
+    calls = stub_embedder.calls
+    assert rag_pipeline.index_all_documents(workers=1) == total
+    assert stub_embedder.calls == calls
+    assert rag_pipeline.get_last_index_report()["chunks_embedded"] == 0
+
+    (docs / "a.txt").unlink()
+    assert rag_pipeline.index_all_documents(workers=1) == store.count()
+    assert stub_embedder.calls == calls
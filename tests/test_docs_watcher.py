@@ -0,0 +1,42 @@
+from backend import docs_watcher
+from backend.docs_watcher import DocsWatcher
+
+
+def test_indexes_once_every_file_is_stable_for_an_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(docs_watcher, "DOCS_DIR", tmp_path)
+    watcher = DocsWatcher(poll_seconds=10)
+    runs = []
+
+    def index(snap, started):
+        runs.append(started)
+        watcher._indexed_snapshot = snap
+        watcher._indexed_through = started
+
+    monkeypatch.setattr(watcher, "_index", index)
+
+    (tmp_path / "a.txt").write_text("half")
+    watcher._poll(100)
+    # Woken early (e.g. by a watchdog event): unchanged, but not for 10s yet
+    watcher._poll(103)
+    assert runs == []
+    watcher._poll(110)
+    assert runs == [110]
+
+    (tmp_path / "a.txt").write_text("half written")
+    watcher._poll(111)
+    (tmp_path / "b.txt").write_text("new")
+    watcher._poll(115)
+    watcher._poll(121)
+    # a.txt is stable, b.txt changed 6s ago
+    assert runs == [110]
+    watcher._poll(125)
+    assert runs == [110, 125]
+
+    (tmp_path / "b.txt").unlink()
+    watcher._poll(126)
+    watcher._poll(130)
+    assert runs == [110, 125]
+    watcher._poll(136)
+    assert runs == [110, 125, 136]
+    watcher._poll(140)
+    assert watcher.watermark()["indexed_through"] == 140
@@ -0,0 +1,99 @@
+import pytest
+
+from backend import chunking, document_loader
+from backend.document_loader import doc_text
+from backend.chunking import iter_word_chunks
+
+TEXTS = {
+    "a.txt": ("Café au lait. " * 300, "utf-8"),
+    "b.txt": ("Naïve résumé, façade\n" * 200, "latin-1"),
+    "c.txt": ("plain ascii words " * 500, "utf-8"),
+}
+
+
+@pytest.fixture
+def docs_dir(tmp_path, monkeypatch):
+    settings = {"CHUNKER": "words", "CHUNK_SIZE": 50, "CHUNK_OVERLAP": 10}
+    for name, value in settings.items():
+        monkeypatch.setattr(chunking, name, value)
+        # Parser processes are spawned and read the settings from the environment
+        monkeypatch.setenv(name, str(value))
+    monkeypatch.setattr(document_loader, "DOCS_DIR", tmp_path)
+    for name, (text, encoding) in TEXTS.items():
+        (tmp_path / name).write_bytes(text.encode(encoding))
+    yield tmp_path
+    chunking.release_mapped_files()
+
+
+def test_load_documents_returns_text(docs_dir):
+    docs = document_loader.load_documents(workers=1)
+    assert docs
+    for doc in docs:
+        assert set(doc) == {"id", "text", "metadata"}
+        assert doc["text"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mapped_spans_match_in_memory_chunks(docs_dir, workers):
+    docs = document_loader.load_documents(workers=workers)
+    for name, (text, encoding) in TEXTS.items():
+        expected = [chunk for chunk, _, _ in iter_word_chunks([text])]
+        assert [d["text"] for d in docs if d["metadata"]["source"] == name] == expected
+
+
+def test_spans_round_trip(docs_dir):
+    path = docs_dir / "b.txt"
+    raw = path.read_bytes()
+    docs = list(document_loader.iter_file_docs(path))
+    assert all("span" in doc for doc in docs)
+    for doc in docs:
+        start, end = doc["metadata"]["start_offset"], doc["metadata"]["end_offset"]
+        assert document_loader.doc_text(doc) == " ".join(raw[start:end].decode("latin-1").split())
+
+
+def write_pdf(path, pages):
+    """Minimal PDF with one line of Helvetica text per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(pages))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(out)
+
+
+def test_pdfs_are_counted_and_split_in_workers(docs_dir, monkeypatch):
+    monkeypatch.setattr(document_loader, "PDF_PAGES_PER_TASK", 4)
+    monkeypatch.setenv("PDF_PAGES_PER_TASK", "4")
+    monkeypatch.setattr(document_loader.pdf_cache, "PDF_TEXT_CACHE", False)
+    monkeypatch.setenv("PDF_TEXT_CACHE", "false")
+    write_pdf(docs_dir / "small.pdf", [f"small page {i}" for i in range(3)])
+    write_pdf(docs_dir / "big.pdf", [f"big page {i} text" for i in range(10)])
+    paths = document_loader.iter_document_files()
+    expected = {path.name: [doc_text(d) for d in docs] for path, docs in document_loader.load_files(paths, workers=1)}
+    assert "big page 9 text" in expected["big.pdf"][-1]
+
+    def parent_count(path):
+        raise AssertionError("the parent must not parse PDFs to count their pages")
+
+    monkeypatch.setattr(document_loader, "_pdf_page_count", parent_count)
+    found = {
+        path.name: [doc_text(d) for d in docs]
+        for path, docs in document_loader.load_files(paths, workers=2)
+    }
+    assert found == expected
@@ -0,0 +1,77 @@
+import numpy as np
+
+from backend import embeddings
+from backend.embedding_cache import EmbeddingCache, text_key
+from conftest import random_unit_vectors
+
+DIM = 8
+
+
+def keys(n, prefix="text"):
+    return [text_key(f"{prefix} {i}") for i in range(n)]
+
+
+def test_entries_reused_across_instances(tmp_path):
+    vectors = random_unit_vectors(50, DIM)
+    cache = EmbeddingCache("model", tmp_path)
+    cache.put_many(keys(50), vectors)
+
+    reopened = EmbeddingCache("model", tmp_path)
+    found, missing = reopened.get_many(keys(60))
+    assert missing == list(range(50, 60))
+    np.testing.assert_array_equal(found[:50], vectors)
+
+    found, missing = EmbeddingCache("other model", tmp_path).get_many(keys(5))
+    assert found is None and missing == list(range(5))
+
+
+def test_least_recently_used_evicted_at_cap(tmp_path):
+    # Room for 1024 rows of DIM float32
+    cache = EmbeddingCache("model", tmp_path, max_mb=1024 * DIM * 4 / (1024 * 1024))
+    first, second = keys(1000, "first"), keys(100, "second")
+    cache.put_many(first, random_unit_vectors(1000, DIM, seed=1))
+    cache.get_many(first[500:])  # recently used
+    cache.put_many(second, random_unit_vectors(100, DIM, seed=2))
+
+    assert cache.evictions > 0
+    assert cache.capacity == 1024
+    _, missing = cache.get_many(first[500:] + second)
+    assert missing == []
+    _, missing = cache.get_many(first[:500])
+    assert len(missing) == cache.evictions
+
+    reopened = EmbeddingCache("model", tmp_path)
+    assert reopened.stats()["entries"] == cache.stats()["entries"]
+
+
+def test_processes_sharing_a_directory_see_each_others_rows(tmp_path):
+    # Two instances on one directory stand in for two processes
+    a = EmbeddingCache("model", tmp_path)
+    b = EmbeddingCache("model", tmp_path)
+    vectors_a = random_unit_vectors(20, DIM, seed=1)
+    vectors_b = random_unit_vectors(3000, DIM, seed=2)  # grows the matrix
+    a.put_many(keys(20, "a"), vectors_a)
+    b.put_many(keys(3000, "b"), vectors_b)
+    a.put_many(keys(5, "c"), random_unit_vectors(5, DIM, seed=3))
+
+    for cache in (a, b, EmbeddingCache("model", tmp_path)):
+        found, missing = cache.get_many(keys(20, "a") + keys(3000, "b"))
+        assert missing == []
+        np.testing.assert_array_equal(found[:20], vectors_a)
+        np.testing.assert_array_equal(found[20:], vectors_b)
+
+
+def test_queries_skip_the_disk_cache(tmp_path, stub_embedder, monkeypatch):
+    cache = EmbeddingCache("stub", tmp_path)
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda *args, **kwargs: cache)
+
+    query = embeddings.embed_query("what is hybrid retrieval?")
+    batch = embeddings.embed_queries(["what is hybrid retrieval?", "second question"])
+    np.testing.assert_array_equal(batch[0], query)
+    assert cache.stats()["entries"] == 0
+
+    embeddings.embed_array(["a chunk text"])
+    assert cache.stats()["entries"] == 1
+    calls = stub_embedder.calls
+    embeddings.embed_array(["a chunk text"])
+    assert stub_embedder.calls == calls
@@ -0,0 +1,18 @@
+import pytest
+
+from backend import embeddings
+
+
+def test_onnx_load_failure_raises(monkeypatch):
+    def fail(quantized, threads=None):
+        raise ImportError("optimum is not installed")
+
+    monkeypatch.setattr(embeddings, "_load_onnx", fail)
+    for backend in ("onnx", "onnx-int8"):
+        with pytest.raises(RuntimeError, match=backend):
+            embeddings.load_embedder(backend)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        embeddings.load_embedder("tensorrt")
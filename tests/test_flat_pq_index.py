@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+
+from backend import pq_index
+from backend.flat_index import FlatVectorStore
+from backend.pq_index import PQVectorStore
+from conftest import random_unit_vectors
+
+DIM = 32
+
+
+def make_docs(n, start=0):
+    return [
+        {"id": f"c{i}", "text": f"chunk {i}", "metadata": {"source": f"f{i % 7}.txt"}}
+        for i in range(start, start + n)
+    ]
+
+
+def brute_force(corpus, ids, queries, k):
+    distances = ((queries[:, None, :] - corpus[None, :, :]) ** 2).sum(axis=2)
+    return [[ids[j] for j in np.argsort(row, kind="stable")[:k]] for row in distances]
+
+
+def found_ids(store, queries, k):
+    return [[r["id"] for r in results] for results in store.query(queries, k)]
+
+
+def test_flat_top_k_is_exact(tmp_path, stub_embedder):
+    vectors = random_unit_vectors(600, DIM)
+    queries = random_unit_vectors(20, DIM, seed=1)
+    docs = make_docs(600)
+    store = FlatVectorStore("t", directory=tmp_path, lexical=False)
+    store.add_documents(docs, embeddings=vectors, batch_size=250, pipeline=False)
+    assert store.count() == 600
+    assert found_ids(store, queries, 10) == brute_force(vectors, [d["id"] for d in docs], queries, 10)
+
+    # Deleted rows are reused, and norms survive a reopen
+    store.delete_documents([f"c{i}" for i in range(100)])
+    store.add_documents(make_docs(50, start=600), embeddings=vectors[:50], pipeline=False)
+    assert store.capacity == 1024 and store._size == 600
+    store.close()
+
+    keep = list(range(100, 600))
+    corpus = np.vstack([vectors[keep], vectors[:50]])
+    ids = [f"c{i}" for i in keep] + [f"c{i}" for i in range(600, 650)]
+    expected = brute_force(corpus, ids, queries, 10)
+    for norms_file in (True, False):
+        if not norms_file:
+            (tmp_path / "norms.npy").unlink()
+        store = FlatVectorStore("t", directory=tmp_path, lexical=False)
+        assert store.count() == 550
+        assert found_ids(store, queries, 10) == expected
+        assert store.existing_ids(["c0", "c100", "c649", "nope"]) == ["c100", "c649"]
+        store.close()
+
+
+def test_pq_recall_against_brute_force(tmp_path, stub_embedder):
+    vectors = random_unit_vectors(1500, DIM)
+    queries = random_unit_vectors(30, DIM, seed=1)
+    docs = make_docs(1500)
+    store = PQVectorStore("t", directory=tmp_path, lexical=False, subvectors=8, train_min=1000, rerank=200)
+    store.add_documents(docs, embeddings=vectors, batch_size=500, pipeline=False)
+    store._trainer.join()
+    assert store.quantizer is not None and store.bytes_per_vector == 8
+
+    expected = brute_force(vectors, [d["id"] for d in docs], queries, 5)
+    found = found_ids(store, queries, 5)
+    recall = np.mean([len(set(e) & set(f)) / 5 for e, f in zip(expected, found)])
+    assert recall >= 0.9
+    store.close()
+
+    reopened = PQVectorStore("t", directory=tmp_path, lexical=False, subvectors=8, train_min=1000, rerank=200)
+    assert reopened.quantizer is not None
+    assert found_ids(reopened, queries, 5) == found
+    reopened.close()
+
+
+def test_pq_writes_go_on_while_training(tmp_path, stub_embedder, monkeypatch):
+    vectors = random_unit_vectors(3000, DIM)
+    fitting, release = threading.Event(), threading.Event()
+    fit = pq_index.ProductQuantizer.fit
+
+    def slow_fit(*args, **kwargs):
+        fitting.set()
+        release.wait(10)
+        return fit(*args, **kwargs)
+
+    monkeypatch.setattr(pq_index.ProductQuantizer, "fit", slow_fit)
+    store = PQVectorStore("t", directory=tmp_path, lexical=False, subvectors=8, train_min=1000)
+    store.add_documents(make_docs(1000), embeddings=vectors[:1000], pipeline=False)
+    assert fitting.wait(10)
+
+    # Training holds no store lock: writes (growing the files) and searches go on
+    store.add_documents(make_docs(2000, start=1000), embeddings=vectors[1000:], pipeline=False)
+    store.add_documents(make_docs(10), embeddings=vectors[2990:], pipeline=False)
+    assert len(store.search("q", k=3, query_embedding=vectors[5])) == 3
+    release.set()
+    store._trainer.join()
+
+    valid = np.flatnonzero(store._valid)
+    assert len(valid) == 3000
+    np.testing.assert_array_equal(
+        store._codes[:, valid], store.quantizer.encode(store._vectors[valid]).T
+    )
+    store.close()
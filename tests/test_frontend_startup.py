@@ -0,0 +1,16 @@
+import ast
+from pathlib import Path
+
+APP = Path(__file__).resolve().parents[1] / "frontend" / "chatbot_app.py"
+
+
+def test_streamlit_not_used_before_import():
+    """Every top-level statement using `st` comes after `import streamlit as st`."""
+    tree = ast.parse(APP.read_text(encoding="utf-8"))
+    imported = False
+    for node in tree.body:
+        if isinstance(node, ast.Import) and any(alias.asname == "st" for alias in node.names):
+            imported = True
+            continue
+        names = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+        assert imported or "st" not in names, f"line {node.lineno} uses st before it is imported"
@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+from backend.agents.retriever_agent import RetrieverAgent
+from backend.flat_index import FlatVectorStore
+from backend.lexical_index import BM25_B, BM25_K1, LexicalIndex, reciprocal_rank_fusion
+
+TEXTS = {
+    "a": "apple apple banana",
+    "b": "apple cherry",
+    "c": "cherry cherry cherry date",
+}
+
+
+def bm25(query_terms, texts, chunk_id):
+    lengths = {i: len(text.split()) for i, text in texts.items()}
+    avg_length = sum(lengths.values()) / len(texts)
+    score = 0.0
+    for term in query_terms:
+        df = sum(term in text.split() for text in texts.values())
+        tf = texts[chunk_id].split().count(term)
+        if not tf:
+            continue
+        idf = math.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[chunk_id] / avg_length)
+        score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return score
+
+
+def test_bm25_scores(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.sqlite3")
+    index.add(list(TEXTS), list(TEXTS.values()))
+    hits = index.search("Apple and cherry?", k=3)
+    assert [h[0] for h in hits] == sorted(TEXTS, key=lambda i: -bm25(["apple", "cherry"], TEXTS, i))
+    for chunk_id, score, matched in hits:
+        assert score == pytest.approx(bm25(["apple", "cherry"], TEXTS, chunk_id), rel=1e-5)
+    assert {h[0]: h[2] for h in hits} == {"a": 1, "b": 2, "c": 1}
+
+    # Re-adding replaces, deleting drops
+    index.add(["b"], ["date"])
+    index.delete(["c"])
+    assert index.search("cherry") == []
+    assert index.count() == 2
+    index.close()
+
+
+def test_two_instances_share_the_file(tmp_path):
+    path = tmp_path / "lexical.sqlite3"
+    app, ingest = LexicalIndex(path), LexicalIndex(path)
+    app.add(["a"], [TEXTS["a"]])
+    assert app.search("apple")[0][0] == "a"
+
+    # Written by the other instance after `app` loaded its maps
+    ingest.add(["b", "c"], [TEXTS["b"], TEXTS["c"]])
+    assert {h[0] for h in app.search("apple cherry")} == {"a", "b", "c"}
+    app.add(["d"], ["apple date"])
+    ingest.delete(["a"])
+    assert {h[0] for h in app.search("apple")} == {"b", "d"}
+    assert app.count() == ingest.count() == 3
+    app.close()
+    ingest.close()
+
+
+def test_reciprocal_rank_fusion_order():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    # b: 1/62 + 1/61, a: 1/61, d: 1/62, c: 1/63
+    assert fused == ["b", "a", "d", "c"]
+
+
+def test_fuse_fetches_lexical_only_hits(tmp_path, stub_embedder):
+    store = FlatVectorStore("t", directory=tmp_path, lexical=False)
+    store.add_documents([{"id": i, "text": text, "metadata": {"source": "f.txt"}} for i, text in TEXTS.items()])
+    agent = RetrieverAgent.__new__(RetrieverAgent)
+    agent.store = store
+
+    dense = store.search("apple banana", k=2)
+    assert [r["id"] for r in dense] == ["a", "b"]
+    # b: 1/62 + 1/61, a: 1/61, c (BM25 only): 1/62
+    results = agent._fuse(dense, [("b", 3.0, 1), ("c", 1.0, 1)], k=3)
+    assert [r["id"] for r in results] == ["b", "a", "c"]
+    assert results[2]["text"] == TEXTS["c"]
+    store.close()
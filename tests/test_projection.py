@@ -0,0 +1,42 @@
+import numpy as np
+
+from backend.projection import PCAProjection, SavedProjection
+from conftest import random_unit_vectors
+
+
+def test_projection_keeps_unit_vectors(tmp_path):
+    vectors = random_unit_vectors(50, 16)
+    projection = PCAProjection.fit(vectors, 4)
+    projected = projection.transform(vectors)
+    assert projected.shape == (50, 4)
+    assert np.allclose(np.linalg.norm(projected, axis=1), 1.0, atol=1e-5)
+
+    projection.save(tmp_path / "p.npz")
+    loaded = PCAProjection.load(tmp_path / "p.npz")
+    assert loaded.fingerprint() == projection.fingerprint()
+    assert PCAProjection.load(tmp_path / "missing.npz") is None
+
+
+def test_recover_picks_the_projection_the_vectors_went_through(tmp_path):
+    old = PCAProjection.fit(random_unit_vectors(20, 16), 4)
+    new = PCAProjection.fit(random_unit_vectors(20, 16, seed=1), 8)
+    saved = SavedProjection(tmp_path / "docs.npz")
+    saved.set(old)
+
+    # Crash after the collection was rewritten with `new`
+    saved.stage(new)
+    saved = SavedProjection(tmp_path / "docs.npz")
+    saved.recover("docs", new.fingerprint(), lambda: 8)
+    assert saved.fingerprint() == new.fingerprint()
+    assert not saved.pending_path.exists()
+
+    # Crash before: the staged projection is dropped
+    saved.stage(old)
+    saved.recover("docs", new.fingerprint(), lambda: 8)
+    assert saved.fingerprint() == new.fingerprint()
+    assert not saved.pending_path.exists()
+
+    # Full-size vectors
+    saved.recover("docs", None, lambda: 16)
+    assert saved.projection is None and not saved.path.exists()
+    assert saved.transform(np.ones(16)).shape == (1, 16)
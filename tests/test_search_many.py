@@ -0,0 +1,50 @@
+import pytest
+
+from backend import sharded_store
+from backend.flat_index import FlatVectorStore
+from backend.sharded_store import ShardedVectorStore
+from backend.vector_store import VectorStore, MemoryStore
+
+DOCS = [
+    {"id": f"doc{i}", "text": f"chunk {i} about topic{i % 7} and word{i}", "metadata": {"source": f"f{i % 3}.txt"}}
+    for i in range(120)
+]
+QUERIES = ["topic3 word10", "", "chunk about topic5", "word99 word100", "   ", "nothing matches this"]
+
+
+def assert_same_results(store, k=5):
+    batched = store.search_many(QUERIES, k=k)
+    assert len(batched) == len(QUERIES)
+    for query, results in zip(QUERIES, batched):
+        single = store.search(query, k=k)
+        assert [r["id"] for r in results] == [r["id"] for r in single]
+        assert [r["distance"] for r in results] == pytest.approx([r["distance"] for r in single], abs=1e-5)
+
+
+def test_search_many_flat(tmp_path, stub_embedder):
+    store = FlatVectorStore("t", directory=tmp_path, lexical=False)
+    store.add_documents(DOCS)
+    assert_same_results(store)
+    store.close()
+
+
+def test_search_many_chroma(chroma_dir):
+    store = VectorStore(lexical=False)
+    store.add_documents(DOCS)
+    assert_same_results(store)
+
+
+def test_search_many_memory(chroma_dir):
+    store = MemoryStore()
+    for doc in DOCS[:30]:
+        store.add_memory(doc["text"])
+    assert_same_results(store, k=3)
+
+
+def test_search_many_sharded(tmp_path, monkeypatch, stub_embedder):
+    monkeypatch.setattr(sharded_store, "VECTOR_DB_DIR", tmp_path)
+    monkeypatch.setattr(sharded_store, "SHARD_DIRS", [])
+    store = ShardedVectorStore(shards=3, backend="flat", workers=2, lexical=False)
+    store.add_documents(DOCS)
+    assert_same_results(store)
+    store.close()
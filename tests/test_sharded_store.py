@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from backend import sharded_store
+from backend.embeddings import embed_array
+from backend.sharded_store import ShardedVectorStore
+from conftest import random_unit_vectors
+
+DIM = 32
+
+
+def brute_force(corpus, ids, query, k):
+    distances = ((corpus - query) ** 2).sum(axis=1)
+    return [ids[j] for j in np.argsort(distances, kind="stable")[:k]]
+
+
+@pytest.fixture
+def shard_root(tmp_path, monkeypatch, stub_embedder):
+    monkeypatch.setattr(sharded_store, "VECTOR_DB_DIR", tmp_path)
+    monkeypatch.setattr(sharded_store, "SHARD_DIRS", [])
+    return tmp_path
+
+
+@pytest.mark.parametrize("key", ["id", "source"])
+def test_sharded_top_k_matches_brute_force(shard_root, key):
+    vectors = random_unit_vectors(500, DIM)
+    queries = random_unit_vectors(15, DIM, seed=1)
+    docs = [
+        {"id": f"c{i}", "text": f"chunk {i}", "metadata": {"source": f"doc{i % 11}.txt"}}
+        for i in range(500)
+    ]
+    ids = [d["id"] for d in docs]
+
+    store = ShardedVectorStore(shards=3, backend="flat", key=key, workers=2, lexical=False)
+    store.add_documents(docs, embeddings=vectors, batch_size=128, pipeline=False)
+    assert store.count() == 500
+    assert all(shard.count() for shard in store.shards)
+    if key == "source":
+        for source in {d["metadata"]["source"] for d in docs}:
+            assert sum(bool(shard.source_ids(source)) for shard in store.shards) == 1
+    for query in queries:
+        found = [r["id"] for r in store.search("q", k=10, query_embedding=query)]
+        assert found == brute_force(vectors, ids, query, 10)
+
+    # Rewrites stay in their shard, deletes reach it
+    store.add_documents(docs[:50], embeddings=vectors[:50], pipeline=False)
+    store.delete_documents(ids[50:100])
+    assert store.count() == 450
+    keep = list(range(50)) + list(range(100, 500))
+    for query in queries:
+        found = [r["id"] for r in store.search("q", k=10, query_embedding=query)]
+        assert found == brute_force(vectors[keep], [ids[i] for i in keep], query, 10)
+    store.close()
+
+
+@pytest.fixture
+def reduced_shards(shard_root, chroma_dir, monkeypatch):
+    """Chroma shards storing 8-dim vectors once the collection holds 30."""
+    from backend import vector_store
+
+    for module in (vector_store, sharded_store):
+        monkeypatch.setattr(module, "EMBED_REDUCED_DIM", 8)
+        monkeypatch.setattr(module, "PCA_FIT_SAMPLES", 30)
+    return [
+        {"id": f"c{i}", "text": f"chunk {i} about topic{i % 7} and word{i}", "metadata": {"source": "f.txt"}}
+        for i in range(60)
+    ]
+
+
+def assert_exact_top_k(store, docs):
+    """Distances of every shard are in one space: the merged top-k is the collection's."""
+    projection = store.saved_projection.projection
+    corpus = projection.transform(embed_array([d["text"] for d in docs]))
+    for query in ("topic3 word10", "chunk 42", "about topic5"):
+        distances = ((corpus - projection.transform(embed_array([query]))) ** 2).sum(axis=1)
+        found = [r["distance"] for r in store.search(query, k=5)]
+        assert found == pytest.approx(sorted(distances)[:5], abs=1e-4)
+
+
+def test_chroma_shards_share_one_projection(reduced_shards):
+    docs = reduced_shards
+    store = ShardedVectorStore(shards=3, backend="chroma", lexical=False)
+    store.add_documents(docs, pipeline=False)
+    projection = store.saved_projection.projection
+    assert projection is not None and projection.dim == 8
+    assert {shard.collection.metadata["projection"] for shard in store.shards} == {projection.fingerprint()}
+    assert all(shard._stored_dim() == 8 for shard in store.shards)
+
+    assert_exact_top_k(store, docs)
+
+    reopened = ShardedVectorStore(shards=3, backend="chroma", lexical=False)
+    assert reopened.saved_projection.fingerprint() == projection.fingerprint()
+
+
+def test_interrupted_shard_reproject_is_finished(reduced_shards, monkeypatch):
+    store = ShardedVectorStore(shards=3, backend="chroma", workers=1, lexical=False)
+    store.add_documents(reduced_shards, pipeline=False)
+
+    def crash(projection):
+        raise RuntimeError("crash before the last shard")
+
+    monkeypatch.setattr(store.shards[2], "apply_projection", crash)
+    with pytest.raises(RuntimeError):
+        store.reproject(16)
+    assert [shard._stored_dim() for shard in store.shards] == [16, 16, 8]
+
+    store = ShardedVectorStore(shards=3, backend="chroma", lexical=False)
+    assert store.saved_projection.dim == 16
+    assert all(shard._stored_dim() == 16 for shard in store.shards)
+    assert len({shard.collection.metadata["projection"] for shard in store.shards}) == 1
+    assert_exact_top_k(store, reduced_shards)
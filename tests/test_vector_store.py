@@ -0,0 +1,110 @@
+import pytest
+
+from backend import collection_rebuild, vector_store
+from backend.vector_store import VectorStore
+
+DOCS = [
+    {"id": f"doc{i}", "text": f"chunk {i} about topic{i % 5} and word{i}", "metadata": {"source": f"f{i % 3}.txt"}}
+    for i in range(40)
+]
+
+
+def index_params(store):
+    """HNSW parameters the collection's vector index was actually built with."""
+    segments = store.client._server._sysdb.get_segments(collection=store.collection.id)
+    return next(s["metadata"] for s in segments if s["scope"].name == "VECTOR")
+
+
+def set_m(monkeypatch, m):
+    params = collection_rebuild.HNSW_PARAMS
+    monkeypatch.setitem(params, "documents", {**params["documents"], "M": m})
+
+
+def test_hnsw_change_rebuilds_existing_collection(chroma_dir, monkeypatch):
+    set_m(monkeypatch, 16)
+    store = VectorStore(lexical=False)
+    store.add_documents(DOCS)
+    assert index_params(store)["hnsw:M"] == 16
+
+    set_m(monkeypatch, 32)
+    store = VectorStore(lexical=False)
+    assert index_params(store)["hnsw:M"] == 32
+    assert store.collection.metadata["hnsw:M"] == 32
+    assert store.count() == len(DOCS)
+    assert store.search("topic3 word13", k=1)[0]["id"] == "doc13"
+
+
+def test_unchanged_hnsw_keeps_collection(chroma_dir):
+    store = VectorStore(lexical=False)
+    store.add_documents(DOCS)
+    collection_id = store.collection.id
+    assert VectorStore(lexical=False).collection.id == collection_id
+
+
+@pytest.mark.parametrize("new_in_place", [False, True])
+def test_interrupted_swap_is_recovered(chroma_dir, new_in_place):
+    store = VectorStore(lexical=False)
+    store.add_documents(DOCS)
+    # Crash after the original was renamed aside (and maybe after the copy took its name)
+    store.collection.modify(name="documents_replaced")
+    if new_in_place:
+        store.client.create_collection("documents").add(
+            ids=["new"], documents=["rebuilt"], embeddings=[[0.0] * 384]
+        )
+
+    store = VectorStore(lexical=False)
+    assert store.count() == (1 if new_in_place else len(DOCS))
+    with pytest.raises(ValueError):
+        store.client.get_collection("documents_replaced")
+
+
+@pytest.fixture
+def reduced(monkeypatch):
+    """Store 8-dim PCA-projected vectors once a collection holds 30."""
+    monkeypatch.setattr(vector_store, "EMBED_REDUCED_DIM", 8)
+    monkeypatch.setattr(vector_store, "PCA_FIT_SAMPLES", 30)
+
+
+def test_projection_fitted_once_enough_vectors(chroma_dir, reduced):
+    store = VectorStore(lexical=False)
+    store.add_documents(DOCS[:10])
+    assert store.projection is None
+    assert store._stored_dim() == 384
+
+    store.add_documents(DOCS[10:])
+    assert store.projection is not None and store.projection.dim == 8
+    assert store._stored_dim() == 8
+    assert store.collection.metadata["projection"] == store.projection.fingerprint()
+    assert store.search("topic3 word13", k=1)[0]["id"] == "doc13"
+
+    reopened = VectorStore(lexical=False)
+    assert reopened.projection.fingerprint() == store.projection.fingerprint()
+
+
+def test_changed_dim_needs_explicit_reproject(chroma_dir, reduced, monkeypatch):
+    VectorStore(lexical=False).add_documents(DOCS)
+
+    monkeypatch.setattr(vector_store, "EMBED_REDUCED_DIM", 16)
+    store = VectorStore(lexical=False)
+    assert store.projection.dim == 8 and store._stored_dim() == 8
+
+    store.reproject(16)
+    assert store.projection.dim == 16 and store._stored_dim() == 16
+    assert store.search("topic3 word13", k=1)[0]["id"] == "doc13"
+
+
+def test_interrupted_reproject_keeps_new_projection(chroma_dir, reduced, monkeypatch):
+    store = VectorStore(lexical=False)
+    store.add_documents(DOCS[:10])
+
+    def crash(projection):
+        raise RuntimeError("crash before the projection is saved")
+
+    monkeypatch.setattr(store.saved_projection, "set", crash)
+    with pytest.raises(RuntimeError):
+        store.reproject(8)
+
+    store = VectorStore(lexical=False)
+    assert store.projection is not None and store.projection.dim == 8
+    assert store._stored_dim() == 8
+    assert store.search("topic3 word3", k=1)[0]["id"] == "doc3"